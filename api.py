@@ -1,25 +1,140 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Header
 from fastapi.middleware.cors import CORSMiddleware
-from main import FileConverter, TableWrite
+from fastapi.responses import StreamingResponse, FileResponse, PlainTextResponse
+from main import FileConverter, CsvRead, get_file_extension, SCHEMA_CACHE, get_parquet_options, TableWrite, TableCatalog, get_table_names, compact_table, get_table_partition_schema, get_table_version, table_exists, TABLES_DIR, DEFAULT_TARGET_FILE_SIZE
+from main import get_table_history, rollback_table, vacuum_table, VERSION_RETENTION_SECONDS, PeakMemory, StaleVersionError
+from query_cache import QueryCache
+from conversion_cache import ConversionCache, make_cache_key, place_cached_output
+from jobs import JobQueue, QueueFullError
+from metrics import METRICS, BYTES, PEAK_MEMORY_BYTES, ROWS, time_operation, time_stage
+from events import EventBuffer
 from pathlib import Path
 import polars as pl
-from pydantic import BaseModel
-from typing import Annotated
+import pyarrow as pa
+from pydantic import BaseModel, Field
+from typing import Annotated, Iterator
+from datetime import datetime
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import base64
+import functools
+import hashlib
+import io
+import itertools
+import json
+import logging
+import os
+import shutil
+import uuid
+
+# Set to a number of seconds to compact every table on that interval. 0 turns scheduled compaction off.
+COMPACTION_INTERVAL_SECONDS = float(os.environ.get("COMPACTION_INTERVAL_SECONDS", "0"))
+
+QUERY_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+# Rows per batch when streaming query results.
+QUERY_BATCH_ROWS = 10_000
+QUERY_CACHE_MAX_MB = float(os.environ.get("QUERY_CACHE_MAX_MB", "256"))
+# Disk space for converted files kept to answer repeat uploads of the same file.
+CONVERSION_CACHE_MAX_MB = float(os.environ.get("CONVERSION_CACHE_MAX_MB", "1024"))
+
+# Uploads are copied to disk this many bytes at a time, so a request never holds a whole file in memory.
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Conversions and table writes are CPU-bound, so they run on this many worker threads instead of the event loop.
+CONVERT_WORKERS = int(os.environ.get("CONVERT_WORKERS", os.cpu_count() or 4))
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# Background jobs beyond this many queued or running are rejected with 429 until the queue drains.
+JOB_QUEUE_CAPACITY = int(os.environ.get("JOB_QUEUE_CAPACITY", "100"))
+# Finished jobs, and their state files, are removed once they're this old.
+JOB_RETENTION_HOURS = float(os.environ.get("JOB_RETENTION_HOURS", "168"))
+
+EVENT_FLUSH_SIZE = int(os.environ.get("EVENT_FLUSH_SIZE", "1000"))
+EVENT_FLUSH_INTERVAL_SECONDS = float(os.environ.get("EVENT_FLUSH_INTERVAL_SECONDS", "1"))
+EVENT_ROLL_INTERVAL_SECONDS = float(os.environ.get("EVENT_ROLL_INTERVAL_SECONDS", "300"))
+
+# Replaced with a fresh pool each time the app starts, since the last run's pool is shut down when it stops.
+convert_pool = ThreadPoolExecutor(max_workers=CONVERT_WORKERS, thread_name_prefix="convert")
+query_cache = QueryCache(max_bytes=int(QUERY_CACHE_MAX_MB * 1024 * 1024))
+conversion_cache = ConversionCache(Path("conversion_cache"), max_bytes=int(CONVERSION_CACHE_MAX_MB * 1024 * 1024))
+catalog = TableCatalog()
+event_buffer = EventBuffer(Path("events"), flush_size=EVENT_FLUSH_SIZE, flush_interval=EVENT_FLUSH_INTERVAL_SECONDS, roll_interval=EVENT_ROLL_INTERVAL_SECONDS)
+catalog.register("events", event_buffer.get_scan)
+# Jobs left over from an earlier run are only picked up when the app starts, not when this module is imported.
+job_queue = JobQueue(Path("jobs"), max_workers=JOB_WORKERS, max_pending=JOB_QUEUE_CAPACITY, retention_seconds=JOB_RETENTION_HOURS * 60 * 60)
+CACHE_STATS = METRICS.gauge("cache_stats", "Hit, miss, eviction and size counters of the query and conversion caches.", ["cache", "stat"])
 
 class UploadRequest(BaseModel):
     output_format: str
     output_dir: str | None = None
 
 class QueryRequest(BaseModel):
-    table_name: str
+    table_name: str | None = None
     sql: str
+    explain: bool = False
+    format: str | None = None
+    limit: int | None = Field(default=None, ge=1)
+    cursor: str | None = None
+    profile: bool = False
+    # Query table_name as of one of its past versions, or every table as of a point in time.
+    version: int | None = Field(default=None, ge=0)
+    timestamp: datetime | None = None
 
 class EventRequest(BaseModel):
     event: str
     timestamp: str
     metadata: dict
 
-app = FastAPI()
+class RollbackRequest(BaseModel):
+    version: int
+
+class VacuumRequest(BaseModel):
+    retention_hours: float | None = Field(default=None, ge=0)
+
+class CompactRequest(BaseModel):
+    target_file_size_mb: float | None = None
+    sort_by: list[str] | None = None
+    parquet_profile: str | None = None
+
+async def compact_all_tables() -> None:
+    """Compacts and vacuums every table, logging failures so one bad table doesn't stop the others."""
+    for table_name in get_table_names():
+        try:
+            await asyncio.to_thread(compact_table, table_name)
+            await asyncio.to_thread(vacuum_table, table_name)
+        except Exception as e:
+            logging.error(f"Scheduled compaction of table {table_name} failed: {e}")
+
+async def run_compaction_schedule(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        await compact_all_tables()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global convert_pool
+    convert_pool = ThreadPoolExecutor(max_workers=CONVERT_WORKERS, thread_name_prefix="convert")
+    job_queue.start()
+    compaction_task = None
+    if COMPACTION_INTERVAL_SECONDS > 0:
+        compaction_task = asyncio.create_task(run_compaction_schedule(COMPACTION_INTERVAL_SECONDS))
+    event_task = asyncio.create_task(event_buffer.run())
+    yield
+    if compaction_task is not None:
+        compaction_task.cancel()
+    event_task.cancel()
+    try:
+        await event_task
+    except asyncio.CancelledError:
+        pass
+    convert_pool.shutdown(wait=False)
+    job_queue.shutdown(wait=False)
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,38 +142,298 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-READERS = {
-        ".parquet": pl.read_parquet,
-        ".csv": pl.read_csv,
-    }
+async def save_upload(file: UploadFile, content_hash=None) -> Path:
+    """Streams an upload to disk in UPLOAD_CHUNK_SIZE pieces.
+
+    Each upload gets its own directory under uploads/, so concurrent uploads of files with the same name don't
+    overwrite each other, and the file keeps its name so outputs are still named after it.
+
+    Args:
+        file (UploadFile): The uploaded file.
+        content_hash: A hashlib hash to feed the upload's bytes to as they're written, so hashing needs no second read.
+    Returns:
+        Path: Where the upload was saved.
+    """
+    upload_dir = Path("uploads") / uuid.uuid4().hex
+    upload_dir.mkdir(parents=True)
+    temp_path = upload_dir / Path(file.filename).name
+    with temp_path.open("wb") as f:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            f.write(chunk)
+            if content_hash is not None:
+                content_hash.update(chunk)
+    return temp_path
+
+def remove_upload(temp_path: Path) -> None:
+    shutil.rmtree(temp_path.parent, ignore_errors=True)
+
+async def run_in_convert_pool(func, *args, **kwargs):
+    """Runs blocking work on the conversion pool so the event loop keeps serving other requests."""
+    return await asyncio.get_running_loop().run_in_executor(convert_pool, functools.partial(func, *args, **kwargs))
+
+def get_parquet_profile(parquet_profile: str | None, parquet_options: str | None) -> str | dict | None:
+    """Combines the parquet_profile and parquet_options form fields.
+
+    parquet_options is a JSON object of write options, such as {"compression": "zstd", "compression_level": 5},
+    applied on top of the named profile. Either field alone is enough.
+    """
+    if not parquet_options:
+        return parquet_profile or None
+    try:
+        options = json.loads(parquet_options)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"parquet_options must be a JSON object: {e}")
+    if not isinstance(options, dict):
+        raise ValueError("parquet_options must be a JSON object.")
+    return {**get_parquet_options(parquet_profile or None), **options}
+
+def convert_upload(temp_path: Path, output_format: str, output_dir: str | None, streaming: bool, schema_key: str | None = None, parquet_profile: str | dict | None = None,
+    cache_key: str | None = None, stage_seconds: dict | None = None) -> dict:
+    converter = FileConverter(input_path=temp_path, output_extension=output_format, output_dir=output_dir, schema_key=schema_key, parquet_profile=parquet_profile)
+    file_path = converter.convert(streaming=streaming)
+    if cache_key is not None and file_path is not None:
+        conversion_cache.put(cache_key, file_path)
+    response = {"file_path": str(file_path), "peak_memory_bytes": converter.peak_memory_bytes, "cached": False}
+    if stage_seconds is not None:
+        response["profile"] = {"stages": {**stage_seconds, **converter.stage_seconds}}
+    return response
 
 @app.post("/convertfile/")
 async def upload_file(file: UploadFile = File(...),
     output_format: str = Form(...),
-    output_dir: str | None = Form(None)):
+    output_dir: str | None = Form(None),
+    streaming: bool = Form(False),
+    schema_key: str | None = Form(None),
+    parquet_profile: str | None = Form(None),
+    parquet_options: str | None = Form(None),
+    profile: bool = Form(False)):
+    """Converts an upload. A file that was already converted the same way is answered from the conversion cache.
+
+    With profile set, the response also has the seconds spent in each stage: upload, read and write.
+    """
+    temp_path = None
+    stage_seconds = {} if profile else None
     try:
-        temp_path = Path("uploads") / file.filename
-        temp_path.parent.mkdir(parents=True, exist_ok=True)
-        with temp_path.open("wb") as f:
-            f.write(await file.read())
-        converter = FileConverter(input_path=temp_path, output_extension=output_format, output_dir=output_dir)
-        file_path = converter.convert()
-        temp_path.unlink()
-        return {"file_path": str(file_path)}
+        write_profile = get_parquet_profile(parquet_profile, parquet_options)
+        content_hash = hashlib.sha256()
+        with time_stage("convert", "upload", stage_seconds):
+            temp_path = await save_upload(file, content_hash)
+        cache_key = make_cache_key(content_hash.hexdigest(), get_file_extension(temp_path), output_format, {"schema_key": schema_key or None, "parquet_profile": write_profile})
+        cached_path = conversion_cache.get(cache_key)
+        if cached_path is not None:
+            file_path = await asyncio.to_thread(place_cached_output, cached_path, Path(output_dir or "data"))
+            response = {"file_path": str(file_path), "peak_memory_bytes": None, "cached": True}
+            if stage_seconds is not None:
+                response["profile"] = {"stages": stage_seconds}
+            return response
+        return await run_in_convert_pool(convert_upload, temp_path, output_format, output_dir, streaming, schema_key or None, write_profile, cache_key, stage_seconds)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if temp_path is not None:
+            remove_upload(temp_path)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...),
+    output_format: str = Form(...),
+    output_dir: str | None = Form(None),
+    streaming: bool = Form(False)):
+    """Queues a conversion and returns its job id without waiting for it to run."""
+    temp_path = None
+    try:
+        temp_path = await save_upload(file)
+        job = job_queue.submit(temp_path, output_format, output_dir=output_dir, streaming=streaming, remove_when_done=temp_path.parent)
+        return {"job_id": job["job_id"], "status": job["status"]}
+    except QueueFullError as e:
+        remove_upload(temp_path)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    except Exception as e:
+        if temp_path is not None:
+            remove_upload(temp_path)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['status']}.")
+    if job["output_path"] is None or not Path(job["output_path"]).exists():
+        raise HTTPException(status_code=404, detail="The job produced no output file.")
+    output_path = Path(job["output_path"])
+    return FileResponse(path=output_path, filename=output_path.name, media_type="application/octet-stream")
+
+def get_query_format(request: QueryRequest, accept: str | None) -> str:
+    """Picks the response format from the request's format field, falling back to the Accept header."""
+    if request.format is not None:
+        if request.format not in QUERY_FORMATS:
+            raise ValueError(f"Unsupported query format: {request.format}. Must be one of {list(QUERY_FORMATS)}.")
+        return request.format
+    for query_format, media_type in QUERY_FORMATS.items():
+        if accept and media_type in accept:
+            return query_format
+    return "json"
+
+def make_cursor(offset: int, table_versions: dict[str, str]) -> str:
+    """Builds an opaque pagination cursor from the offset of the next page and the table versions the query read."""
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset, "versions": table_versions}).encode()).decode()
+
+def read_cursor(cursor: str | None) -> tuple[int, dict[str, str] | None]:
+    """Turns a pagination cursor back into the row offset and table versions it stands for."""
+    if cursor is None:
+        return 0, None
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        offset, table_versions = state["offset"], state["versions"]
+    except (ValueError, TypeError, KeyError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(offset, int) or offset < 0 or not isinstance(table_versions, dict):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return offset, table_versions
+
+def stream_ndjson(batches: Iterator[pl.DataFrame]) -> Iterator[bytes]:
+    for batch in batches:
+        ROWS.inc(batch.height, operation="query", direction="out")
+        yield batch.write_ndjson().encode()
+
+def stream_arrow(batches: Iterator[pl.DataFrame], schema: pl.Schema) -> Iterator[bytes]:
+    """Writes batches as one Arrow IPC stream, yielding the bytes of each message as soon as it's written."""
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, pl.DataFrame(schema=schema).to_arrow().schema) as writer:
+        for batch in batches:
+            ROWS.inc(batch.height, operation="query", direction="out")
+            writer.write_table(batch.to_arrow())
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+def record_stream(content: Iterator[bytes]) -> Iterator[bytes]:
+    """Records the bytes of a streamed query result, and the peak memory while it's produced, as it's sent."""
+    memory = PeakMemory()
+    try:
+        with memory:
+            for chunk in content:
+                BYTES.inc(len(chunk), operation="query", direction="out")
+                yield chunk
+    finally:
+        if memory.peak_bytes is not None:
+            PEAK_MEMORY_BYTES.observe(memory.peak_bytes, operation="query")
+
+def collect_query(query: pl.LazyFrame, profile: bool, stage_seconds: dict) -> tuple[pl.DataFrame, pl.DataFrame | None]:
+    """Runs a query, with polars' per-node timings when profiling."""
+    memory = PeakMemory()
+    try:
+        with time_stage("query", "execute", stage_seconds), memory:
+            if profile:
+                return query.profile()
+            return query.collect(), None
+    finally:
+        if memory.peak_bytes is not None:
+            PEAK_MEMORY_BYTES.observe(memory.peak_bytes, operation="query")
+
+def query_response(df: pl.DataFrame, next_cursor: str | None, stage_seconds: dict, nodes: pl.DataFrame | None) -> dict:
+    """Builds the JSON body for a query result, with the profile when there is one."""
+    with time_stage("query", "serialize", stage_seconds):
+        result = df.to_dicts()
+    ROWS.inc(df.height, operation="query", direction="out")
+    # The body is encoded by FastAPI after this returns, so the result's size in memory stands in for its bytes.
+    BYTES.inc(df.estimated_size(), operation="query", direction="out")
+    response = {"result": result, "next_cursor": next_cursor}
+    if nodes is not None:
+        response["profile"] = {"stages": stage_seconds, "nodes": nodes.to_dicts()}
+    return response
 
 @app.post("/query")
-async def query_file(request: QueryRequest):
+async def query_file(request: QueryRequest, accept: str | None = Header(None)):
+    """Runs SQL against the tables in the catalog.
+
+    Any table can be referred to by name, so one query can join or union several tables. If table_name is given,
+    that table can also be referred to as "self".
+
+    Results come back as a JSON body by default. Asking for "ndjson" or "arrow", through the format field or the
+    Accept header, streams the result in batches as the query produces them instead. With a limit, only one page is
+    returned along with a cursor for the next page: in the JSON body as next_cursor, or in the X-Next-Cursor header
+    when streaming. A streamed page shorter than the limit is the last one. Later pages read every table at the
+    version the first page read, so writes in between don't skip or repeat rows. If a table can't be read at that
+    version any more, because it was vacuumed or the table has no history, the cursor is stale and gets a 409.
+
+    Full JSON results are cached per table version, and any later request for the same SQL, in any format or page,
+    is served from the cache until one of its tables changes.
+
+    A version reads table_name as it was at that version, and a timestamp reads every table as it was at that time.
+
+    With profile set, a JSON response also has the seconds spent planning, executing and serializing the query, and
+    the time polars spent in each node of the query plan.
+    """
     try:
-        file_path = f"tables/{request.table_name}.parquet"
-        reader_function = READERS.get(".parquet")
-        df = reader_function(file_path).lazy().sql(request.sql).collect()
-        return {"result": df.to_dicts()}
+        with time_operation("query"):
+            query_format = get_query_format(request, accept)
+            if request.profile and query_format != "json":
+                raise ValueError("Profiling is only available for JSON results.")
+            offset, pinned_versions = read_cursor(request.cursor)
+            stage_seconds = {}
+            # The tables are scanned lazily, so polars pushes the SQL's column selection and filters down into the
+            # Parquet reader, which skips unneeded columns and row groups whose statistics rule them out. Later pages
+            # read the tables at the versions the first page read, so writes in between don't shift the rows.
+            with time_stage("query", "plan", stage_seconds):
+                query, table_versions = await run_in_convert_pool(catalog.query, request.sql, self_table=request.table_name or None, version=request.version,
+                                                                  timestamp=request.timestamp.timestamp() if request.timestamp is not None else None,
+                                                                  pinned_versions=pinned_versions)
+            cached_result = None if request.explain else query_cache.get(request.sql, table_versions)
+            if cached_result is not None:
+                query = cached_result.lazy()
+            if request.explain:
+                return {"plan": query.explain()}
+            if cached_result is None and query_format == "json" and request.limit is None:
+                df, nodes = await run_in_convert_pool(collect_query, query, request.profile, stage_seconds)
+                query_cache.put(request.sql, table_versions, df)
+                return query_response(df, None, stage_seconds, nodes if request.profile else None)
+            next_cursor = None
+            if request.limit is not None:
+                next_cursor = make_cursor(offset + request.limit, pinned_versions if pinned_versions is not None else table_versions)
+                if query_format == "json":
+                    # Fetch one extra row to find out whether there's another page.
+                    query = query.slice(offset, request.limit + 1)
+                else:
+                    query = query.slice(offset, request.limit)
+            if query_format == "json":
+                df, nodes = await run_in_convert_pool(collect_query, query, request.profile, stage_seconds)
+                if request.limit is not None:
+                    if df.height <= request.limit:
+                        next_cursor = None
+                    df = df.head(request.limit)
+                return query_response(df, next_cursor, stage_seconds, nodes if request.profile else None)
+
+            # Streamed results are produced after this returns, so their time here only covers the first batch.
+            batches = query.collect_batches(chunk_size=QUERY_BATCH_ROWS)
+            # Pull the first batch now so errors become a proper HTTP error rather than a broken stream.
+            with time_stage("query", "execute"):
+                first_batch = await run_in_convert_pool(next, batches, None)
+            batches = itertools.chain([first_batch] if first_batch is not None else [], batches)
+            headers = {"X-Next-Cursor": next_cursor} if next_cursor is not None else None
+            if query_format == "ndjson":
+                content = stream_ndjson(batches)
+            else:
+                content = stream_arrow(batches, query.collect_schema())
+            return StreamingResponse(record_stream(content), media_type=QUERY_FORMATS[query_format], headers=headers)
+    except StaleVersionError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -66,41 +441,182 @@ async def query_file(request: QueryRequest):
 
 @app.post("/event")
 async def log_event(request: EventRequest):
-    with open("events/events.jsonl", "a") as f:
-        print(f"Logging event: {request.event} at {request.timestamp} with metadata: {request.metadata}")
-        f.write(f"{request.json()}\n")
+    event_buffer.add(request.model_dump())
+
+@app.post("/events")
+async def log_events(requests: list[EventRequest]):
+    event_buffer.add_many([request.model_dump() for request in requests])
+    return {"accepted": len(requests)}
+
+# Write modes that leave a table the same however many times they're repeated.
+IDEMPOTENT_WRITE_MODES = ["overwrite", "overwrite_partitions", "merge"]
+
+def split_columns(columns: str | None) -> list[str] | None:
+    """Splits a comma-separated form field into column names."""
+    if columns is None:
+        return None
+    return [column.strip() for column in columns.split(",") if column.strip()]
+
+def write_upload_to_table(temp_path: Path, table_name: str, write_mode: str, parquet_profile: str | dict | None = None, partition_by: list[str] | None = None,
+    merge_keys: list[str] | None = None) -> Path | None:
+    file_extension = get_file_extension(temp_path)
+    if file_extension not in FileConverter.FORMATS:
+        raise ValueError(f"Unsupported file format: {file_extension}")
+    # Made before reading so a bad table name or write mode is rejected without reading the upload.
+    writer = TableWrite(table_name, write_mode, parquet_profile=parquet_profile, partition_by=partition_by, merge_keys=merge_keys)
+    reader_class = FileConverter.FORMATS[file_extension][0]
+    reader = reader_class()
+    if reader_class is CsvRead:
+        # CSV appends reuse the schema from the table's earlier loads so column types don't drift between parts.
+        # An overwrite replaces the table, so its schema is inferred afresh.
+        schema_key = f"table-{table_name}"
+        if write_mode == "overwrite":
+            SCHEMA_CACHE.clear(schema_key)
+        reader = CsvRead(schema_key=schema_key)
+    df = reader.read(temp_path)
+    return writer.write(df)
 
 @app.post("/savetable")
-async def save_table(file: UploadFile = File(...), table_name: str = Form(...), write_mode: str = Form(...)):
+async def save_table(file: UploadFile = File(...), table_name: str = Form(...), write_mode: str = Form(...),
+    parquet_profile: str | None = Form(None),
+    parquet_options: str | None = Form(None),
+    partition_by: str | None = Form(None),
+    merge_keys: str | None = Form(None)):
+    """Writes an upload to a table.
+
+    partition_by is a comma-separated list of columns to partition the table by, and merge_keys the comma-separated
+    key columns for write_mode "merge". Repeating an overwrite or merge of the same file, with nothing written to the
+    table in between, is skipped because it wouldn't change the table.
+    """
+    temp_path = None
     try:
-        temp_path = Path("uploads") / file.filename
-        temp_path.parent.mkdir(parents=True, exist_ok=True)
-        with temp_path.open("wb") as f:
-            f.write(await file.read())
-        file_extension = temp_path.suffix
-        if file_extension not in READERS:
-            raise ValueError(f"Unsupported file format: {file_extension}")
-        reader_function = READERS.get(file_extension)
-        df = reader_function(temp_path)
-        writer = TableWrite(table_name, write_mode)
-        destination = writer.write(df)
-        temp_path.unlink()
-        return {"destination": str(destination)}
+        profile = get_parquet_profile(parquet_profile, parquet_options)
+        partition_columns = split_columns(partition_by)
+        content_hash = hashlib.sha256()
+        temp_path = await save_upload(file, content_hash)
+        cache_key = make_cache_key(content_hash.hexdigest(), get_file_extension(temp_path), f"table:{table_name}",
+                                   {"write_mode": write_mode, "parquet_profile": profile, "partition_by": partition_columns, "merge_keys": split_columns(merge_keys)})
+        idempotent = write_mode in IDEMPOTENT_WRITE_MODES
+        if idempotent and table_exists(table_name) and conversion_cache.is_repeated_table_write(table_name, cache_key, get_table_version(table_name)):
+            return {"destination": str(TABLES_DIR / table_name), "cached": True}
+        destination = await run_in_convert_pool(write_upload_to_table, temp_path, table_name, write_mode, profile, partition_columns, split_columns(merge_keys))
+        query_cache.invalidate(table_name)
+        if idempotent and destination is not None:
+            conversion_cache.record_table_write(table_name, cache_key, get_table_version(table_name))
+        return {"destination": str(destination), "cached": False}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if temp_path is not None:
+            remove_upload(temp_path)
 
 @app.get("/tables")
-async def list_tables():
-    tables_dir = Path("tables")
-    if not tables_dir.exists():
-        return {"tables": []}
-    table_files = list(tables_dir.glob("*.parquet"))
-    table_names = [file.stem for file in table_files]
-    return {"tables": table_names}
-
-from fastapi.responses import FileResponse
+async def list_tables(schema: bool = False, stats: bool = False):
+    """Lists the tables, optionally with their schemas or their footer statistics.
+
+    Statistics are only read from the Parquet footers of tables that changed since they were last asked for, so
+    listing them stays fast with many large tables.
+    """
+    response = {"tables": catalog.get_names()}
+    if schema:
+        schemas = catalog.describe()
+        partitions = {table: list(get_table_partition_schema(table)) for table in schemas}
+        response = {"tables": list(schemas), "schemas": schemas, "partitions": {table: columns for table, columns in partitions.items() if columns}}
+    if stats:
+        try:
+            response["stats"] = await asyncio.to_thread(lambda: {table: catalog.get_stats(table) for table in get_table_names()})
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return response
+
+@app.get("/tables/{table_name}")
+async def get_table(table_name: str):
+    """Returns a table's schema, row count, size, row groups and per-column min, max and null counts."""
+    if not table_exists(table_name):
+        raise HTTPException(status_code=404, detail=f"Table not found: {table_name}")
+    try:
+        return await asyncio.to_thread(catalog.get_stats, table_name)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/query/cache")
+async def get_query_cache_stats():
+    return query_cache.stats()
+
+@app.get("/conversions/cache")
+async def get_conversion_cache_stats():
+    return conversion_cache.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Returns the service's metrics in the Prometheus text format, for scraping."""
+    for cache_name, stats in [("query", query_cache.stats()), ("conversion", conversion_cache.stats())]:
+        for stat, value in stats.items():
+            CACHE_STATS.set(value, cache=cache_name, stat=stat)
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/tables/{table_name}/compact")
+async def compact(table_name: str, request: CompactRequest | None = None):
+    request = request or CompactRequest()
+    target_file_size = DEFAULT_TARGET_FILE_SIZE
+    if request.target_file_size_mb is not None:
+        target_file_size = int(request.target_file_size_mb * 1024 * 1024)
+    try:
+        return await asyncio.to_thread(compact_table, table_name, target_file_size, request.sort_by, request.parquet_profile)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/tables/{table_name}/history")
+async def get_history(table_name: str):
+    """Lists the versions of a table that can still be queried or rolled back to, newest first."""
+    try:
+        return {"table": table_name, "versions": await asyncio.to_thread(get_table_history, table_name)}
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/tables/{table_name}/rollback")
+async def rollback(table_name: str, request: RollbackRequest):
+    """Makes a past version of a table the latest one again, without copying any data."""
+    if not table_exists(table_name):
+        raise HTTPException(status_code=404, detail=f"Table not found: {table_name}")
+    try:
+        manifest = await asyncio.to_thread(rollback_table, table_name, request.version)
+        query_cache.invalidate(table_name)
+        return {"table": table_name, "version": manifest["version"], "restored_version": request.version}
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/tables/{table_name}/vacuum")
+async def vacuum(table_name: str, request: VacuumRequest | None = None):
+    """Deletes the versions of a table past their retention and the part files no remaining version uses."""
+    if not table_exists(table_name):
+        raise HTTPException(status_code=404, detail=f"Table not found: {table_name}")
+    request = request or VacuumRequest()
+    retention_seconds = VERSION_RETENTION_SECONDS if request.retention_hours is None else request.retention_hours * 60 * 60
+    try:
+        return await asyncio.to_thread(vacuum_table, table_name, retention_seconds)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/download/{file_path:path}")
 async def download_file(file_path: str):
@@ -0,0 +1,63 @@
+"""Deterministic synthetic tables for the benchmarks.
+
+Every dataset has an integer "id" column so the same queries run against all of them. The values are derived from
+the row number with cheap hashing expressions, so a dataset is identical on every run and machine.
+"""
+from typing import Callable, Dict
+
+import polars as pl
+
+SIZES = {"small": 10_000, "medium": 1_000_000, "large": 10_000_000}
+
+def _pseudo_random(seed: int, modulus: int) -> pl.Expr:
+    """A repeatable, well spread integer in [0, modulus) for every row."""
+    return (pl.int_range(pl.len(), dtype=pl.UInt64) * 2654435761 + seed * 40503) % 4294967291 % modulus
+
+def _frame(rows: int, columns: Dict[str, pl.Expr]) -> pl.DataFrame:
+    return pl.select(pl.int_range(rows, dtype=pl.Int64).alias("id")).with_columns(**columns)
+
+def narrow(rows: int) -> pl.DataFrame:
+    """A few columns, like an event stream."""
+    return _frame(rows, {
+        "value": _pseudo_random(1, 1_000_000).cast(pl.Float64) / 100,
+        "category": pl.format("c{}", _pseudo_random(2, 20)),
+    })
+
+def wide(rows: int) -> pl.DataFrame:
+    """A hundred mixed numeric columns, like a feature table.
+
+    It has a tenth of the rows asked for, so each size takes about as many bytes as the other datasets.
+    """
+    rows = max(rows // 10, 1)
+    columns = {}
+    for i in range(100):
+        column = _pseudo_random(i, 10_000)
+        columns[f"col_{i}"] = column.cast(pl.Float64) / 7 if i % 2 else column.cast(pl.Int64)
+    return _frame(rows, columns)
+
+def strings(rows: int) -> pl.DataFrame:
+    """Mostly text of varying length and cardinality, the slowest thing to parse and write."""
+    return _frame(rows, {
+        "country": pl.format("country_{}", _pseudo_random(1, 200)),
+        "user_agent": pl.format("Mozilla/5.0 (build {}; rv:{}) Gecko/{}", _pseudo_random(2, 5000), _pseudo_random(3, 120), _pseudo_random(4, 99999)),
+        "email": pl.format("user{}@example{}.com", _pseudo_random(5, 10_000_000), _pseudo_random(6, 50)),
+        "status": pl.format("status_{}", _pseudo_random(7, 5)),
+        "comment": pl.format("{} {} {}", pl.lit("lorem ipsum dolor sit amet"), _pseudo_random(8, 1_000_000), pl.lit("consectetur adipiscing")),
+    })
+
+def numeric(rows: int) -> pl.DataFrame:
+    """Integers, floats, booleans and dates, all cheap to encode."""
+    return _frame(rows, {
+        "small_int": _pseudo_random(1, 100).cast(pl.Int32),
+        "big_int": _pseudo_random(2, 4294967291).cast(pl.Int64),
+        "price": _pseudo_random(3, 100_000).cast(pl.Float64) / 100,
+        "ratio": _pseudo_random(4, 1_000_000).cast(pl.Float32) / 1_000_000,
+        "flag": _pseudo_random(5, 2) == 1,
+        "day": pl.date(2026, 1, 1) + pl.duration(days=_pseudo_random(6, 365)),
+    })
+
+DATASETS: Dict[str, Callable[[int], pl.DataFrame]] = {"narrow": narrow, "wide": wide, "strings": strings, "numeric": numeric}
+
+def make_dataset(name: str, size: str) -> pl.DataFrame:
+    """Builds a dataset by name at one of the SIZES."""
+    return DATASETS[name](SIZES[size])
@@ -0,0 +1,55 @@
+"""Compares the Parquet write profiles on file size, write throughput and scan speed.
+
+Run from the repository root:
+
+    python benchmarks/parquet_profiles.py --rows 2000000
+"""
+from pathlib import Path
+import argparse
+import sys
+import tempfile
+import time
+
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from main import PARQUET_PROFILES, ParquetWrite
+
+def make_data(rows: int) -> pl.DataFrame:
+    """Builds a frame with the mix of columns our tables usually hold: ids, timestamps, low-cardinality strings and floats."""
+    return pl.DataFrame({
+        "id": pl.int_range(rows, eager=True),
+        "timestamp": pl.datetime_range(pl.datetime(2026, 1, 1), pl.datetime(2026, 1, 1) + pl.duration(seconds=rows - 1), "1s", eager=True),
+        "event": pl.Series(["click", "view", "scroll", "purchase"]).sample(rows, with_replacement=True, seed=0),
+        "value": pl.Series(range(rows), dtype=pl.Float64) * 0.37 % 100,
+    })
+
+def run(rows: int, repeat: int) -> None:
+    data = make_data(rows)
+    in_memory_mb = data.estimated_size() / 1024 / 1024
+    print(f"{rows} rows, {in_memory_mb:.1f} MB in memory")
+    print(f"{'profile':<12} {'size MB':>8} {'write MB/s':>11} {'scan s':>8} {'filtered scan s':>16}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for profile in PARQUET_PROFILES:
+            writer = ParquetWrite(input_filename=profile, output_dir=Path(temp_dir) / profile, profile=profile)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                path = writer.write(data)
+            write_seconds = (time.perf_counter() - start) / repeat
+            start = time.perf_counter()
+            for _ in range(repeat):
+                pl.scan_parquet(path).select(pl.col("value").sum()).collect()
+            scan_seconds = (time.perf_counter() - start) / repeat
+            start = time.perf_counter()
+            for _ in range(repeat):
+                pl.scan_parquet(path).filter(pl.col("id") < rows // 100).collect()
+            filtered_seconds = (time.perf_counter() - start) / repeat
+            size_mb = path.stat().st_size / 1024 / 1024
+            print(f"{profile:<12} {size_mb:>8.2f} {in_memory_mb / write_seconds:>11.1f} {scan_seconds:>8.3f} {filtered_seconds:>16.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
@@ -0,0 +1,255 @@
+"""Benchmarks file conversion, table writes and the query endpoint, and compares runs.
+
+Each case runs in a fresh process inside its own temporary directory, so peak RSS isn't inflated by earlier cases
+and nothing is written to the repository. Results are written as JSON so two runs can be compared:
+
+    python benchmarks/run.py run --sizes small medium --output before.json
+    python benchmarks/run.py run --sizes small medium --output after.json
+    python benchmarks/run.py compare before.json after.json
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import polars as pl
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+from datasets import DATASETS, SIZES, make_dataset
+from main import FileConverter, PeakMemory, TableWrite, batch_convert, read_table
+
+APPEND_BATCHES = 50
+BATCH_FILES = 8
+QUERY_CONCURRENCY = 8
+QUERY_REQUESTS = 200
+
+def percentile(values: List[float], percent: float) -> float:
+    """Returns the nearest-rank percentile of some values."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def summarize(latencies: List[float], total_seconds: float, rows: int, data_bytes: int, memory: PeakMemory, **extra) -> Dict[str, Any]:
+    """Turns the timings of one case into the reported metrics.
+
+    Args:
+        latencies (List[float]): Seconds taken by each operation.
+        total_seconds (float): Wall time for all the operations, which is less than their sum when they overlap.
+        rows (int): Rows processed by all the operations together.
+        data_bytes (int): Bytes processed by all the operations together.
+        memory (PeakMemory): The memory sampled while the operations ran.
+    """
+    return {
+        "operations": len(latencies),
+        "seconds": total_seconds,
+        "rows_per_s": rows / total_seconds,
+        "mb_per_s": data_bytes / 1024 / 1024 / total_seconds,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "peak_rss_bytes": memory.peak_bytes,
+        **extra,
+    }
+
+def bench_convert(data: pl.DataFrame, repeat: int, source: str, target: str, streaming: bool) -> Dict[str, Any]:
+    source_path = Path(f"source{source}")
+    if source == ".csv":
+        data.write_csv(source_path)
+    else:
+        data.write_parquet(source_path)
+    del data
+    latencies = []
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        for i in range(repeat):
+            operation_start = time.perf_counter()
+            FileConverter(input_path=source_path, output_extension=target, output_dir=f"out{i}").convert(streaming=streaming)
+            latencies.append(time.perf_counter() - operation_start)
+        total = time.perf_counter() - start
+    rows = pl.scan_parquet(source_path).select(pl.len()).collect().item() if source == ".parquet" else pl.scan_csv(source_path).select(pl.len()).collect().item()
+    return summarize(latencies, total, rows * repeat, source_path.stat().st_size * repeat, memory)
+
+def bench_batch_convert(data: pl.DataFrame, repeat: int, max_workers: int) -> Dict[str, Any]:
+    files = []
+    for i, chunk in enumerate(data.iter_slices(max(data.height // BATCH_FILES, 1))):
+        path = Path(f"source_{i}.csv")
+        chunk.write_csv(path)
+        files.append(path)
+    data_bytes = sum(path.stat().st_size for path in files)
+    rows = data.height
+    del data
+    latencies = []
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        for i in range(repeat):
+            operation_start = time.perf_counter()
+            results = batch_convert([{"input_path": path, "output_extension": ".parquet", "output_dir": f"out{i}"} for path in files], max_workers=max_workers)
+            latencies.append(time.perf_counter() - operation_start)
+            failed = [result for result in results if not result["success"]]
+            if failed:
+                raise RuntimeError(failed[0]["error_message"])
+        total = time.perf_counter() - start
+    return summarize(latencies, total, rows * repeat, data_bytes * repeat, memory, files=len(files), max_workers=max_workers)
+
+def bench_table_append(data: pl.DataFrame, repeat: int) -> Dict[str, Any]:
+    batches = list(data.iter_slices(max(data.height // APPEND_BATCHES, 1)))
+    latencies = []
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        for i in range(repeat):
+            writer = TableWrite(table=f"bench_{i}", write_mode="append")
+            for batch in batches:
+                operation_start = time.perf_counter()
+                writer.write(batch)
+                latencies.append(time.perf_counter() - operation_start)
+        total = time.perf_counter() - start
+        scan_start = time.perf_counter()
+        read_table("bench_0")
+        scan_seconds = time.perf_counter() - scan_start
+    return summarize(latencies, total, data.height * repeat, data.estimated_size() * repeat, memory, batches=len(batches), full_scan_seconds=scan_seconds)
+
+def bench_query(data: pl.DataFrame, repeat: int, cached: bool) -> Dict[str, Any]:
+    # The API sets up its job queue, caches and event log in the working directory when it's imported.
+    import httpx
+    from api import app
+
+    TableWrite(table="bench", write_mode="overwrite").write(data)
+    rows = data.height
+    del data
+    requests = QUERY_REQUESTS * repeat
+    latencies: List[float] = []
+
+    async def worker(client: httpx.AsyncClient, worker_index: int) -> None:
+        for i in range(worker_index, requests, QUERY_CONCURRENCY):
+            # Different bounds make every query a cache miss.
+            bound = 0 if cached else i
+            sql = f"SELECT COUNT(*) AS n, MAX(id) AS max_id FROM self WHERE id >= {bound}"
+            operation_start = time.perf_counter()
+            response = await client.post("/query", json={"table_name": "bench", "sql": sql})
+            latencies.append(time.perf_counter() - operation_start)
+            response.raise_for_status()
+
+    async def run() -> None:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await asyncio.gather(*(worker(client, worker_index) for worker_index in range(QUERY_CONCURRENCY)))
+
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        asyncio.run(run())
+        total = time.perf_counter() - start
+    table_bytes = sum(path.stat().st_size for path in Path("tables/bench").glob("*.parquet"))
+    return summarize(latencies, total, rows * requests, table_bytes * requests, memory, requests=requests,
+                     requests_per_s=requests / total, concurrency=QUERY_CONCURRENCY)
+
+SUITES: Dict[str, Dict[str, Callable[..., Dict[str, Any]]]] = {
+    "convert": {
+        "csv_to_parquet": lambda data, repeat: bench_convert(data, repeat, ".csv", ".parquet", streaming=False),
+        "csv_to_parquet_streaming": lambda data, repeat: bench_convert(data, repeat, ".csv", ".parquet", streaming=True),
+        "parquet_to_csv": lambda data, repeat: bench_convert(data, repeat, ".parquet", ".csv", streaming=False),
+        "parquet_to_csv_streaming": lambda data, repeat: bench_convert(data, repeat, ".parquet", ".csv", streaming=True),
+    },
+    "batch_convert": {
+        "serial": lambda data, repeat: bench_batch_convert(data, repeat, max_workers=1),
+        "threads": lambda data, repeat: bench_batch_convert(data, repeat, max_workers=4),
+    },
+    "table_append": {
+        "append": bench_table_append,
+    },
+    "query": {
+        "uncached": lambda data, repeat: bench_query(data, repeat, cached=False),
+        "cached": lambda data, repeat: bench_query(data, repeat, cached=True),
+    },
+}
+
+def run_case(suite: str, case: str, dataset: str, size: str, repeat: int) -> Dict[str, Any]:
+    """Runs one benchmark case in a temporary working directory."""
+    with tempfile.TemporaryDirectory(prefix="bench-") as work_dir:
+        os.chdir(work_dir)
+        data = make_dataset(dataset, size)
+        result = {"suite": suite, "case": case, "dataset": dataset, "size": size, "rows": data.height, "columns": data.width, "repeat": repeat}
+        result.update(SUITES[suite][case](data, repeat))
+        os.chdir(ROOT)
+    return result
+
+def get_environment() -> Dict[str, Any]:
+    """Describes the machine and code the results came from."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "started_at": datetime.now().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "polars": pl.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def run(suites: List[str], datasets: List[str], sizes: List[str], repeat: int, output: Optional[Path], in_process: bool) -> None:
+    report = {"environment": get_environment(), "results": []}
+    context = multiprocessing.get_context("spawn")
+    for suite in suites:
+        for case in SUITES[suite]:
+            for size in sizes:
+                for dataset in datasets:
+                    if in_process:
+                        result = run_case(suite, case, dataset, size, repeat)
+                    else:
+                        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                            result = executor.submit(run_case, suite, case, dataset, size, repeat).result()
+                    report["results"].append(result)
+                    print(f"{suite:<14} {case:<26} {dataset:<8} {size:<7} {result['rows_per_s']:>14,.0f} rows/s {result['mb_per_s']:>9.1f} MB/s "
+                          f"p50 {result['p50_ms']:>9.1f} ms  p99 {result['p99_ms']:>9.1f} ms  peak {(result['peak_rss_bytes'] or 0) / 1024 / 1024:>7.0f} MB",
+                          file=sys.stderr)
+    text = json.dumps(report, indent=2)
+    if output is None:
+        print(text)
+    else:
+        output.write_text(text)
+
+def compare(baseline_path: Path, candidate_path: Path) -> None:
+    """Prints how each case's throughput, tail latency and memory changed between two runs."""
+    baseline = {(r["suite"], r["case"], r["dataset"], r["size"]): r for r in json.loads(baseline_path.read_text())["results"]}
+    candidate = json.loads(candidate_path.read_text())["results"]
+    print(f"{'case':<60} {'rows/s':>9} {'p99':>9} {'peak RSS':>9}")
+    for result in candidate:
+        key = (result["suite"], result["case"], result["dataset"], result["size"])
+        if key not in baseline:
+            continue
+        before = baseline[key]
+        throughput = result["rows_per_s"] / before["rows_per_s"] - 1
+        p99 = result["p99_ms"] / before["p99_ms"] - 1 if before["p99_ms"] else 0.0
+        memory = (result["peak_rss_bytes"] or 0) / before["peak_rss_bytes"] - 1 if before["peak_rss_bytes"] else 0.0
+        print(f"{' / '.join(key):<60} {throughput:>+9.1%} {p99:>+9.1%} {memory:>+9.1%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Run benchmarks and write the results as JSON.")
+    run_parser.add_argument("--suites", nargs="+", choices=list(SUITES), default=list(SUITES))
+    run_parser.add_argument("--datasets", nargs="+", choices=list(DATASETS), default=list(DATASETS))
+    run_parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small"])
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--output", type=Path, help="Where to write the JSON results. Defaults to stdout.")
+    run_parser.add_argument("--in-process", action="store_true", help="Run every case in this process, which is faster but shares peak RSS between cases.")
+    compare_parser = commands.add_parser("compare", help="Compare two result files.")
+    compare_parser.add_argument("baseline", type=Path)
+    compare_parser.add_argument("candidate", type=Path)
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args.suites, args.datasets, args.sizes, args.repeat, args.output, args.in_process)
+    else:
+        compare(args.baseline, args.candidate)
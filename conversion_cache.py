@@ -0,0 +1,207 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, TypedDict
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+class ConversionCacheStats(TypedDict):
+    hits: int
+    misses: int
+    hit_rate: float
+    evictions: int
+    entries: int
+    bytes: int
+    max_bytes: int
+    repeated_table_writes: int
+
+def make_cache_key(content_hash: str, input_extension: str, output_extension: str, options: Dict[str, Any]) -> str:
+    """Builds the cache key for converting some input bytes to a format with the given write options.
+
+    Args:
+        content_hash (str): The hex digest of the input bytes.
+        input_extension (str): The input's format, since the same bytes read as CSV and as NDJSON differ.
+        output_extension (str): The format to convert to.
+        options (Dict[str, Any]): Anything else that changes the output, such as the Parquet profile.
+    Returns:
+        str: The key.
+    """
+    description = json.dumps([content_hash, input_extension, output_extension, options], sort_keys=True, default=str)
+    return hashlib.sha256(description.encode()).hexdigest()
+
+def _link_or_copy(source: Path, destination: Path) -> None:
+    """Hard-links a file, copying it instead when that isn't possible, such as across file systems."""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+def place_cached_output(cached_path: Path, output_dir: Path) -> Path:
+    """Makes a cached output available in the directory the caller asked for.
+
+    If the original output is still there it's returned as it is. Otherwise the cached file is linked back in under
+    its original name, which costs no copying on the same file system.
+
+    Args:
+        cached_path (Path): The cached output, from ConversionCache.get.
+        output_dir (Path): Where the caller wants the output.
+    Returns:
+        Path: The output in output_dir.
+    """
+    output_path = Path(output_dir) / cached_path.name
+    if output_path.exists() and output_path.stat().st_size == cached_path.stat().st_size:
+        return output_path
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path.with_name(f".{output_path.name}.{uuid.uuid4().hex}.tmp")
+    _link_or_copy(cached_path, temp_path)
+    os.replace(temp_path, output_path)
+    return output_path
+
+class ConversionCache:
+    """Content-addressed cache of converted files, kept on disk and bounded by their total size.
+
+    Each entry is a directory, cache_dir/<key>/, holding the output under its original name. Outputs are hard-linked
+    into the cache where possible, so caching them costs no extra disk space until the original is deleted. The
+    least recently used entries are evicted to stay under max_bytes, and the entries already on disk are picked up
+    again after a restart, oldest first.
+
+    Args:
+        cache_dir (Path): Where cached outputs are kept.
+        max_bytes (int): The most disk space the cached outputs may use.
+    """
+    def __init__(self, cache_dir: Path = Path("conversion_cache"), max_bytes: int = 1024 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[Path, int]]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._table_writes: Dict[str, Tuple[str, str]] = {}
+        self._repeated_table_writes = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        """Indexes the entries already on disk, least recently used first, and removes unfinished ones."""
+        if not self.cache_dir.exists():
+            return
+        entry_dirs = []
+        for entry_dir in self.cache_dir.iterdir():
+            files = [path for path in entry_dir.iterdir() if path.is_file()] if entry_dir.is_dir() else []
+            if entry_dir.name.startswith(".") or len(files) != 1:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            entry_dirs.append((entry_dir.stat().st_mtime, entry_dir.name, files[0]))
+        for _, key, path in sorted(entry_dirs):
+            size = path.stat().st_size
+            self._entries[key] = (path, size)
+            self._bytes += size
+        self._evict()
+
+    def _remove(self, key: str) -> None:
+        path, size = self._entries.pop(key)
+        self._bytes -= size
+        shutil.rmtree(path.parent, ignore_errors=True)
+
+    def _evict(self) -> None:
+        while self._entries and self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self._evictions += 1
+
+    def get(self, key: str) -> Optional[Path]:
+        """Returns the cached output for a key, or None on a miss.
+
+        Args:
+            key (str): The key from make_cache_key.
+        Returns:
+            Optional[Path]: The cached output.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not entry[0].exists():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        # The directory's modification time records when the entry was last used, for ordering after a restart.
+        os.utime(entry[0].parent)
+        return entry[0]
+
+    def put(self, key: str, output_path: Path) -> Optional[Path]:
+        """Adds a converted file to the cache, evicting the least recently used entries to make room.
+
+        Files bigger than the whole cache aren't stored.
+
+        Args:
+            key (str): The key from make_cache_key.
+            output_path (Path): The converted file.
+        Returns:
+            Optional[Path]: The cached copy, or None if the file wasn't cached.
+        """
+        size = output_path.stat().st_size
+        if size > self.max_bytes:
+            logging.info(f"Converted file of {size} bytes is too big to cache.")
+            return None
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        temp_dir = self.cache_dir / f".{key}.{uuid.uuid4().hex}.tmp"
+        temp_dir.mkdir()
+        _link_or_copy(output_path, temp_dir / output_path.name)
+        entry_dir = self.cache_dir / key
+        with self._lock:
+            if key in self._entries:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                return self._entries[key][0]
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(temp_dir, entry_dir)
+            cached_path = entry_dir / output_path.name
+            self._entries[key] = (cached_path, size)
+            self._bytes += size
+            self._evict()
+        return cached_path
+
+    def is_repeated_table_write(self, table: str, key: str, version: str) -> bool:
+        """Tells whether a table write would do exactly what the table's last write did, with nothing since.
+
+        Overwrites and merges are idempotent, so when the same input is written the same way and the table is still
+        at the version that write left it in, the write can be skipped.
+
+        Args:
+            table (str): The name of the table.
+            key (str): The key from make_cache_key for the upload and write options.
+            version (str): The table's current version.
+        Returns:
+            bool: True if the write can be skipped.
+        """
+        with self._lock:
+            repeated = self._table_writes.get(table) == (key, version)
+            if repeated:
+                self._repeated_table_writes += 1
+            return repeated
+
+    def record_table_write(self, table: str, key: str, version: str) -> None:
+        """Remembers the last write to a table and the version it left the table in."""
+        with self._lock:
+            self._table_writes[table] = (key, version)
+
+    def stats(self) -> ConversionCacheStats:
+        """Returns the cache's hit and miss counts, hit rate, evictions and current size."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "repeated_table_writes": self._repeated_table_writes,
+            }
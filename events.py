@@ -0,0 +1,154 @@
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import polars as pl
+
+EVENT_SCHEMA = {"event": pl.String, "timestamp": pl.String, "metadata": pl.String}
+
+class EventBuffer:
+    """Collects events in an in-memory ring buffer and writes them out in batches.
+
+    Events are appended to events.jsonl whenever flush_size events are waiting or flush_interval seconds have
+    passed, so a burst of clicks costs one write instead of one per event. Every roll_interval seconds the JSONL
+    file is rolled into a Parquet table partitioned by the date of each event (events/table/date=YYYY-MM-DD/), which
+    can be queried through the catalog. If events arrive faster than they can be flushed and the buffer fills up,
+    the oldest are dropped and counted.
+
+    Args:
+        events_dir (Path): Where the JSONL log and the events table are written.
+        capacity (int): The most events held in memory.
+        flush_size (int): Flush as soon as this many events are waiting.
+        flush_interval (float): The longest, in seconds, an event waits before it's flushed.
+        roll_interval (float): Seconds between rolls of the JSONL log into Parquet.
+    """
+    def __init__(self, events_dir: Path = Path("events"), capacity: int = 100_000, flush_size: int = 1000, flush_interval: float = 1.0, roll_interval: float = 300.0):
+        self.events_dir = Path(events_dir)
+        self.log_path = self.events_dir / "events.jsonl"
+        self.table_dir = self.events_dir / "table"
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.roll_interval = roll_interval
+        self.dropped = 0
+        self._buffer: deque = deque(maxlen=capacity)
+        # Created by run(), since an Event belongs to the event loop that first waits on it.
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._file_lock = threading.Lock()
+        # Changes every time the table does, so cached query results over the events are never stale.
+        self._version_prefix = uuid.uuid4().hex
+        self._rolls = 0
+
+    def add(self, event: Dict[str, Any]) -> None:
+        """Buffers one event."""
+        self.add_many([event])
+
+    def add_many(self, events: List[Dict[str, Any]]) -> None:
+        """Buffers a batch of events, asking for a flush once flush_size are waiting."""
+        overflow = len(self._buffer) + len(events) - self._buffer.maxlen
+        if overflow > 0:
+            self.dropped += overflow
+            logging.warning(f"Event buffer is full, dropping the {overflow} oldest events.")
+        self._buffer.extend(events)
+        if len(self._buffer) >= self.flush_size and self._flush_requested is not None:
+            self._flush_requested.set()
+
+    def flush(self) -> int:
+        """Appends every buffered event to the JSONL log with a single write.
+
+        Returns:
+            int: How many events were written.
+        """
+        events = []
+        while self._buffer:
+            events.append(self._buffer.popleft())
+        if not events:
+            return 0
+        lines = "".join(f"{json.dumps(event)}\n" for event in events)
+        with self._file_lock:
+            self.events_dir.mkdir(parents=True, exist_ok=True)
+            with self.log_path.open("a") as f:
+                f.write(lines)
+        logging.debug(f"Flushed {len(events)} events.")
+        return len(events)
+
+    def _events_to_frame(self, rolled_path: Path) -> pl.DataFrame:
+        """Reads a rolled JSONL log, keeping metadata as a JSON string so every file has the same schema."""
+        rows = []
+        with rolled_path.open() as f:
+            for line in f:
+                event = json.loads(line)
+                rows.append({"event": event["event"], "timestamp": event["timestamp"], "metadata": json.dumps(event.get("metadata"))})
+        return pl.DataFrame(rows, schema=EVENT_SCHEMA)
+
+    def roll(self) -> List[Path]:
+        """Moves the current JSONL log aside and adds its events to the date-partitioned events table.
+
+        Each event goes to the partition for the date in its timestamp, or today's date if the timestamp can't be
+        read. Files are written under a temporary name and renamed into place, so queries never see half a file.
+        Logs left behind by a roll that was interrupted are picked up as well.
+
+        Returns:
+            List[Path]: The new Parquet files, one per date.
+        """
+        with self._file_lock:
+            if self.log_path.exists() and self.log_path.stat().st_size > 0:
+                self.log_path.rename(self.events_dir / f"events-{uuid.uuid4().hex}.rolling.jsonl")
+        rolled_paths = sorted(self.events_dir.glob("*.rolling.jsonl"))
+        if not rolled_paths:
+            return []
+        events = pl.concat([self._events_to_frame(rolled_path) for rolled_path in rolled_paths])
+        events = events.with_columns(
+            date=pl.col("timestamp").str.slice(0, 10).str.to_date("%Y-%m-%d", strict=False).fill_null(datetime.now().date())
+        )
+        parquet_paths = []
+        for (date,), partition in events.partition_by("date", as_dict=True).items():
+            partition_dir = self.table_dir / f"date={date.isoformat()}"
+            partition_dir.mkdir(parents=True, exist_ok=True)
+            parquet_path = partition_dir / f"events_{datetime.now():%Y%m%d%H%M%S}_{uuid.uuid4().hex[:8]}.parquet"
+            temp_path = parquet_path.with_suffix(".tmp")
+            partition.drop("date").write_parquet(temp_path)
+            os.replace(temp_path, parquet_path)
+            parquet_paths.append(parquet_path)
+        self._rolls += 1
+        for rolled_path in rolled_paths:
+            rolled_path.unlink()
+        logging.info(f"Rolled {events.height} events into {len(parquet_paths)} partitions.")
+        return parquet_paths
+
+    def get_scan(self) -> tuple[str, pl.LazyFrame]:
+        """Returns the events table's version and a lazy scan of it, for registering with a TableCatalog.
+
+        The date partition is a column of the scan, and filters on it skip the other days' files entirely.
+        """
+        version = f"{self._version_prefix}-{self._rolls}"
+        if not any(self.table_dir.glob("date=*/*.parquet")):
+            return version, pl.LazyFrame(schema={**EVENT_SCHEMA, "date": pl.Date})
+        scan = pl.scan_parquet(self.table_dir / "**" / "*.parquet", hive_partitioning=True, hive_schema={"date": pl.Date})
+        return version, scan
+
+    async def run(self) -> None:
+        """Flushes and rolls in the background until cancelled, then flushes whatever is left."""
+        last_roll = time.monotonic()
+        self._flush_requested = asyncio.Event()
+        try:
+            while True:
+                # Events added before run() started couldn't ask for a flush, so check for a full batch first.
+                if len(self._buffer) < self.flush_size:
+                    try:
+                        await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                self._flush_requested.clear()
+                await asyncio.to_thread(self.flush)
+                if time.monotonic() - last_roll >= self.roll_interval:
+                    await asyncio.to_thread(self.roll)
+                    last_roll = time.monotonic()
+        finally:
+            self.flush()
@@ -86,6 +86,9 @@ function ConvertSection() {
       >
         <option value=".parquet">Parquet</option>
         <option value=".csv">CSV</option>
+        <option value=".ndjson">NDJSON</option>
+        <option value=".arrow">Arrow IPC</option>
+        <option value=".avro">Avro</option>
       </select>
       <button onClick={handleUpload}>Upload</button>
       {isUploading && <p>Uploading...</p>}
@@ -194,6 +197,7 @@ function QuerySection() {
   const [error, setError] = useState("");
   const [isRunning, setIsRunning] = useState(false);
   const [tables, setTables] = useState([]);
+  const [tableStats, setTableStats] = useState(null);
   
   useEffect(() => {
     fetch('http://localhost:8000/tables/')
@@ -202,6 +206,16 @@ function QuerySection() {
       .catch(err => console.error(err));
   }, []);
 
+  useEffect(() => {
+    setTableStats(null);
+    if (!tableName) return;
+    // Statistics come from the Parquet footers, so this is cheap however big the table is.
+    fetch(`http://localhost:8000/tables/${encodeURIComponent(tableName)}`)
+      .then(res => res.ok ? res.json() : null)
+      .then(data => setTableStats(data))
+      .catch(err => console.error(err));
+  }, [tableName]);
+
   const handleRunQuery = async () => {
     logEvent("query_clicked", {table_name: tableName, sql: query});
     if (!query.trim()) {
@@ -210,19 +224,35 @@ function QuerySection() {
     }
     setError("");
     setIsRunning(true);
+    setResult([]);
     try {
       const response = await fetch('http://localhost:8000/query/', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', 'Accept': 'application/x-ndjson' },
         body: JSON.stringify({ table_name: tableName, sql: query })
       });
-      const data = await response.json();
       if (response.ok) {
-        setResult(data.result);
-        logEvent("query_success", {table_name: tableName, sql: query, result_count: data.result.length});
+        // Rows arrive as newline-delimited JSON, so show each batch as soon as it lands.
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = "";
+        let resultCount = 0;
+        while (true) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffered += decoder.decode(value, { stream: true });
+          const lines = buffered.split("\n");
+          buffered = lines.pop();
+          const rows = lines.filter(line => line.trim()).map(line => JSON.parse(line));
+          resultCount += rows.length;
+          setResult(previous => [...previous, ...rows]);
+        }
+        logEvent("query_success", {table_name: tableName, sql: query, result_count: resultCount});
       } else {
-        setError(data.error || "An error occurred while running the query.");
-        logEvent("query_failed", {table_name: tableName, sql: query, error: data.error || "An error occurred while running the query."});
+        const data = await response.json();
+        setResult(null);
+        setError(data.detail || "An error occurred while running the query.");
+        logEvent("query_failed", {table_name: tableName, sql: query, error: data.detail || "An error occurred while running the query."});
       }
     } catch (err) {
       setError("An error occurred while running the query.");
@@ -241,6 +271,7 @@ function QuerySection() {
         <option value="">Select a table</option>
         {tables.map(table => <option key={table} value={table}>{table}</option>)}
       </select>
+      {tableStats && <TableStats stats={tableStats} />}
       <p>Querying</p>
       <textarea
         placeholder="SELECT * FROM self"
@@ -264,6 +295,25 @@ function QuerySection() {
   );
 }
 
+function TableStats({ stats }) {
+  const rows = Object.entries(stats.schema).map(([column, dtype]) => ({
+    column,
+    type: dtype,
+    min: stats.columns[column]?.min ?? "",
+    max: stats.columns[column]?.max ?? "",
+    nulls: stats.columns[column]?.null_count ?? "",
+  }));
+  return (
+    <div>
+      <p>
+        {stats.rows.toLocaleString()} rows, {(stats.bytes / 1024 / 1024).toFixed(1)} MB in {stats.files} files
+        and {stats.row_groups} row groups
+      </p>
+      <ResultsTable data={rows} />
+    </div>
+  );
+}
+
 function ResultsTable({ data }) {
   if (!data || data.length === 0) {
     return <p>No results</p>;
@@ -0,0 +1,266 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, TypedDict
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+from main import FileConverter
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class Job(TypedDict):
+    job_id: str
+    status: str
+    input_path: str
+    output_extension: str
+    output_dir: Optional[str]
+    streaming: bool
+    remove_when_done: Optional[str]
+    created_at: str
+    started_at: Optional[str]
+    finished_at: Optional[str]
+    output_path: Optional[str]
+    error_message: Optional[str]
+    peak_memory_bytes: Optional[int]
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is already at capacity."""
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+class JobQueue:
+    """Runs file conversions in the background on a bounded pool of workers.
+
+    Every job is saved to its own JSON file whenever its state changes, so the queue survives a restart: when the
+    queue starts, jobs that were queued or running when their process stopped are queued again if their input is
+    still there. Each job is claimed with a lock on its own lock file first, so when several processes share
+    jobs_dir only one of them runs it. Finished jobs are forgotten once they're older than retention_seconds.
+
+    Args:
+        jobs_dir (Path): Where job state is stored.
+        max_workers (int): How many conversions run at once.
+        max_pending (int): How many jobs may be queued or running in this process before new submissions are rejected.
+        retention_seconds (float): How long finished jobs are kept.
+    """
+    ACTIVE_STATUSES = ["queued", "running"]
+
+    def __init__(self, jobs_dir: Path = Path("jobs"), max_workers: int = 2, max_pending: int = 100, retention_seconds: float = 7 * 24 * 60 * 60):
+        self.jobs_dir = Path(jobs_dir)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.max_pending = max_pending
+        self.max_workers = max_workers
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._shut_down = False
+        self._jobs: Dict[str, Job] = {}
+        self._claims: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _get_lock_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.lock"
+
+    def _claim(self, job_id: str) -> bool:
+        """Takes a job's lock so no other process runs it, returning False if another process already holds it.
+
+        The lock is an flock on the job's lock file, so the operating system releases it if this process dies.
+        """
+        lock_path = self._get_lock_path(job_id)
+        if fcntl is None:
+            # Without flock, the lock file itself is the lock. One left behind by a crash has to be removed by hand.
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                return False
+        else:
+            fd = os.open(lock_path, os.O_CREAT | os.O_WRONLY)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+        self._claims[job_id] = fd
+        return True
+
+    def _release(self, job_id: str) -> None:
+        fd = self._claims.pop(job_id, None)
+        if fd is None:
+            return
+        if fcntl is None:
+            self._get_lock_path(job_id).unlink(missing_ok=True)
+        os.close(fd)
+
+    def _save(self, job: Job) -> None:
+        """Atomically writes a job's state to disk."""
+        job_path = self.jobs_dir / f"{job['job_id']}.json"
+        temp_path = job_path.with_name(f".{job_path.name}.tmp")
+        with temp_path.open("w") as f:
+            json.dump(job, f)
+        os.replace(temp_path, job_path)
+
+    def _load(self, job_id: str) -> Optional[Job]:
+        try:
+            with (self.jobs_dir / f"{job_id}.json").open() as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _recover(self) -> None:
+        """Loads saved jobs and queues again the unfinished ones that no running process has claimed."""
+        saved: List[Job] = []
+        for job_path in sorted(self.jobs_dir.glob("*.json")):
+            with job_path.open() as f:
+                saved.append(json.load(f))
+        with self._lock:
+            known = set(self._jobs)
+        unfinished = []
+        for job in saved:
+            job_id = job["job_id"]
+            if job_id in known:
+                continue
+            if job["status"] in self.ACTIVE_STATUSES:
+                if not self._claim(job_id):
+                    continue
+                # Another process may have finished the job between reading it and claiming it.
+                job = self._load(job_id)
+                if job is None:
+                    self._release(job_id)
+                    continue
+                if job["status"] in self.ACTIVE_STATUSES:
+                    unfinished.append(job)
+                else:
+                    self._release(job_id)
+            with self._lock:
+                self._jobs[job_id] = job
+        for job in sorted(unfinished, key=lambda job: job["created_at"]):
+            if Path(job["input_path"]).exists():
+                logging.info(f"Requeueing job {job['job_id']} after restart.")
+                self._update(job["job_id"], status="queued", started_at=None)
+                self._executor.submit(self._run, job["job_id"])
+            else:
+                self._update(job["job_id"], status="failed", finished_at=_now(), error_message="Input file was lost while the service restarted.")
+                self._release(job["job_id"])
+
+    def _prune(self) -> None:
+        """Forgets finished jobs older than retention_seconds and deletes their files."""
+        cutoff = datetime.now() - timedelta(seconds=self.retention_seconds)
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["status"] not in self.ACTIVE_STATUSES and job["finished_at"] and datetime.fromisoformat(job["finished_at"]) < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        for job_id in expired:
+            (self.jobs_dir / f"{job_id}.json").unlink(missing_ok=True)
+            self._get_lock_path(job_id).unlink(missing_ok=True)
+        if expired:
+            logging.info(f"Removed {len(expired)} finished jobs past their retention.")
+
+    def _count_active(self) -> int:
+        return sum(1 for job in self._jobs.values() if job["status"] in self.ACTIVE_STATUSES)
+
+    def submit(self, input_path: Path, output_extension: str, output_dir: Optional[str] = None, streaming: bool = False, remove_when_done: Optional[Path] = None) -> Job:
+        """Queues a conversion and returns straight away.
+
+        Args:
+            input_path (Path): The file to convert.
+            output_extension (str): The format to convert to.
+            output_dir (Optional[str]): Where to write the output.
+            streaming (bool): Whether to use the streaming conversion engine.
+            remove_when_done (Optional[Path]): A file or directory to delete once the job has finished, such as the upload.
+        Returns:
+            Job: The queued job.
+        Raises:
+            QueueFullError: If max_pending jobs are already queued or running.
+        """
+        with self._lock:
+            if self._count_active() >= self.max_pending:
+                raise QueueFullError(f"The job queue is full ({self.max_pending} jobs pending). Try again later.")
+            job: Job = {
+                "job_id": uuid.uuid4().hex,
+                "status": "queued",
+                "input_path": str(input_path),
+                "output_extension": output_extension,
+                "output_dir": output_dir,
+                "streaming": streaming,
+                "remove_when_done": str(remove_when_done) if remove_when_done is not None else None,
+                "created_at": _now(),
+                "started_at": None,
+                "finished_at": None,
+                "output_path": None,
+                "error_message": None,
+                "peak_memory_bytes": None,
+            }
+            # Claimed before it's saved, so another process starting up never sees it unclaimed.
+            self._claim(job["job_id"])
+            self._jobs[job["job_id"]] = job
+            self._save(job)
+        self._executor.submit(self._run, job["job_id"])
+        logging.info(f"Queued job {job['job_id']} to convert {input_path}.")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Returns a copy of a job's current state, with its place in the queue if it hasn't started yet."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+            if job["status"] == "queued":
+                job["queue_position"] = sum(1 for other in self._jobs.values() if other["status"] == "queued" and other["created_at"] < job["created_at"])
+            return job
+
+    def list_jobs(self) -> List[Job]:
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def _update(self, job_id: str, **changes) -> Job:
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(changes)
+            self._save(job)
+            return job
+
+    def _run(self, job_id: str) -> None:
+        job = self._update(job_id, status="running", started_at=_now())
+        converter = None
+        try:
+            converter = FileConverter(input_path=Path(job["input_path"]), output_extension=job["output_extension"], output_dir=job["output_dir"])
+            output_path = converter.convert(streaming=job["streaming"])
+            self._update(job_id, status="succeeded", finished_at=_now(), output_path=str(output_path) if output_path else None, peak_memory_bytes=converter.peak_memory_bytes)
+        except Exception as e:
+            logging.error(f"Job {job_id} failed: {e}")
+            self._update(job_id, status="failed", finished_at=_now(), error_message=str(e), peak_memory_bytes=converter.peak_memory_bytes if converter else None)
+        finally:
+            if job["remove_when_done"]:
+                remove_path = Path(job["remove_when_done"])
+                if remove_path.is_dir():
+                    shutil.rmtree(remove_path, ignore_errors=True)
+                else:
+                    remove_path.unlink(missing_ok=True)
+            self._release(job_id)
+            self._prune()
+
+    def start(self) -> None:
+        """Starts taking jobs: queues again the unfinished jobs no other process has claimed and removes expired ones.
+
+        It also gives the queue a fresh pool of workers if it was shut down, so it can run again after a restart.
+        """
+        with self._lock:
+            if self._shut_down:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+                self._shut_down = False
+        self._recover()
+        self._prune()
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            self._shut_down = True
+        self._executor.shutdown(wait=wait)
@@ -1,15 +1,122 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any, Optional, TypedDict
+from typing import Callable, Dict, List, Any, Optional, TypedDict, Union
 import polars as pl
+import pyarrow.parquet as pq
 import logging
-from datetime import datetime
+from datetime import date, datetime
 from pathlib import Path
+import os
+import threading
+import multiprocessing
+import json
+import random
+import uuid
+import time
+import re
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from metrics import BYTES, PEAK_MEMORY_BYTES, ROWS, time_operation, time_stage
 
 
 def _get_timestamp() -> str:
     """Returns the current timestamp as a string."""
     return datetime.now().strftime("%Y%m%d%H%M%S")
 
+def _get_rss_bytes() -> Optional[int]:
+    """Returns the current resident set size of this process in bytes, if it can be measured."""
+    # Without /proc only the lifetime peak (ru_maxrss) is available. It rarely moves during one operation, so growth
+    # measured from it would almost always be 0, and no measurement is reported instead.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class PeakMemory:
+    """Context manager that samples the process resident memory in the background and keeps the peak, as the bytes
+    it rose by above what the process was already using on entry.
+
+    Memory is measured for the whole process, so when several operations run at once in different threads, each
+    one's peak also counts whatever the others allocated while it ran. Where it can't be measured, such as on macOS,
+    peak_bytes stays None.
+
+    Args:
+        interval (float): Seconds between samples.
+    """
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_bytes: Optional[int] = None
+        self._baseline_bytes: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        rss = _get_rss_bytes()
+        if rss is None or self._baseline_bytes is None:
+            return
+        growth = max(rss - self._baseline_bytes, 0)
+        if self.peak_bytes is None or growth > self.peak_bytes:
+            self.peak_bytes = growth
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self) -> "PeakMemory":
+        self._baseline_bytes = _get_rss_bytes()
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+WriteData = Union[pl.DataFrame, pl.LazyFrame, List[Dict[str, Any]]]
+
+class ParquetWriteOptions(TypedDict, total=False):
+    compression: str
+    compression_level: Optional[int]
+    statistics: Union[bool, str]
+    row_group_size: Optional[int]
+    data_page_size: Optional[int]
+
+# Named trade-offs between write speed, file size and scan speed. "default" keeps polars' own settings.
+PARQUET_PROFILES: Dict[str, ParquetWriteOptions] = {
+    "default": {},
+    # The fastest zstd level and no column statistics, for data that's written once and rarely read.
+    "fast-write": {"compression": "zstd", "compression_level": 1, "statistics": False},
+    # Heavier zstd and bigger row groups for archives, where storage costs more than the extra CPU.
+    "small-files": {"compression": "zstd", "compression_level": 12, "row_group_size": 1_000_000},
+    # Fast to decompress, with full statistics and smaller row groups so filters can skip more of the file.
+    "fast-scan": {"compression": "lz4", "statistics": "full", "row_group_size": 100_000},
+}
+
+def get_parquet_options(profile: Union[str, ParquetWriteOptions, None] = None) -> ParquetWriteOptions:
+    """Resolves a Parquet write profile to the options passed to write_parquet/sink_parquet.
+
+    Args:
+        profile (Union[str, ParquetWriteOptions, None]): The name of a profile in PARQUET_PROFILES, a dictionary of
+            custom options, or None for the defaults.
+    Returns:
+        ParquetWriteOptions: The write options.
+    Raises:
+        ValueError: If the profile name or an option isn't recognised.
+    """
+    if profile is None:
+        return {}
+    if isinstance(profile, str):
+        if profile not in PARQUET_PROFILES:
+            raise ValueError(f"Unknown Parquet profile: {profile}. Must be one of {list(PARQUET_PROFILES)}.")
+        return dict(PARQUET_PROFILES[profile])
+    unknown = set(profile) - set(ParquetWriteOptions.__annotations__)
+    if unknown:
+        raise ValueError(f"Unknown Parquet write options: {sorted(unknown)}.")
+    return dict(profile)
+
 class ConvertFile(TypedDict):
     input_path: Path
     output_extension: str
@@ -20,6 +127,7 @@ class ConvertResult(TypedDict):
     output_path: Optional[Path]
     success: bool
     error_message: Optional[str]
+    peak_memory_bytes: Optional[int]
 
 class Write(ABC):
     def __init__(self, input_filename: str, output_dir: Optional[str] = None):
@@ -31,33 +139,52 @@ class Write(ABC):
         """Ensures that the output directory exists."""
         self.directory.mkdir(parents=True, exist_ok=True)
 
-    def write(self, data: List[Dict[str, Any]]) -> Optional[Path]:
+    def write(self, data: WriteData) -> Optional[Path]:
         """"Writes data to a file.
 
         Args:
-            data (List[Dict[str, Any]]): The data to write, represented as a list of dictionaries.
+            data (WriteData): The data to write. DataFrames and LazyFrames are written as they are,
+                Arrow tables are wrapped without copying and a list of dictionaries is still accepted.
         """
         logging.info("Writing data to file.")
         if data is None:
             logging.error("No data provided to write.")
             raise ValueError("Data cannot be None.")
-        elif data == []:
+        frame = self._to_frame(data)
+        if isinstance(frame, pl.DataFrame) and frame.is_empty():
             logging.warning("Empty data provided to write. No file will be created.")
             return None
         try:
             filename = self.directory / f"{self.input_filename}_{_get_timestamp()}.{self._get_extension()}"
-            df = pl.DataFrame(data)
-            self._do_write(df, filename)
+            self._do_write(frame, filename)
             logging.info("Data successfully written to file.")
             return filename
         except Exception as e:
             logging.error(f"Failed to write file: {e}")
             raise
+
+    @staticmethod
+    def _to_frame(data: WriteData) -> Union[pl.DataFrame, pl.LazyFrame]:
+        """Turns the supported inputs into a polars frame without going through Python rows.
+
+        Args:
+            data (WriteData): A DataFrame, LazyFrame, Arrow table or list of dictionaries.
+        Returns:
+            Union[pl.DataFrame, pl.LazyFrame]: The data as a polars frame.
+        """
+        if isinstance(data, (pl.DataFrame, pl.LazyFrame)):
+            return data
+        if hasattr(data, "__arrow_c_stream__"):
+            # Writers take chunked frames, so the Arrow chunks are kept instead of being copied into one.
+            return pl.from_arrow(data, rechunk=False)
+        return pl.DataFrame(data)
+
     @abstractmethod
-    def _do_write(self, data: pl.DataFrame, filename: Path) -> None:
+    def _do_write(self, data: Union[pl.DataFrame, pl.LazyFrame], filename: Path) -> None:
         """Helper method to write data to a file. This method can be overridden by subclasses to implement specific writing logic.
 
         Args:
+            data (Union[pl.DataFrame, pl.LazyFrame]): The data to write. LazyFrames should be sunk rather than collected.
             filename (Path): The name of the file to write to.
         """
         pass
@@ -67,20 +194,99 @@ class Write(ABC):
         pass
 
 class ParquetWrite(Write):
+    """Writes Parquet files.
+
+    Args:
+        profile (Union[str, ParquetWriteOptions, None]): A profile from PARQUET_PROFILES or custom write options.
+    """
+    def __init__(self, input_filename: str, output_dir: Optional[str] = None, profile: Union[str, ParquetWriteOptions, None] = None):
+        self.options = get_parquet_options(profile)
+        super().__init__(input_filename=input_filename, output_dir=output_dir)
+
     def _get_extension(self) -> str:
         return "parquet"
 
-    def _do_write(self, data: pl.DataFrame, filename: Path) -> None:
-        data.write_parquet(filename)     
+    def _do_write(self, data: Union[pl.DataFrame, pl.LazyFrame], filename: Path) -> None:
+        if isinstance(data, pl.LazyFrame):
+            data.sink_parquet(filename, **self.options)
+        else:
+            data.write_parquet(filename, **self.options)
         
 class CsvWrite(Write):
+    COMPRESSION = "uncompressed"
+
     def _get_extension(self) -> str:
         return "csv"
 
-    def _do_write(self, data: pl.DataFrame, filename: Path) -> None:
-        data.write_csv(filename)        
+    def _do_write(self, data: Union[pl.DataFrame, pl.LazyFrame], filename: Path) -> None:
+        if isinstance(data, pl.LazyFrame):
+            data.sink_csv(filename, compression=self.COMPRESSION)
+        else:
+            data.write_csv(filename, compression=self.COMPRESSION)
+
+class GzipCsvWrite(CsvWrite):
+    """Writes gzip-compressed CSV. polars compresses as it writes, so there's no uncompressed temporary file."""
+    COMPRESSION = "gzip"
+
+    def _get_extension(self) -> str:
+        return "csv.gz"
+
+class ZstdCsvWrite(CsvWrite):
+    """Writes zstd-compressed CSV. polars compresses as it writes, so there's no uncompressed temporary file."""
+    COMPRESSION = "zstd"
+
+    def _get_extension(self) -> str:
+        return "csv.zst"
+
+class NdjsonWrite(Write):
+    def _get_extension(self) -> str:
+        return "ndjson"
+
+    def _do_write(self, data: Union[pl.DataFrame, pl.LazyFrame], filename: Path) -> None:
+        if isinstance(data, pl.LazyFrame):
+            data.sink_ndjson(filename)
+        else:
+            data.write_ndjson(filename)
+
+class JsonlWrite(NdjsonWrite):
+    def _get_extension(self) -> str:
+        return "jsonl"
+
+class IpcWrite(Write):
+    """Writes Arrow IPC files, uncompressed so readers can memory-map them without copying."""
+    def _get_extension(self) -> str:
+        return "arrow"
+
+    def _do_write(self, data: Union[pl.DataFrame, pl.LazyFrame], filename: Path) -> None:
+        if isinstance(data, pl.LazyFrame):
+            data.sink_ipc(filename, compression="uncompressed")
+        else:
+            data.write_ipc(filename, compression="uncompressed")
+
+class FeatherWrite(IpcWrite):
+    def _get_extension(self) -> str:
+        return "feather"
+
+class AvroWrite(Write):
+    def _get_extension(self) -> str:
+        return "avro"
+
+    def _do_write(self, data: Union[pl.DataFrame, pl.LazyFrame], filename: Path) -> None:
+        # polars can't sink Avro, so a LazyFrame has to be collected first.
+        if isinstance(data, pl.LazyFrame):
+            data = data.collect()
+        data.write_avro(filename)
 
 class Read(ABC):
+    def _validate_filename(self, filename: Path) -> None:
+        """Checks that a filename was given and that the file exists."""
+        if not filename:
+            logging.error("No filename provided to read.")
+            raise ValueError("Filename cannot be None.")
+        if not filename.exists():
+            logging.error(f"File not found: {filename}")
+            raise FileNotFoundError(f"File not found: {filename}")
+
     def read(self, filename: Path) -> pl.DataFrame:
         """Reads data from a file.
 
@@ -88,12 +294,7 @@ class Read(ABC):
             filename (Path): The name of the file to read from.
         """
         logging.info(f"Reading data from file: {filename}")
-        if not filename:
-            logging.error("No filename provided to read.")
-            raise ValueError("Filename cannot be None.")
-        if not filename.exists():
-            logging.error(f"File not found: {filename}")
-            raise FileNotFoundError(f"File not found: {filename}")
+        self._validate_filename(filename)
         try:
             df = self._do_read(filename)
             logging.info("Data successfully read from file.")
@@ -101,6 +302,25 @@ class Read(ABC):
         except Exception as e:
             logging.error(f"Failed to read file: {e}")
             raise
+
+    def scan(self, filename: Path) -> pl.LazyFrame:
+        """Lazily scans data from a file so it can be processed without loading it all into memory.
+
+        Args:
+            filename (Path): The name of the file to scan.
+        """
+        logging.info(f"Scanning data from file: {filename}")
+        self._validate_filename(filename)
+        return self._do_scan(filename)
+
+    def _do_scan(self, filename: Path) -> pl.LazyFrame:
+        """Helper method to scan a file. Formats without a native scanner fall back to an eager read.
+
+        Args:
+            filename (Path): The name of the file to scan.
+        """
+        return self._do_read(filename).lazy()
+
     @abstractmethod
     def _do_read(self, filename: Path) -> pl.DataFrame:
         """Helper method to read data from a file. This method can be overridden by subclasses to implement specific reading logic.
@@ -114,22 +334,179 @@ class ParquetRead(Read):
     def _do_read(self, filename: Path) -> pl.DataFrame:
         return pl.read_parquet(filename)
 
+    def _do_scan(self, filename: Path) -> pl.LazyFrame:
+        return pl.scan_parquet(filename)
+
+class SchemaCache:
+    """Keeps the schemas inferred for CSV sources so later reads of the same source skip inference and get the same types.
+
+    Each schema is stored as an empty Arrow IPC file, which round-trips every polars data type exactly.
+
+    Args:
+        directory (Path): Where the schemas are stored.
+    """
+    def __init__(self, directory: Path = Path("schemas")):
+        self.directory = Path(directory)
+        self._schemas: Dict[str, pl.Schema] = {}
+        self._lock = threading.Lock()
+
+    def _get_path(self, key: str) -> Path:
+        return self.directory / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', key)}.arrow"
+
+    def get(self, key: str) -> Optional[pl.Schema]:
+        """Returns the cached schema for a source, or None if there isn't one."""
+        with self._lock:
+            if key in self._schemas:
+                return self._schemas[key]
+        path = self._get_path(key)
+        if not path.exists():
+            return None
+        schema = pl.Schema(pl.read_ipc_schema(path))
+        with self._lock:
+            self._schemas[key] = schema
+        return schema
+
+    def put(self, key: str, schema: pl.Schema) -> None:
+        """Stores the schema for a source."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._get_path(key)
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        pl.DataFrame(schema=schema).write_ipc(temp_path)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._schemas[key] = pl.Schema(schema)
+
+    def clear(self, key: str) -> None:
+        """Forgets the schema for a source, so the next read infers it again."""
+        with self._lock:
+            self._schemas.pop(key, None)
+        self._get_path(key).unlink(missing_ok=True)
+
+SCHEMA_CACHE = SchemaCache()
+
 class CsvRead(Read):
+    """Reads CSV files, optionally with an explicit schema or with the schema cached per source.
+
+    Args:
+        schema (Optional[Dict[str, pl.DataType]]): The full schema of the file. Turns inference off.
+        schema_overrides (Optional[Dict[str, pl.DataType]]): Types for some columns. The rest are inferred.
+        infer_schema_length (Optional[int]): How many rows to look at when inferring types. None reads them all.
+        schema_key (Optional[str]): Names the source, such as a feed or table. The schema inferred on the first read
+            is cached under this name and reused afterwards, so every read of the source gets the same types.
+        schema_cache (Optional[SchemaCache]): Where to cache schemas. Defaults to SCHEMA_CACHE.
+    """
+    def __init__(self, schema: Optional[Dict[str, pl.DataType]] = None, schema_overrides: Optional[Dict[str, pl.DataType]] = None,
+                 infer_schema_length: Optional[int] = 100, schema_key: Optional[str] = None, schema_cache: Optional[SchemaCache] = None):
+        self.schema = schema
+        self.schema_overrides = schema_overrides
+        self.infer_schema_length = infer_schema_length
+        self.schema_key = schema_key
+        self.schema_cache = schema_cache or SCHEMA_CACHE
+
+    def _get_cached_schema(self) -> Optional[pl.Schema]:
+        if self.schema is not None or self.schema_key is None:
+            return None
+        return self.schema_cache.get(self.schema_key)
+
+    def _get_read_options(self, filename: Path, cached_schema: Optional[pl.Schema]) -> Dict[str, Any]:
+        """Works out the schema arguments for polars' CSV reader."""
+        if self.schema is not None:
+            return {"schema": self.schema}
+        overrides = dict(self.schema_overrides or {})
+        if cached_schema is None:
+            return {"schema_overrides": overrides or None, "infer_schema_length": self.infer_schema_length}
+        known_types = {**cached_schema, **overrides}
+        columns = pl.read_csv(filename, n_rows=0).columns
+        if columns == list(known_types):
+            # Same layout as before, so the whole schema is known and inference can be skipped.
+            return {"schema": known_types}
+        return {
+            "schema_overrides": {column: known_types[column] for column in columns if column in known_types} or None,
+            "infer_schema_length": self.infer_schema_length,
+        }
+
+    def _cache_schema(self, schema: pl.Schema, cached_schema: Optional[pl.Schema]) -> None:
+        if self.schema is None and self.schema_key is not None and schema != cached_schema:
+            self.schema_cache.put(self.schema_key, schema)
+
+    def _do_read(self, filename: Path) -> pl.DataFrame:
+        cached_schema = self._get_cached_schema()
+        try:
+            df = pl.read_csv(filename, **self._get_read_options(filename, cached_schema))
+        except pl.exceptions.ComputeError as e:
+            if cached_schema is None:
+                raise
+            raise ValueError(f"{filename} doesn't match the cached schema for '{self.schema_key}'. "
+                             f"Pass schema_overrides for the columns that changed or clear the cached schema. {e}") from e
+        self._cache_schema(df.schema, cached_schema)
+        return df
+
+    def _do_scan(self, filename: Path) -> pl.LazyFrame:
+        cached_schema = self._get_cached_schema()
+        lf = pl.scan_csv(filename, **self._get_read_options(filename, cached_schema))
+        if self.schema is None and self.schema_key is not None:
+            self._cache_schema(lf.collect_schema(), cached_schema)
+        return lf
+
+class NdjsonRead(Read):
+    def _do_read(self, filename: Path) -> pl.DataFrame:
+        return pl.read_ndjson(filename)
+
+    def _do_scan(self, filename: Path) -> pl.LazyFrame:
+        return pl.scan_ndjson(filename)
+
+class IpcRead(Read):
+    """Reads Arrow IPC (Feather v2) files. Uncompressed files are memory-mapped, so reading them doesn't copy the data."""
+    def _do_read(self, filename: Path) -> pl.DataFrame:
+        return pl.read_ipc(filename, memory_map=True)
+
+    def _do_scan(self, filename: Path) -> pl.LazyFrame:
+        return pl.scan_ipc(filename, memory_map=True)
+
+class AvroRead(Read):
     def _do_read(self, filename: Path) -> pl.DataFrame:
-        return pl.read_csv(filename)
+        return pl.read_avro(filename)
+
+COMPRESSION_SUFFIXES = [".gz", ".zst"]
+
+def get_file_extension(path: Path) -> str:
+    """Returns the extension that identifies a file's format, keeping the format in front of a compression suffix.
+
+    Args:
+        path (Path): The file.
+    Returns:
+        str: The extension, such as ".parquet" or ".csv.gz".
+    """
+    suffixes = path.suffixes
+    if len(suffixes) >= 2 and suffixes[-1] in COMPRESSION_SUFFIXES:
+        return "".join(suffixes[-2:])
+    return path.suffix
 
 class FileConverter:
+    # Compressed CSV is decompressed by polars' own reader as it parses, so it's never written out uncompressed.
     FORMATS = {
         ".parquet": (ParquetRead, ParquetWrite),
         ".csv": (CsvRead, CsvWrite),
+        ".csv.gz": (CsvRead, GzipCsvWrite),
+        ".csv.zst": (CsvRead, ZstdCsvWrite),
+        ".ndjson": (NdjsonRead, NdjsonWrite),
+        ".jsonl": (NdjsonRead, JsonlWrite),
+        ".arrow": (IpcRead, IpcWrite),
+        ".feather": (IpcRead, FeatherWrite),
+        ".avro": (AvroRead, AvroWrite),
     }
 
-    def __init__(self, input_path: Path, output_extension: str, output_dir: Optional[str] = None):
+    def __init__(self, input_path: Path, output_extension: str, output_dir: Optional[str] = None, schema_key: Optional[str] = None,
+                 parquet_profile: Union[str, ParquetWriteOptions, None] = None):
         self.input_path = input_path
         self.output_extension = output_extension
-        self.input_extension = self.input_path.suffix
+        self.input_extension = get_file_extension(self.input_path)
         self.output_dir = output_dir
-        self.input_filename = self.input_path.stem
+        self.input_filename = self.input_path.name[:-len(self.input_extension)] if self.input_extension else self.input_path.name
+        self.schema_key = schema_key
+        self.parquet_profile = parquet_profile
+        self.peak_memory_bytes: Optional[int] = None
+        self.stage_seconds: Dict[str, float] = {}
     
     def _get_read_classes(self, extension: str) -> type[Read]:
         """Retrieves the appropriate reader classes based on the file extension.
@@ -168,44 +545,1260 @@ class FileConverter:
             raise ValueError("Input and output formats cannot be the same.")
         return True
 
-    def convert(self) -> Optional[Path]:
+    def convert(self, streaming: bool = False) -> Optional[Path]:
+        """Converts the input file to the output format.
+
+        Args:
+            streaming (bool): If True, the file is scanned lazily and sunk to the output in batches so memory stays
+                bounded regardless of file size. Empty inputs still produce an (empty) output file in this mode.
+        Returns:
+            Optional[Path]: The path of the written file, or None if there was nothing to write.
+        """
         self._validate_formats()
         reader_class = self._get_read_classes(self.input_extension)
         writer_class = self._get_write_classes(self.output_extension)
-        reader = reader_class()
-        writer = writer_class(output_dir=self.output_dir, input_filename=self.input_filename)
-        df = reader.read(self.input_path)
-        return writer.write(df.to_dicts())
+        reader = reader_class(schema_key=self.schema_key) if self.schema_key and issubclass(reader_class, CsvRead) else reader_class()
+        if issubclass(writer_class, ParquetWrite):
+            writer = writer_class(output_dir=self.output_dir, input_filename=self.input_filename, profile=self.parquet_profile)
+        else:
+            writer = writer_class(output_dir=self.output_dir, input_filename=self.input_filename)
+        memory = PeakMemory()
+        self.stage_seconds = {}
+        try:
+            with time_operation("convert"), memory:
+                # Scanning only builds a query plan, so a streaming conversion does its reading in the write stage.
+                with time_stage("convert", "read", self.stage_seconds):
+                    if streaming:
+                        data = reader.scan(self.input_path)
+                    else:
+                        data = reader.read(self.input_path)
+                with time_stage("convert", "write", self.stage_seconds):
+                    output_path = writer.write(data)
+        finally:
+            self.peak_memory_bytes = memory.peak_bytes
+            if memory.peak_bytes is not None:
+                PEAK_MEMORY_BYTES.observe(memory.peak_bytes, operation="convert")
+        BYTES.inc(Path(self.input_path).stat().st_size, operation="convert", direction="in")
+        if output_path is not None:
+            BYTES.inc(output_path.stat().st_size, operation="convert", direction="out")
+        if isinstance(data, pl.DataFrame):
+            ROWS.inc(data.height, operation="convert", direction="in")
+            if output_path is not None:
+                ROWS.inc(data.height, operation="convert", direction="out")
+        elif output_path is not None:
+            # A streaming conversion never holds the data, so its rows are counted from the output, which has them all.
+            rows = self._count_rows(output_path)
+            ROWS.inc(rows, operation="convert", direction="in")
+            ROWS.inc(rows, operation="convert", direction="out")
+        return output_path
+
+    def _count_rows(self, output_path: Path) -> int:
+        """Counts the rows of a converted file, from its footer for Parquet and by scanning it otherwise."""
+        if self.output_extension == ".parquet":
+            return pq.read_metadata(output_path).num_rows
+        reader = self._get_read_classes(self.output_extension)()
+        return reader.scan(output_path).select(pl.len()).collect().item()
 
-def batch_convert(files: List[ConvertFile]) -> List[ConvertResult]:
+def _convert_one(file: ConvertFile, streaming: bool = False) -> ConvertResult:
+    """Converts a single batch entry, capturing any error in the result instead of raising it."""
+    result: ConvertResult = {"input_path": file["input_path"], "output_path": None, "success": False, "error_message": None, "peak_memory_bytes": None}
+    try:
+        converter = FileConverter(input_path=file["input_path"], output_extension=file["output_extension"], output_dir=file.get("output_dir"))
+        try:
+            result["output_path"] = converter.convert(streaming=streaming)
+        finally:
+            result["peak_memory_bytes"] = converter.peak_memory_bytes
+        result["success"] = True
+    except Exception as e:
+        logging.error(f"Failed to convert file {file['input_path']}: {e}")
+        result["error_message"] = str(e)
+    return result
+
+def _get_input_size(file: ConvertFile) -> int:
+    """Returns the size of a batch entry's input file, or 0 if it can't be read."""
+    try:
+        return Path(file["input_path"]).stat().st_size
+    except (OSError, TypeError):
+        return 0
+
+def batch_convert(files: List[ConvertFile], streaming: bool = False, max_workers: int = 1, executor: str = "thread") -> List[ConvertResult]:
     """Converts a batch of files based on the provided list of file paths and desired output formats.
 
     Args:
         files (List[ConvertFile]): A list of dictionaries, each containing an 'input_path' and 'output_extension' key.
+        streaming (bool): If True, every file is converted with the bounded-memory streaming engine.
+        max_workers (int): How many files to convert at once. 1 keeps the conversion sequential.
+        executor (str): "thread" or "process". Threads are cheap to start and polars releases the GIL while it works,
+            processes isolate each conversion completely.
     Returns:
-        List[ConvertResult]: A list of results for each file conversion, including success status and any error messages.
+        List[ConvertResult]: A list of results for each file conversion, in the same order as the input, including
+            success status and any error messages.
+    Raises:
+        ValueError: If the executor or worker count is invalid.
     """
-    results: List[ConvertResult] = []
-    for file in files:
-        try:
-            converter = FileConverter(input_path=file["input_path"], output_extension=file["output_extension"], output_dir=file.get("output_dir"))
-            output_path = converter.convert()
-            results.append({"input_path": file["input_path"], "output_path": output_path, "success": True, "error_message": None})
-        except Exception as e:
-            logging.error(f"Failed to convert file {file['input_path']}: {e}")
-            results.append({"input_path": file["input_path"], "output_path": None, "success": False, "error_message": str(e)})
+    EXECUTORS = ["thread", "process"]
+    if executor not in EXECUTORS:
+        raise ValueError(f"Invalid executor: {executor}. Must be one of {EXECUTORS}.")
+    if max_workers < 1:
+        raise ValueError("max_workers must be at least 1.")
+    if max_workers == 1 or len(files) <= 1:
+        return [_convert_one(file, streaming=streaming) for file in files]
+
+    # Start the biggest files first so one large file doesn't end up running alone at the end of the batch.
+    schedule = sorted(range(len(files)), key=lambda i: _get_input_size(files[i]), reverse=True)
+    if executor == "process":
+        pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+    results: List[Optional[ConvertResult]] = [None] * len(files)
+    with pool:
+        futures = {pool.submit(_convert_one, files[i], streaming): i for i in schedule}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                # _convert_one never raises, so this is the pool itself failing, e.g. a crashed worker process.
+                logging.error(f"Failed to convert file {files[i]['input_path']}: {e}")
+                results[i] = {"input_path": files[i]["input_path"], "output_path": None, "success": False, "error_message": str(e), "peak_memory_bytes": None}
     return results
         
+TABLES_DIR = Path("tables")
+# Each commit adds the next version of the manifest to this directory, so writers never overwrite each other.
+MANIFEST_DIRNAME = "_manifest"
+# Where tables written before the manifest log kept their single manifest.
+LEGACY_MANIFEST_FILENAME = "_manifest.json"
+# Past versions of a table, and the part files only they use, stay readable this long after they're replaced.
+VERSION_RETENTION_SECONDS = 7 * 24 * 60 * 60
+# How many times a write retries its commit when other writers keep committing first.
+COMMIT_ATTEMPTS = 20
+# Replaced part files are always kept at least this long so queries that started from an older manifest can
+# still finish, even when a vacuum asks for a shorter retention.
+OBSOLETE_PART_GRACE_SECONDS = 300
+# How many times a merge starts over when another write changes the parts it was rewriting.
+MERGE_ATTEMPTS = 5
+DEFAULT_TARGET_FILE_SIZE = 128 * 1024 * 1024
+
+# Partition directories hold this value when the partition key is null, as in Hive.
+HIVE_NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+PARTITION_TYPES = {str(dtype): dtype for dtype in [pl.String, pl.Int8, pl.Int16, pl.Int32, pl.Int64, pl.UInt8, pl.UInt16, pl.UInt32, pl.UInt64, pl.Date, pl.Boolean]}
+
+class TablePart(TypedDict):
+    path: str
+    rows: int
+    bytes: int
+    schema: Dict[str, str]
+    partition: Dict[str, str]
+    # The smallest and largest value of each column merges have used as a key, filled in as merges need them.
+    key_ranges: Dict[str, List[Any]]
+
+class ObsoletePart(TypedDict):
+    path: str
+    removed_at: float
+
+class TableManifest(TypedDict):
+    version: int
+    parts: List[TablePart]
+    obsolete: List[ObsoletePart]
+    partition_schema: Dict[str, str]
+    # When the version was committed, in seconds since the epoch. Manifests from before time travel don't have it.
+    committed_at: float
+
+class TableVersion(TypedDict):
+    version: int
+    committed_at: Optional[float]
+    parts: int
+    rows: int
+    bytes: int
+
+class VacuumResult(TypedDict):
+    table: str
+    versions_removed: int
+    files_removed: int
+    bytes_removed: int
+
+class ColumnStats(TypedDict):
+    # None when no row has a value, or when a file was written without statistics.
+    min: Any
+    max: Any
+    null_count: Optional[int]
+
+class FileStats(TypedDict):
+    rows: int
+    bytes: int
+    row_groups: int
+    schema: Dict[str, str]
+    columns: Dict[str, ColumnStats]
+
+class TableStats(TypedDict):
+    table: str
+    version: str
+    rows: int
+    bytes: int
+    files: int
+    row_groups: int
+    schema: Dict[str, str]
+    partitions: List[str]
+    columns: Dict[str, ColumnStats]
+
+class CompactResult(TypedDict):
+    table: str
+    parts_before: int
+    parts_after: int
+    compacted_parts: int
+
+# A change to a table's manifest: given the latest manifest, the parts of the new version, the parts it no longer
+# uses, and its partition columns (None keeps the current ones). Returning None leaves the table as it is.
+ManifestChange = Callable[[TableManifest], Optional[tuple[List[TablePart], List[TablePart], Optional[Dict[str, str]]]]]
+
+class CommitConflictError(Exception):
+    """Raised when another writer committed the same version of a table's manifest first."""
+
+class StaleVersionError(Exception):
+    """Raised when a table can't be read again at the version an earlier query read, such as the first page of a
+    paginated query, because that version is gone or the table has no history."""
+
+def _is_valid_table_name(table: str) -> bool:
+    """Returns True if the name can be a table: a single, non-hidden entry in tables/."""
+    return bool(table) and Path(table).name == table and not table.startswith(".")
+
+def _check_table_name(table: str) -> None:
+    """Raises a ValueError for names that would write outside the table's own directory in tables/."""
+    if not _is_valid_table_name(table):
+        raise ValueError(f"Invalid table name: {table!r}. Table names can't be empty, contain a path separator or start with a dot.")
+
+def _get_table_dir(table: str) -> Path:
+    """Returns the directory that holds a table's part files and manifest."""
+    return TABLES_DIR / table
+
+def _get_legacy_table_path(table: str) -> Path:
+    """Returns the path of a table stored in the old single-file layout."""
+    return TABLES_DIR / f"{table}.parquet"
+
+def _get_manifest_path(table: str, version: int) -> Path:
+    """Returns the path of one version of a table's manifest."""
+    return _get_table_dir(table) / MANIFEST_DIRNAME / f"{version:020d}.json"
+
+def _get_manifest_versions(table: str) -> List[int]:
+    """Returns the versions of a table's manifest that are on disk, oldest first."""
+    try:
+        names = os.listdir(_get_table_dir(table) / MANIFEST_DIRNAME)
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-len(".json")]) for name in names if name.endswith(".json") and name[:-len(".json")].isdigit())
+
+def _get_latest_manifest_path(table: str) -> Optional[Path]:
+    """Returns the path of a table's latest manifest, or None if the table doesn't use the multi-file layout."""
+    versions = _get_manifest_versions(table)
+    if versions:
+        return _get_manifest_path(table, versions[-1])
+    legacy_path = _get_table_dir(table) / LEGACY_MANIFEST_FILENAME
+    return legacy_path if legacy_path.exists() else None
+
+def read_manifest(table: str, version: Optional[int] = None) -> Optional[TableManifest]:
+    """Reads the latest version, or a past version, of a table's manifest.
+
+    Manifest versions are never changed once written, so this is a consistent snapshot of the table however many
+    writers are committing at the same time.
+
+    Args:
+        table (str): The name of the table.
+        version (Optional[int]): The version to read. Defaults to the latest.
+    Returns:
+        Optional[TableManifest]: The manifest, or None if the table doesn't use the multi-file layout.
+    Raises:
+        FileNotFoundError: If the version asked for doesn't exist or is past its retention.
+    """
+    if version is not None:
+        try:
+            with _get_manifest_path(table, version).open() as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Version {version} of table {table} doesn't exist or is past its retention.")
+    for _ in range(COMMIT_ATTEMPTS):
+        manifest_path = _get_latest_manifest_path(table)
+        if manifest_path is None:
+            return None
+        try:
+            with manifest_path.open() as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # The table moved to the manifest log since the listing. Look again.
+            continue
+    raise RuntimeError(f"Couldn't read the manifest of table {table} because it kept changing.")
+
+def _write_manifest(table: str, manifest: TableManifest) -> None:
+    """Publishes a version of a table's manifest, unless another writer already published that version.
+
+    The manifest is written to a temporary file and hard-linked into place. Linking fails if the version exists,
+    and readers only ever see a complete file, so two writers can never both commit the same version.
+
+    Raises:
+        CommitConflictError: If the version already exists.
+    """
+    manifest_path = _get_manifest_path(table, manifest["version"])
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = manifest_path.with_name(f".{manifest_path.name}.{uuid.uuid4().hex}.tmp")
+    with temp_path.open("w") as f:
+        json.dump(manifest, f)
+    try:
+        os.link(temp_path, manifest_path)
+    except FileExistsError:
+        raise CommitConflictError(f"Version {manifest['version']} of table {table} was committed by another writer.")
+    finally:
+        temp_path.unlink()
+    (_get_table_dir(table) / LEGACY_MANIFEST_FILENAME).unlink(missing_ok=True)
+    _remove_expired_versions(table, VERSION_RETENTION_SECONDS)
+
+def _remove_expired_versions(table: str, retention_seconds: float) -> int:
+    """Deletes the manifest versions that stopped being the latest more than retention_seconds ago.
+
+    A version stops being the latest when the next one is committed, so only the oldest few versions are read to
+    find the ones to delete. The latest version is always kept.
+
+    Returns:
+        int: How many versions were deleted.
+    """
+    cutoff = time.time() - retention_seconds
+    versions = _get_manifest_versions(table)
+    removed = 0
+    for version, next_version in zip(versions, versions[1:]):
+        try:
+            replaced_at = read_manifest(table, next_version).get("committed_at", 0)
+        except FileNotFoundError:
+            # Another commit or vacuum is cleaning up at the same time.
+            continue
+        if replaced_at > cutoff:
+            break
+        _get_manifest_path(table, version).unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+def _remove_part_file(table: str, path: str) -> None:
+    """Deletes a part file, along with any partition directories it leaves empty."""
+    table_dir = _get_table_dir(table)
+    part_path = table_dir / path
+    part_path.unlink(missing_ok=True)
+    for directory in part_path.parents:
+        if directory == table_dir or table_dir not in directory.parents:
+            break
+        try:
+            directory.rmdir()
+        except OSError:
+            break
+
+def _commit_manifest(table: str, manifest: TableManifest, parts: List[TablePart], removed_parts: List[TablePart],
+                     partition_schema: Optional[Dict[str, str]] = None) -> TableManifest:
+    """Writes the next version of a table's manifest and cleans up part files that are past their grace period.
+
+    Parts that are no longer in the table aren't deleted straight away, because a query that read the previous
+    manifest may still be scanning them. They're recorded as obsolete and deleted by a later commit.
+
+    Args:
+        table (str): The name of the table.
+        manifest (TableManifest): The manifest the change was based on.
+        parts (List[TablePart]): The parts of the new version.
+        removed_parts (List[TablePart]): Parts of the old version that the new version no longer uses.
+        partition_schema (Optional[Dict[str, str]]): The partition columns of the new version. Defaults to the old ones.
+    Returns:
+        TableManifest: The committed manifest.
+    Raises:
+        CommitConflictError: If another writer committed a new version since manifest was read.
+    """
+    now = time.time()
+    obsolete = manifest.get("obsolete", []) + [{"path": part["path"], "removed_at": now} for part in removed_parts]
+    # A rollback brings back parts that an earlier version removed, and those mustn't be deleted.
+    part_paths = {part["path"] for part in parts}
+    obsolete = [part for part in obsolete if part["path"] not in part_paths]
+    # Past versions use the parts they had, so a part is only deleted once every version that uses it has expired.
+    expired = [part for part in obsolete if now - part["removed_at"] >= max(OBSOLETE_PART_GRACE_SECONDS, VERSION_RETENTION_SECONDS)]
+    new_manifest: TableManifest = {
+        "version": manifest["version"] + 1,
+        "parts": parts,
+        "obsolete": [part for part in obsolete if part not in expired],
+        "partition_schema": partition_schema if partition_schema is not None else manifest.get("partition_schema", {}),
+        "committed_at": now,
+    }
+    _write_manifest(table, new_manifest)
+    for part in expired:
+        _remove_part_file(table, part["path"])
+    return new_manifest
+
+def _update_manifest(table: str, change: ManifestChange) -> Optional[TableManifest]:
+    """Applies a change to the latest manifest of a table, retrying when other writers commit first.
+
+    Writers don't lock the table. Each one applies its change to the latest version and tries to commit the next
+    one. When another writer got there first, the change is applied again to the version that writer committed,
+    so concurrent appends all land without waiting for each other's part files to be written.
+
+    Args:
+        table (str): The name of the table.
+        change (ManifestChange): Works out the new version from the latest manifest. It may run more than once.
+    Returns:
+        Optional[TableManifest]: The committed manifest, or None if the change left the table as it was.
+    Raises:
+        RuntimeError: If the commit kept conflicting with other writers.
+    """
+    for attempt in range(COMMIT_ATTEMPTS):
+        manifest = read_manifest(table) or {"version": 0, "parts": [], "obsolete": [], "partition_schema": {}}
+        update = change(manifest)
+        if update is None:
+            return None
+        parts, removed_parts, partition_schema = update
+        try:
+            return _commit_manifest(table, manifest, parts, removed_parts, partition_schema)
+        except CommitConflictError:
+            logging.info(f"Table {table} changed while committing to it. Retrying (attempt {attempt + 1}).")
+            # A little random backoff stops writers that keep colliding from retrying in lockstep.
+            time.sleep(random.uniform(0, 0.001 * 2 ** min(attempt, 8)))
+    raise RuntimeError(f"Gave up committing to table {table} after {COMMIT_ATTEMPTS} attempts because it kept changing.")
+
+def _get_partition_dirs(partition: Dict[str, str]) -> List[str]:
+    """Returns the Hive-style directory names, column=value, for a partition."""
+    return [f"{column}={value}" for column, value in partition.items()]
+
+def _format_partition_value(value: Any) -> str:
+    """Formats a partition key the way Hive and polars' hive_partitioning expect to find it in a directory name."""
+    if value is None or value == "":
+        return HIVE_NULL_PARTITION
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, date):
+        return value.isoformat()
+    return urllib.parse.quote(str(value), safe="")
+
+def _new_part_path(table: str, partition: Optional[Dict[str, str]] = None) -> Path:
+    """Returns a unique path for a new part file in a table directory, inside its partition's directory if it has one."""
+    directory = _get_table_dir(table).joinpath(*_get_partition_dirs(partition or {}))
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f"part-{_get_timestamp()}-{uuid.uuid4().hex}.parquet"
+
+def _describe_part(path: Path, rows: int, schema: pl.Schema, partition: Optional[Dict[str, str]] = None) -> TablePart:
+    """Builds the manifest entry for a part file that lives in a table directory."""
+    return {
+        "path": "/".join(_get_partition_dirs(partition or {}) + [path.name]),
+        "rows": rows,
+        "bytes": path.stat().st_size,
+        "schema": {name: str(dtype) for name, dtype in schema.items()},
+        "partition": partition or {},
+        "key_ranges": {},
+    }
+
+def _to_index_value(value: Any) -> Any:
+    """Makes a key value JSON friendly for the key index. ISO strings sort the same way as the dates they encode."""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def _get_key_ranges(table: str, part: TablePart, keys: List[str]) -> Dict[str, List[Any]]:
+    """Returns the smallest and largest value of each key column in a part.
+
+    Ranges already in the part's index are reused, so a part's key columns are read at most once.
+    """
+    key_ranges = dict(part.get("key_ranges", {}))
+    missing = [key for key in keys if key not in key_ranges and key in part["schema"]]
+    if missing:
+        aggregations = [expr for key in missing for expr in (pl.col(key).min().alias(f"{key}_min"), pl.col(key).max().alias(f"{key}_max"))]
+        row = pl.scan_parquet(_get_table_dir(table) / part["path"]).select(aggregations).collect().row(0, named=True)
+        for key in missing:
+            key_ranges[key] = [_to_index_value(row[f"{key}_min"]), _to_index_value(row[f"{key}_max"])]
+    return key_ranges
+
+def _may_contain_keys(part: TablePart, incoming_ranges: Dict[str, List[Any]], incoming_partitions: Dict[str, set]) -> bool:
+    """Uses the key index to tell whether a part might hold any of the incoming keys.
+
+    It can answer yes for a part that turns out not to, but never no for a part that does.
+    """
+    for key, (low, high) in incoming_ranges.items():
+        if key in part.get("partition", {}):
+            if part["partition"][key] not in incoming_partitions[key]:
+                return False
+            continue
+        if key not in part["key_ranges"]:
+            # The part doesn't have the column at all, so its keys are all null and can't match.
+            return False
+        part_low, part_high = part["key_ranges"][key]
+        if low is None or part_low is None:
+            return False
+        try:
+            if high < part_low or low > part_high:
+                return False
+        except TypeError:
+            continue
+    return True
+
+def get_table_files(table: str) -> List[Path]:
+    """Returns the Parquet files that make up a table.
+
+    Args:
+        table (str): The name of the table.
+    Returns:
+        List[Path]: The table's part files, or the single file of a table in the old layout.
+    Raises:
+        FileNotFoundError: If the table doesn't exist.
+    """
+    manifest = read_manifest(table)
+    if manifest is not None:
+        return [_get_table_dir(table) / part["path"] for part in manifest["parts"]]
+    legacy_path = _get_legacy_table_path(table)
+    if legacy_path.exists():
+        return [legacy_path]
+    raise FileNotFoundError(f"Table not found: {table}")
+
+def get_table_version(table: str, version: Optional[int] = None) -> str:
+    """Returns a token that changes whenever a table's contents change.
+
+    It's built from the latest manifest file's name and identity, so a table that is deleted and created again
+    doesn't reuse an old token.
+
+    Args:
+        table (str): The name of the table.
+        version (Optional[int]): A past version to get the token of instead, for caching time-travel queries.
+    Returns:
+        str: The table's current version token.
+    Raises:
+        FileNotFoundError: If the table, or the version, doesn't exist.
+    """
+    if version is not None:
+        try:
+            stat = _get_manifest_path(table, version).stat()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Version {version} of table {table} doesn't exist or is past its retention.")
+        return f"{version:020d}-{stat.st_ino}-{stat.st_mtime_ns}"
+    for _ in range(COMMIT_ATTEMPTS):
+        manifest_path = _get_latest_manifest_path(table)
+        if manifest_path is None:
+            break
+        try:
+            stat = manifest_path.stat()
+        except FileNotFoundError:
+            continue
+        return f"{manifest_path.stem}-{stat.st_ino}-{stat.st_mtime_ns}"
+    legacy_path = _get_legacy_table_path(table)
+    if legacy_path.exists():
+        stat = legacy_path.stat()
+        return f"legacy-{stat.st_ino}-{stat.st_mtime_ns}-{stat.st_size}"
+    raise FileNotFoundError(f"Table not found: {table}")
+
+def _get_token_version(token: str) -> Optional[int]:
+    """Returns the version number in a token from get_table_version, or None for a table in the old layout."""
+    version = token.split("-", 1)[0]
+    return int(version) if version.isdigit() else None
+
+def get_table_partition_schema(table: str) -> Dict[str, pl.DataType]:
+    """Returns the columns a table is partitioned by and their types, or an empty dictionary if it isn't partitioned.
+
+    Args:
+        table (str): The name of the table.
+    Returns:
+        Dict[str, pl.DataType]: The partition columns, outermost first.
+    """
+    manifest = read_manifest(table)
+    if manifest is None:
+        return {}
+    return {column: PARTITION_TYPES[dtype] for column, dtype in manifest.get("partition_schema", {}).items()}
+
+def scan_table(table: str, version: Optional[int] = None) -> pl.LazyFrame:
+    """Lazily scans the union of all parts of a table.
+
+    Parts that share a schema are scanned together. When appends changed the schema, the groups are combined
+    diagonally, the same way the old single-file append did. The columns of a partitioned table are read from the
+    directory names, so filters on them skip the files of every other partition.
+
+    Args:
+        table (str): The name of the table.
+        version (Optional[int]): A past version of the table to scan. Defaults to the latest.
+    Returns:
+        pl.LazyFrame: A lazy scan over the whole table.
+    Raises:
+        FileNotFoundError: If the table, or the version, doesn't exist.
+        ValueError: If a version is asked for from a table in the old single-file layout, which has no history.
+    """
+    manifest = read_manifest(table, version)
+    if manifest is None:
+        if version is not None:
+            raise ValueError(f"Table {table} has no version history.")
+        return pl.scan_parquet(get_table_files(table))
+    if not manifest["parts"]:
+        return pl.LazyFrame()
+    table_dir = _get_table_dir(table)
+    groups: List[List[Path]] = []
+    previous_schema = None
+    for part in manifest["parts"]:
+        if part["schema"] != previous_schema:
+            groups.append([])
+            previous_schema = part["schema"]
+        groups[-1].append(table_dir / part["path"])
+    partition_schema = {column: PARTITION_TYPES[dtype] for column, dtype in manifest.get("partition_schema", {}).items()}
+    scan_options = {"hive_partitioning": True, "hive_schema": partition_schema} if partition_schema else {}
+    frames = [pl.scan_parquet(paths, **scan_options) for paths in groups]
+    return frames[0] if len(frames) == 1 else pl.concat(frames, how="diagonal")
+
+def read_table(table: str) -> pl.DataFrame:
+    """Reads the union of all parts of a table into memory.
+
+    Args:
+        table (str): The name of the table.
+    Returns:
+        pl.DataFrame: The table's data.
+    """
+    return scan_table(table).collect()
+
+def get_table_version_at(table: str, timestamp: float) -> int:
+    """Returns the version a table was at, at some point in time.
+
+    Args:
+        table (str): The name of the table.
+        timestamp (float): The point in time, in seconds since the epoch.
+    Returns:
+        int: The latest version committed at or before the timestamp.
+    Raises:
+        FileNotFoundError: If the table has no version that old, because it didn't exist yet or the version is
+            past its retention.
+    """
+    versions = _get_manifest_versions(table)
+    # Versions are committed in order, so the one we want can be found by bisecting on their commit times.
+    low, high = 0, len(versions)
+    while low < high:
+        middle = (low + high) // 2
+        if read_manifest(table, versions[middle]).get("committed_at", 0) <= timestamp:
+            low = middle + 1
+        else:
+            high = middle
+    if low == 0:
+        raise FileNotFoundError(f"Table {table} has no version at {datetime.fromtimestamp(timestamp).isoformat()}.")
+    return versions[low - 1]
+
+def get_table_history(table: str) -> List[TableVersion]:
+    """Returns the versions of a table that can still be queried or rolled back to, newest first.
+
+    Args:
+        table (str): The name of the table.
+    Returns:
+        List[TableVersion]: Each version's number, commit time and size.
+    Raises:
+        FileNotFoundError: If the table doesn't exist.
+    """
+    if not table_exists(table):
+        raise FileNotFoundError(f"Table not found: {table}")
+    history: List[TableVersion] = []
+    for version in reversed(_get_manifest_versions(table)):
+        try:
+            manifest = read_manifest(table, version)
+        except FileNotFoundError:
+            continue
+        history.append({
+            "version": version,
+            "committed_at": manifest.get("committed_at"),
+            "parts": len(manifest["parts"]),
+            "rows": sum(part["rows"] for part in manifest["parts"]),
+            "bytes": sum(part["bytes"] for part in manifest["parts"]),
+        })
+    return history
+
+def rollback_table(table: str, version: int) -> TableManifest:
+    """Makes a past version of a table the latest one again.
+
+    Only a new manifest is written, listing the parts the past version had, so a rollback takes the same time
+    however big the table is. The versions in between stay in the history, so a rollback can itself be undone.
+
+    Args:
+        table (str): The name of the table.
+        version (int): The version to go back to.
+    Returns:
+        TableManifest: The committed manifest.
+    Raises:
+        FileNotFoundError: If the version doesn't exist, is past its retention, or its part files were vacuumed.
+        ValueError: If the table name isn't valid.
+    """
+    _check_table_name(table)
+    target = read_manifest(table, version)
+    table_dir = _get_table_dir(table)
+    missing = [part["path"] for part in target["parts"] if not (table_dir / part["path"]).exists()]
+    if missing:
+        raise FileNotFoundError(f"Version {version} of table {table} can't be restored because {len(missing)} of its part files were vacuumed.")
+    logging.info(f"Rolling table {table} back to version {version}.")
+
+    def restore(latest: TableManifest) -> tuple[List[TablePart], List[TablePart], Dict[str, str]]:
+        target_paths = {part["path"] for part in target["parts"]}
+        removed_parts = [part for part in latest["parts"] if part["path"] not in target_paths]
+        return target["parts"], removed_parts, target.get("partition_schema", {})
+
+    return _update_manifest(table, restore)
+
+def vacuum_table(table: str, retention_seconds: float = VERSION_RETENTION_SECONDS) -> VacuumResult:
+    """Deletes the versions of a table that are past their retention, and the part files no remaining version uses.
+
+    Commits already clean up after themselves with the default retention. A vacuum can use a shorter one to free
+    space sooner, and also deletes part files that were never committed, such as those of a write that crashed.
+    Files are never deleted within OBSOLETE_PART_GRACE_SECONDS of being replaced or written, so running queries
+    and writes aren't affected.
+
+    Args:
+        table (str): The name of the table.
+        retention_seconds (float): How long replaced versions stay queryable.
+    Returns:
+        VacuumResult: How many versions and files were deleted, and how many bytes that freed.
+    Raises:
+        FileNotFoundError: If the table doesn't exist.
+        ValueError: If the table name isn't valid.
+    """
+    _check_table_name(table)
+    if read_manifest(table) is None:
+        # Tables in the old layout are a single file with no history.
+        get_table_files(table)
+        return {"table": table, "versions_removed": 0, "files_removed": 0, "bytes_removed": 0}
+    logging.info(f"Vacuuming table {table}.")
+    versions_removed = _remove_expired_versions(table, retention_seconds)
+    used_paths = set()
+    for version in _get_manifest_versions(table):
+        try:
+            used_paths.update(part["path"] for part in read_manifest(table, version)["parts"])
+        except FileNotFoundError:
+            continue
+    # Read the latest manifest last, so parts committed while the versions were being read are kept too.
+    latest = read_manifest(table)
+    used_paths.update(part["path"] for part in latest["parts"])
+    removed_at = {part["path"]: part["removed_at"] for part in latest.get("obsolete", [])}
+    cutoff = time.time() - max(retention_seconds, OBSOLETE_PART_GRACE_SECONDS)
+    table_dir = _get_table_dir(table)
+    files_removed = bytes_removed = 0
+    for path in table_dir.rglob("*.parquet"):
+        relative_path = path.relative_to(table_dir).as_posix()
+        if relative_path in used_paths:
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        if max(stat.st_mtime, removed_at.get(relative_path, 0)) > cutoff:
+            continue
+        _remove_part_file(table, relative_path)
+        files_removed += 1
+        bytes_removed += stat.st_size
+    logging.info(f"Vacuumed {versions_removed} versions and {files_removed} files of table {table}.")
+    return {"table": table, "versions_removed": versions_removed, "files_removed": files_removed, "bytes_removed": bytes_removed}
+
+def get_table_names() -> List[str]:
+    """Returns the names of all tables, in either layout."""
+    if not TABLES_DIR.exists():
+        return []
+    names = {path.parent.name for path in TABLES_DIR.glob(f"*/{MANIFEST_DIRNAME}")}
+    names.update(path.parent.name for path in TABLES_DIR.glob(f"*/{LEGACY_MANIFEST_FILENAME}"))
+    names.update(path.stem for path in TABLES_DIR.glob("*.parquet"))
+    return sorted(names)
+
+def table_exists(table: str) -> bool:
+    """Returns True if a table with this name exists, in either layout."""
+    if not _is_valid_table_name(table):
+        return False
+    return _get_latest_manifest_path(table) is not None or _get_legacy_table_path(table).exists()
+
+def _combine_column_stats(chunks: List[tuple[Optional[ColumnStats], int]]) -> ColumnStats:
+    """Combines the statistics of a column across row groups or files.
+
+    Args:
+        chunks (List[tuple[Optional[ColumnStats], int]]): Each chunk's statistics and row count. A chunk without
+            statistics for the column, such as a file that doesn't have it, counts as all null.
+    Returns:
+        ColumnStats: The statistics of the whole column. The minimum and maximum are None if any chunk with
+            values has no minimum or maximum, since the true ones can't be known from the footers.
+    """
+    low = high = None
+    null_count: Optional[int] = 0
+    known = True
+    for stats, rows in chunks:
+        if stats is None:
+            stats = {"min": None, "max": None, "null_count": rows}
+        chunk_nulls = stats["null_count"]
+        null_count = None if null_count is None or chunk_nulls is None else null_count + chunk_nulls
+        if chunk_nulls == rows:
+            continue
+        if stats["min"] is None or stats["max"] is None:
+            known = False
+            continue
+        try:
+            low = stats["min"] if low is None else min(low, stats["min"])
+            high = stats["max"] if high is None else max(high, stats["max"])
+        except TypeError:
+            # The column changed type between parts, so its values don't compare.
+            known = False
+    if not known:
+        low = high = None
+    return {"min": low, "max": high, "null_count": null_count}
+
+@lru_cache(maxsize=16384)
+def _read_file_stats(path: Path, size: int, mtime_ns: int) -> FileStats:
+    """Reads a Parquet file's row count, schema and column statistics from its footer, without reading any data.
+
+    Part files never change once written, and the size and modification time are part of the cache key for the
+    files that do, so each footer is read once.
+    """
+    metadata = pq.read_metadata(path)
+    schema = pl.from_arrow(metadata.schema.to_arrow_schema().empty_table()).schema
+    chunks: Dict[str, List[tuple[Optional[ColumnStats], int]]] = {name: [] for name in schema}
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        for j in range(row_group.num_columns):
+            column = row_group.column(j)
+            # Nested columns have a chunk per leaf field, which don't describe the column as a whole.
+            if column.path_in_schema not in chunks or schema[column.path_in_schema].is_nested():
+                continue
+            statistics = column.statistics
+            stats: ColumnStats = {"min": None, "max": None, "null_count": None}
+            if statistics is not None:
+                if statistics.has_min_max and not isinstance(statistics.min, bytes):
+                    stats["min"], stats["max"] = statistics.min, statistics.max
+                if statistics.has_null_count:
+                    stats["null_count"] = statistics.null_count
+            chunks[column.path_in_schema].append((stats, row_group.num_rows))
+    columns = {}
+    for name, column_chunks in chunks.items():
+        if column_chunks:
+            columns[name] = _combine_column_stats(column_chunks)
+        else:
+            columns[name] = {"min": None, "max": None, "null_count": None} if metadata.num_rows else _combine_column_stats([])
+    return {
+        "rows": metadata.num_rows,
+        "bytes": size,
+        "row_groups": metadata.num_row_groups,
+        "schema": {name: str(dtype) for name, dtype in schema.items()},
+        "columns": columns,
+    }
+
+def _parse_partition_value(value: str, dtype: pl.DataType) -> Any:
+    """Turns a partition directory value back into the value it was written from."""
+    if value == HIVE_NULL_PARTITION:
+        return None
+    value = urllib.parse.unquote(value)
+    if dtype == pl.Boolean:
+        return value == "true"
+    if dtype == pl.Date:
+        return date.fromisoformat(value)
+    if dtype.is_integer():
+        return int(value)
+    return value
+
+def get_table_stats(table: str) -> TableStats:
+    """Returns a table's schema, size and per-column statistics, read only from its Parquet footers.
+
+    The minimum, maximum and null count of a partition column come from the partition directories instead.
+
+    Args:
+        table (str): The name of the table.
+    Returns:
+        TableStats: The table's statistics.
+    Raises:
+        FileNotFoundError: If the table doesn't exist.
+    """
+    version = get_table_version(table)
+    manifest = read_manifest(table)
+    parts = manifest["parts"] if manifest is not None else [{"path": path.name, "partition": {}} for path in get_table_files(table)]
+    base_dir = _get_table_dir(table) if manifest is not None else TABLES_DIR
+    files = []
+    for part in parts:
+        path = base_dir / part["path"]
+        stat = path.stat()
+        files.append((_read_file_stats(path, stat.st_size, stat.st_mtime_ns), part.get("partition", {})))
+    partition_schema = get_table_partition_schema(table)
+    schema: Dict[str, str] = {}
+    for file_stats, _ in files:
+        for name, dtype in file_stats["schema"].items():
+            schema.setdefault(name, dtype)
+    columns = {name: _combine_column_stats([(file_stats["columns"].get(name), file_stats["rows"]) for file_stats, _ in files]) for name in schema}
+    for column, dtype in partition_schema.items():
+        schema[column] = str(dtype)
+        chunks = []
+        for file_stats, partition in files:
+            value = _parse_partition_value(partition.get(column, HIVE_NULL_PARTITION), dtype)
+            chunks.append(({"min": value, "max": value, "null_count": file_stats["rows"] if value is None else 0}, file_stats["rows"]))
+        columns[column] = _combine_column_stats(chunks)
+    return {
+        "table": table,
+        "version": version,
+        "rows": sum(file_stats["rows"] for file_stats, _ in files),
+        "bytes": sum(file_stats["bytes"] for file_stats, _ in files),
+        "files": len(files),
+        "row_groups": sum(file_stats["row_groups"] for file_stats, _ in files),
+        "schema": schema,
+        "partitions": list(partition_schema),
+        "columns": {name: {**stats, "min": _to_index_value(stats["min"]), "max": _to_index_value(stats["max"])} for name, stats in columns.items()},
+    }
+
+class TableCatalog:
+    """Makes tables available to SQL by name so one query can join or union several of them.
+
+    Only the tables a query mentions are registered, and each table's lazy scan is cached until the table's version
+    changes, so the cost of a query doesn't grow with the number of tables. Footer statistics are cached the same way.
+    Tables stored somewhere other than tables/ can be added with register().
+    """
+    IDENTIFIER_PATTERN = re.compile(r'"([^"]+)"|([A-Za-z_][A-Za-z0-9_]*)')
+
+    def __init__(self):
+        self._scans: Dict[str, tuple[str, pl.LazyFrame]] = {}
+        self._sources: Dict[str, Callable[[], tuple[str, pl.LazyFrame]]] = {}
+        self._stats: Dict[str, TableStats] = {}
+        self._lock = threading.Lock()
+
+    def register(self, table: str, source: Callable[[], tuple[str, pl.LazyFrame]]) -> None:
+        """Adds a table that isn't stored in tables/.
+
+        Args:
+            table (str): The name queries use for the table.
+            source (Callable[[], tuple[str, pl.LazyFrame]]): Returns the table's current version and a lazy scan of it.
+        """
+        self._sources[table] = source
+
+    def get_names(self) -> List[str]:
+        """Returns the names of every table in the catalog."""
+        return sorted(set(get_table_names()) | set(self._sources))
+
+    def get_scan(self, table: str, version: Optional[int] = None) -> tuple[str, pl.LazyFrame]:
+        """Returns a table's version and a lazy scan of it, reusing the cached scan if the table hasn't changed.
+
+        Args:
+            table (str): The name of the table.
+            version (Optional[int]): A past version of the table to scan instead of the latest.
+        Returns:
+            tuple[str, pl.LazyFrame]: The table's version and its scan.
+        Raises:
+            FileNotFoundError: If the table, or the version, doesn't exist.
+            ValueError: If a version is asked for from a table that has no history.
+        """
+        if version is not None:
+            if table in self._sources:
+                raise ValueError(f"Table {table} has no version history.")
+            return get_table_version(table, version), scan_table(table, version)
+        if table in self._sources:
+            return self._sources[table]()
+        version = get_table_version(table)
+        with self._lock:
+            cached = self._scans.get(table)
+        if cached is not None and cached[0] == version:
+            return cached
+        scan = (version, scan_table(table))
+        with self._lock:
+            self._scans[table] = scan
+        return scan
+
+    def get_stats(self, table: str) -> TableStats:
+        """Returns a table's footer statistics, reusing them until the table's version changes.
+
+        Args:
+            table (str): The name of the table.
+        Returns:
+            TableStats: The table's statistics.
+        Raises:
+            FileNotFoundError: If the table doesn't exist.
+            ValueError: If the table was added with register(), so it has no Parquet footers to read.
+        """
+        if table in self._sources:
+            raise ValueError(f"Table {table} isn't stored in {TABLES_DIR}/, so it has no statistics.")
+        version = get_table_version(table)
+        with self._lock:
+            cached = self._stats.get(table)
+        if cached is not None and cached["version"] == version:
+            return cached
+        stats = get_table_stats(table)
+        with self._lock:
+            self._stats[table] = stats
+        return stats
+
+    def get_referenced_tables(self, sql: str) -> List[str]:
+        """Returns the names of existing tables that appear as identifiers in the SQL."""
+        names = {quoted or bare for quoted, bare in self.IDENTIFIER_PATTERN.findall(sql)}
+        return sorted(name for name in names if name in self._sources or table_exists(name))
+
+    def query(self, sql: str, self_table: Optional[str] = None, version: Optional[int] = None, timestamp: Optional[float] = None,
+              pinned_versions: Optional[Dict[str, str]] = None) -> tuple[pl.LazyFrame, Dict[str, str]]:
+        """Builds a lazy query over every table the SQL mentions.
+
+        Args:
+            sql (str): The query. Tables are referred to by name, and self_table can also be referred to as "self".
+            self_table (Optional[str]): The table that "self" refers to.
+            version (Optional[int]): Reads this past version of self_table.
+            timestamp (Optional[float]): Reads every table as it was at this point in time, in seconds since the
+                epoch, so a query over several tables sees them all as of the same moment.
+            pinned_versions (Optional[Dict[str, str]]): The versions an earlier query returned. Tables that query
+                read at their latest version are read at that same version again, so later pages of a paginated
+                query see the same data as the first.
+        Returns:
+            tuple[pl.LazyFrame, Dict[str, str]]: The lazy query and the version of each table it reads, with an
+                entry for the table "self" is bound to.
+        Raises:
+            FileNotFoundError: If self_table, or a version asked for, doesn't exist.
+            ValueError: If both a version and a timestamp are given, or a version without self_table.
+            StaleVersionError: If a table can't be read at its pinned version any more.
+        """
+        if version is not None and timestamp is not None:
+            raise ValueError("Query either a version or a timestamp, not both.")
+        if version is not None and self_table is None:
+            raise ValueError("Querying a version needs the table it's a version of.")
+        pinned_versions = pinned_versions or {}
+
+        def get_version(table: str) -> Optional[int]:
+            if table in self._sources:
+                return None
+            if table in pinned_versions:
+                # Tables in the old layout have no history, so they're read as they are and checked in register().
+                return _get_token_version(pinned_versions[table])
+            if timestamp is None:
+                return None
+            return get_table_version_at(table, timestamp)
+
+        context = pl.SQLContext()
+        table_versions: Dict[str, str] = {}
+
+        def register(name: str, table: str, table_version: Optional[int], pinned: Optional[str] = None) -> None:
+            # Past versions never change, so they're keyed apart from the table and aren't invalidated by writes.
+            key = table if table_version is None else f"{table}@{table_version}"
+            try:
+                table_versions[key], scan = self.get_scan(table, table_version)
+            except FileNotFoundError as e:
+                if pinned is not None:
+                    raise StaleVersionError(f"Table {table} can't be read as it was when the query started: {e}")
+                raise
+            if pinned is not None and table_versions[key] != pinned:
+                raise StaleVersionError(f"Table {table} changed since the query started and has no version to read it as it was.")
+            if name == "self":
+                # The same SQL reads different data depending on which table "self" is, so the binding is part of the
+                # versions too. It gets its own entry so queries binding "self" to other tables don't look stale.
+                table_versions[f"self={key}"] = table_versions[key]
+            context.register(name, scan)
+
+        for table in self.get_referenced_tables(sql):
+            register(table, table, get_version(table), pinned_versions.get(table))
+        if self_table is not None:
+            if version is not None:
+                register("self", self_table, version)
+            else:
+                register("self", self_table, get_version(self_table), pinned_versions.get(self_table))
+        return context.execute(sql, eager=False), table_versions
+
+    def describe(self) -> Dict[str, Dict[str, str]]:
+        """Returns the schema of every table, as column name to data type."""
+        schemas = {}
+        for table in self.get_names():
+            _, scan = self.get_scan(table)
+            schemas[table] = {name: str(dtype) for name, dtype in scan.collect_schema().items()}
+        return schemas
+
 class TableWrite:
-    def __init__(self, table: str, write_mode: str):
-        WRITE_MODES = ["append", "overwrite"]
+    """Writes batches to a table.
+
+    Args:
+        table (str): The name of the table.
+        write_mode (str): "append" adds the batch to the table, "overwrite" replaces the whole table, and
+            "overwrite_partitions" replaces only the partitions that appear in the batch.
+        parquet_profile (Union[str, ParquetWriteOptions, None]): How to write the part files.
+        partition_by (Optional[List[str]]): Columns to partition the table by, Hive style
+            (tables/<table>/<column>=<value>/). Defaults to the table's current partitioning.
+        merge_keys (Optional[List[str]]): The columns that identify a row, for write_mode "merge". Rows of the
+            batch replace the table's rows with the same keys and the rest are added.
+    """
+    def __init__(self, table: str, write_mode: str, parquet_profile: Union[str, ParquetWriteOptions, None] = None, partition_by: Optional[List[str]] = None,
+                 merge_keys: Optional[List[str]] = None):
+        WRITE_MODES = ["append", "overwrite", "overwrite_partitions", "merge"]
         if write_mode not in WRITE_MODES:
             raise ValueError(f"Invalid write mode: {write_mode}. Must be one of {WRITE_MODES}.")
-        Path("tables").mkdir(parents=True, exist_ok=True)
+        if write_mode == "merge" and not merge_keys:
+            raise ValueError("The merge write mode needs merge_keys.")
+        _check_table_name(table)
+        self.merge_keys = merge_keys
+        self.parquet_options = get_parquet_options(parquet_profile)
+        TABLES_DIR.mkdir(parents=True, exist_ok=True)
         self.table = table
         self.write_mode = write_mode
+        self.partition_by = partition_by
+
+    def _load_manifest(self) -> TableManifest:
+        """Returns the table's manifest, moving a table in the old single-file layout into a part file first.
+
+        The move is a single conditional commit: the old file is linked in as a part and version 0 is published
+        with an exclusive create. The old file is only deleted once that version exists, so another writer always
+        sees either the old file or the migrated table. When another writer commits version 0 first, or has
+        already moved the file, its manifest is used instead.
+        """
+        empty: TableManifest = {"version": 0, "parts": [], "obsolete": [], "partition_schema": {}}
+        manifest = read_manifest(self.table)
+        if manifest is not None:
+            return manifest
+        legacy_path = _get_legacy_table_path(self.table)
+        part_path = _new_part_path(self.table)
+        try:
+            os.link(legacy_path, part_path)
+            rows = pl.scan_parquet(part_path).select(pl.len()).collect().item()
+            schema = pl.read_parquet_schema(part_path)
+        except FileNotFoundError:
+            # Either the table is new or another writer moved it first, in which case its manifest is there now.
+            part_path.unlink(missing_ok=True)
+            return read_manifest(self.table) or empty
+        logging.info(f"Moving table {self.table} to the multi-file layout.")
+        manifest = {**empty, "parts": [_describe_part(part_path, rows, schema)], "committed_at": time.time()}
+        try:
+            _write_manifest(self.table, manifest)
+        except CommitConflictError:
+            _remove_part_file(self.table, part_path.name)
+            return read_manifest(self.table)
+        legacy_path.unlink(missing_ok=True)
+        return manifest
+
+    def _get_partition_schema(self, data: pl.DataFrame) -> Dict[str, str]:
+        """Works out the partition columns for a batch and checks they fit the table.
+
+        Args:
+            data (pl.DataFrame): The batch being written.
+        Returns:
+            Dict[str, str]: The partition columns and their types, or an empty dictionary for an unpartitioned write.
+        Raises:
+            ValueError: If the partition columns are missing, of a type that can't be partitioned on, or differ from
+                the partitioning of a table that is being appended to.
+        """
+        manifest = read_manifest(self.table)
+        current = manifest.get("partition_schema", {}) if manifest is not None else {}
+        partition_by = list(current) if self.partition_by is None else list(self.partition_by)
+        missing = [column for column in partition_by if column not in data.columns]
+        if missing:
+            raise ValueError(f"Partition columns not found in data: {missing}.")
+        if len(partition_by) == data.width:
+            raise ValueError("A table can't be partitioned by every one of its columns.")
+        partition_schema = {column: str(data.schema[column]) for column in partition_by}
+        unsupported = [column for column, dtype in partition_schema.items() if dtype not in PARTITION_TYPES]
+        if unsupported:
+            raise ValueError(f"Can't partition by {unsupported}. Partition columns must be one of {list(PARTITION_TYPES)}.")
+        if self.write_mode != "overwrite" and manifest is not None and manifest["parts"] and partition_schema != current:
+            raise ValueError(f"Table {self.table} is partitioned by {current or 'nothing'}, not {partition_schema or 'nothing'}. "
+                             "Overwrite the table to change its partitioning.")
+        if self.write_mode == "overwrite_partitions" and not partition_schema:
+            raise ValueError("overwrite_partitions needs a partitioned table.")
+        return partition_schema
+
+    def _write_part(self, data: pl.DataFrame, partition: Optional[Dict[str, str]] = None) -> TablePart:
+        """Writes a batch to a new part file in the table directory."""
+        part_path = _new_part_path(self.table, partition)
+        data.write_parquet(part_path, **self.parquet_options)
+        return _describe_part(part_path, data.height, data.schema, partition)
+
+    def _write_parts(self, data: pl.DataFrame, partition_schema: Dict[str, str]) -> List[TablePart]:
+        """Writes a batch as one part file per partition, leaving the partition columns out of the files."""
+        if not partition_schema:
+            return [self._write_part(data)]
+        columns = list(partition_schema)
+        parts = []
+        for values, partition_data in data.partition_by(columns, as_dict=True, maintain_order=True).items():
+            partition = {column: _format_partition_value(value) for column, value in zip(columns, values)}
+            parts.append(self._write_part(partition_data.drop(columns), partition))
+        return parts
+
+    def _read_part(self, part: TablePart, partition_schema: Dict[str, str]) -> pl.DataFrame:
+        """Reads one part file, with its partition columns."""
+        path = _get_table_dir(self.table) / part["path"]
+        if not partition_schema:
+            return pl.read_parquet(path)
+        hive_schema = {column: PARTITION_TYPES[dtype] for column, dtype in partition_schema.items()}
+        return pl.scan_parquet(path, hive_partitioning=True, hive_schema=hive_schema).collect()
+
+    def _merge(self, data: pl.DataFrame, partition_schema: Dict[str, str]) -> int:
+        """Upserts a batch by merge_keys, rewriting only the parts that hold rows with the batch's keys.
+
+        The key index (each part's key_ranges) rules most parts out without reading them, so a small upsert into a
+        big table reads and rewrites only a few files. Parts are rewritten without locking the table. If another write
+        replaced one of those parts in the meantime, or added a part that may hold the same keys, the merge starts
+        over from the new manifest. Otherwise it's committed on top of whatever else was committed.
 
-    def write(self, data: pl.DataFrame) -> None:
+        Returns the bytes of the parts the committed version added, the batch's and the rewritten ones.
+        """
+        keys = self.merge_keys
+        # When the batch has the same key more than once, its last row wins.
+        data = data.unique(subset=keys, keep="last", maintain_order=True)
+        incoming_ranges = {key: [_to_index_value(data[key].min()), _to_index_value(data[key].max())] for key in keys}
+        incoming_partitions = {key: {_format_partition_value(value) for value in data[key].to_list()} for key in keys if key in partition_schema}
+        incoming_keys = data.select(keys)
+        new_parts: List[TablePart] = []
+        replacements: Dict[str, List[TablePart]] = {}
+        try:
+            new_parts = self._write_parts(data, partition_schema)
+            new_parts = [{**part, "key_ranges": _get_key_ranges(self.table, part, keys)} for part in new_parts]
+
+            for attempt in range(MERGE_ATTEMPTS):
+                manifest = self._load_manifest()
+                indexed_parts: Dict[str, TablePart] = {}
+                rewritten_parts: List[TablePart] = []
+                replacements = {}
+                for part in manifest["parts"]:
+                    part = {**part, "key_ranges": _get_key_ranges(self.table, part, keys)}
+                    indexed_parts[part["path"]] = part
+                    if not _may_contain_keys(part, incoming_ranges, incoming_partitions):
+                        continue
+                    existing = self._read_part(part, partition_schema)
+                    matched_keys = incoming_keys.cast({key: existing.schema[key] for key in keys if key in existing.columns})
+                    remaining = existing.join(matched_keys, on=keys, how="anti")
+                    if remaining.height == existing.height:
+                        continue
+                    rewritten_parts.append(part)
+                    replacement_parts = [] if remaining.is_empty() else self._write_parts(remaining, partition_schema)
+                    replacements[part["path"]] = [{**new_part, "key_ranges": _get_key_ranges(self.table, new_part, keys)} for new_part in replacement_parts]
+                logging.info(f"Merging into table {self.table} rewrites {len(rewritten_parts)} of {len(manifest['parts'])} parts.")
+
+                # Appends of other keys that landed in the meantime don't conflict, so the merge is applied on top of them.
+                for _ in range(COMMIT_ATTEMPTS):
+                    latest = self._load_manifest()
+                    latest_paths = {part["path"] for part in latest["parts"]}
+                    known_paths = {part["path"] for part in manifest["parts"]}
+                    added_parts = [{**part, "key_ranges": _get_key_ranges(self.table, part, keys)} for part in latest["parts"] if part["path"] not in known_paths]
+                    conflict = any(part["path"] not in latest_paths for part in rewritten_parts) or any(
+                        _may_contain_keys(part, incoming_ranges, incoming_partitions) for part in added_parts)
+                    if conflict:
+                        break
+                    indexed_parts.update({part["path"]: part for part in added_parts})
+                    parts: List[TablePart] = []
+                    for part in latest["parts"]:
+                        parts.extend(replacements.get(part["path"], [indexed_parts.get(part["path"], part)]))
+                    try:
+                        _commit_manifest(self.table, latest, parts + new_parts, rewritten_parts, partition_schema)
+                        return sum(part["bytes"] for part in new_parts) + sum(part["bytes"] for replacement_parts in replacements.values() for part in replacement_parts)
+                    except CommitConflictError:
+                        continue
+                logging.info(f"Table {self.table} changed while merging into it. Starting the merge over (attempt {attempt + 1}).")
+                for replacement_parts in replacements.values():
+                    for part in replacement_parts:
+                        _remove_part_file(self.table, part["path"])
+                replacements = {}
+            raise RuntimeError(f"Gave up merging into table {self.table} after {MERGE_ATTEMPTS} attempts because it kept changing.")
+        except Exception:
+            # Nothing that was written for a merge that didn't commit is used by any version of the table.
+            for part in new_parts + [part for replacement_parts in replacements.values() for part in replacement_parts]:
+                _remove_part_file(self.table, part["path"])
+            raise
+
+    def _apply(self, manifest: TableManifest, new_parts: List[TablePart], partition_schema: Dict[str, str]) -> tuple[List[TablePart], List[TablePart], Dict[str, str]]:
+        """Works out the parts of the table's next version from its latest manifest, for _update_manifest."""
+        if self.write_mode != "overwrite" and manifest["parts"] and manifest.get("partition_schema", {}) != partition_schema:
+            raise ValueError(f"Table {self.table} was repartitioned while writing to it.")
+        if self.write_mode == "append":
+            logging.info("Appending data to existing table.")
+            return manifest["parts"] + new_parts, [], partition_schema
+        if self.write_mode == "overwrite":
+            logging.info("Overwriting existing table.")
+            return new_parts, manifest["parts"], partition_schema
+        replaced = [part["partition"] for part in new_parts]
+        removed_parts = [part for part in manifest["parts"] if part.get("partition", {}) in replaced]
+        logging.info(f"Overwriting {len(replaced)} partitions of existing table.")
+        kept_parts = [part for part in manifest["parts"] if part not in removed_parts]
+        return kept_parts + new_parts, removed_parts, partition_schema
+
+    def write(self, data: pl.DataFrame) -> Optional[Path]:
+        """Writes a batch to the table as a new part file and records it in the manifest.
+
+        Appending only writes the new batch, so its cost doesn't depend on the size of the table. Part files are
+        written without any lock and committed optimistically, so concurrent appends, from this process or any
+        other, run in parallel and none of them is lost.
+
+        Args:
+            data (pl.DataFrame): The data to write.
+        Returns:
+            Optional[Path]: The table directory, or None if there was nothing to write.
+        """
         logging.info("Writing data to table.")
         if data is None:
             logging.error("No data provided to write.")
@@ -213,27 +1806,132 @@ class TableWrite:
         elif data.is_empty():
             logging.warning("Empty data provided to write. No action will be taken.")
             return None
+        partition_schema = self._get_partition_schema(data)
+        if self.write_mode == "merge":
+            missing = [key for key in self.merge_keys if key not in data.columns]
+            if missing:
+                raise ValueError(f"Merge keys not found in data: {missing}.")
 
-        destination = Path("tables") / f"{self.table}.parquet"
+        destination = _get_table_dir(self.table)
+        memory = PeakMemory()
         try:
-            if self.write_mode == "append":
-                logging.info("Appending data to existing table.")
-                if destination.exists():
-                    existing_data = pl.read_parquet(destination)
-                    combined_data = pl.concat([existing_data, data], how="diagonal")
-                    combined_data.write_parquet(destination)
-                    return destination
-                else:
-                    data.write_parquet(destination)
+            with time_operation("table_write"), memory:
+                destination.mkdir(parents=True, exist_ok=True)
+                ROWS.inc(data.height, operation="table_write", direction="in")
+                if self.write_mode == "merge":
+                    with time_stage("table_write", "merge"):
+                        merged_bytes = self._merge(data, partition_schema)
+                    BYTES.inc(merged_bytes, operation="table_write", direction="out")
                     return destination
-            elif self.write_mode == "overwrite":
-                logging.info("Overwriting existing table.")
-                data.write_parquet(destination)
+                with time_stage("table_write", "write"):
+                    new_parts = self._write_parts(data, partition_schema)
+                BYTES.inc(sum(part["bytes"] for part in new_parts), operation="table_write", direction="out")
+                with time_stage("table_write", "commit"):
+                    try:
+                        self._load_manifest()
+                        _update_manifest(self.table, lambda manifest: self._apply(manifest, new_parts, partition_schema))
+                    except Exception:
+                        for part in new_parts:
+                            _remove_part_file(self.table, part["path"])
+                        raise
                 return destination
         except Exception as e:
             logging.error(f"Failed to write to table: {e}")
+            raise
+        finally:
+            if memory.peak_bytes is not None:
+                PEAK_MEMORY_BYTES.observe(memory.peak_bytes, operation="table_write")
  
 
+def _plan_compaction(parts: List[TablePart], target_file_size: int) -> List[List[TablePart]]:
+    """Groups runs of small parts in the same partition into batches of roughly the target size.
+
+    Within a partition only neighbouring parts are grouped so the row order doesn't change. Parts that are already
+    at least the target size are left alone, as are groups of one.
+    """
+    parts_by_partition: Dict[str, List[TablePart]] = {}
+    for part in parts:
+        parts_by_partition.setdefault(json.dumps(part.get("partition", {})), []).append(part)
+    groups: List[List[TablePart]] = []
+    for partition_parts in parts_by_partition.values():
+        groups.append([])
+        group_bytes = 0
+        for part in partition_parts:
+            if part["bytes"] >= target_file_size:
+                groups.append([])
+                group_bytes = 0
+                continue
+            if groups[-1] and group_bytes + part["bytes"] > target_file_size:
+                groups.append([])
+                group_bytes = 0
+            groups[-1].append(part)
+            group_bytes += part["bytes"]
+    return [group for group in groups if len(group) > 1]
+
+def compact_table(table: str, target_file_size: int = DEFAULT_TARGET_FILE_SIZE, sort_by: Optional[List[str]] = None,
+                  parquet_profile: Union[str, ParquetWriteOptions, None] = None) -> CompactResult:
+    """Merges a table's small part files into files of about target_file_size bytes.
+
+    The merged files are written first and then swapped in with a single manifest commit, so readers either see
+    the old parts or the new ones and never a mix. Appends that land while compaction runs are kept.
+
+    Args:
+        table (str): The name of the table.
+        target_file_size (int): The size in bytes that compacted files should grow to.
+        sort_by (Optional[List[str]]): Columns to sort each compacted file by.
+        parquet_profile (Union[str, ParquetWriteOptions, None]): How to write the compacted files, such as "fast-scan".
+    Returns:
+        CompactResult: How many parts the table had before and after, and how many were merged.
+    Raises:
+        FileNotFoundError: If the table doesn't exist.
+        ValueError: If the table name isn't valid.
+    """
+    _check_table_name(table)
+    logging.info(f"Compacting table {table}.")
+    parquet_options = get_parquet_options(parquet_profile)
+    manifest = read_manifest(table)
+    if manifest is None:
+        # Tables in the old layout are a single file, so there's nothing to merge.
+        parts_before = len(get_table_files(table))
+        return {"table": table, "parts_before": parts_before, "parts_after": parts_before, "compacted_parts": 0}
+
+    table_dir = _get_table_dir(table)
+    replacements = []
+    for group in _plan_compaction(manifest["parts"], target_file_size):
+        frame = pl.concat([pl.scan_parquet(table_dir / part["path"]) for part in group], how="diagonal")
+        if sort_by:
+            frame = frame.sort(sort_by)
+        partition = group[0].get("partition", {})
+        part_path = _new_part_path(table, partition)
+        frame.sink_parquet(part_path, **parquet_options)
+        rows = sum(part["rows"] for part in group)
+        replacements.append((group, _describe_part(part_path, rows, pl.read_parquet_schema(part_path), partition)))
+
+    def swap_in_merged_parts(latest: TableManifest) -> Optional[tuple[List[TablePart], List[TablePart], None]]:
+        parts = latest["parts"]
+        removed_parts: List[TablePart] = []
+        for group, new_part in replacements:
+            group_paths = [part["path"] for part in group]
+            current_paths = [part["path"] for part in parts]
+            if not set(group_paths) <= set(current_paths):
+                # The table was overwritten while we were compacting, so this merge is no longer needed.
+                continue
+            # The merged part takes the place of the group's first part.
+            parts = [new_part if part["path"] == group_paths[0] else part for part in parts if part["path"] not in group_paths[1:]]
+            removed_parts.extend(group)
+        return (parts, removed_parts, None) if removed_parts else None
+
+    committed = _update_manifest(table, swap_in_merged_parts)
+    parts = committed["parts"] if committed is not None else read_manifest(table)["parts"]
+    committed_paths = {part["path"] for part in parts}
+    merged_parts = [new_part for _, new_part in replacements if new_part["path"] in committed_paths]
+    for _, new_part in replacements:
+        if new_part["path"] not in committed_paths:
+            _remove_part_file(table, new_part["path"])
+    compacted_parts = sum(len(group) for group, new_part in replacements if new_part in merged_parts)
+    logging.info(f"Compacted {compacted_parts} parts of table {table} into {len(merged_parts)}.")
+    return {"table": table, "parts_before": len(manifest["parts"]), "parts_after": len(parts), "compacted_parts": compacted_parts}
+
 def main() -> Optional[Path]:
     READERS = {
         ".parquet": pl.read_parquet,
@@ -0,0 +1,193 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import math
+import threading
+import time
+
+LabelValues = Tuple[str, ...]
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+MEMORY_BUCKETS = tuple(2 ** power * 1024 * 1024 for power in range(4, 15))
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(label_names: Sequence[str], label_values: LabelValues, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(zip(label_names, label_values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric(ABC):
+    """Base class for metrics that keep one value, or set of values, per combination of label values."""
+    TYPE = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _get_label_values(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Metric {self.name} takes the labels {list(self.label_names)}, not {sorted(labels)}.")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    @abstractmethod
+    def _render_samples(self) -> List[str]:
+        pass
+
+    def render(self) -> List[str]:
+        """Returns the metric in the Prometheus text exposition format, one line per sample."""
+        with self._lock:
+            samples = self._render_samples()
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"] + samples
+
+class Counter(Metric):
+    """A value that only goes up, such as the number of rows written."""
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._get_label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._get_label_values(labels), 0)
+
+    def _render_samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in sorted(self._values.items())]
+
+class Gauge(Metric):
+    """A value that can go up and down, such as the size of a cache."""
+    TYPE = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._get_label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _render_samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in sorted(self._values.items())]
+
+class Histogram(Metric):
+    """Counts observations, such as latencies, into cumulative buckets so quantiles can be estimated across processes.
+
+    Args:
+        buckets (Sequence[float]): The upper bounds of the buckets. A +Inf bucket is always added.
+    """
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._get_label_values(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] = self._sums.get(key, 0) + value
+
+    def get_count(self, **labels: str) -> int:
+        with self._lock:
+            return sum(self._counts.get(self._get_label_values(labels), []))
+
+    def _render_samples(self) -> List[str]:
+        samples = []
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(f"{self.name}_bucket{_format_labels(self.label_names, key, {'le': _format_value(bound)})} {cumulative}")
+            samples.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(self._sums[key])}")
+            samples.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return samples
+
+class MetricsRegistry:
+    """Holds every metric the service records and renders them for a Prometheus scrape."""
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.label_names != metric.label_names:
+                    raise ValueError(f"Metric {metric.name} is already registered with a different type or labels.")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+METRICS = MetricsRegistry()
+
+OPERATION_SECONDS = METRICS.histogram("operation_duration_seconds", "Time taken by conversions, table writes and queries.", ["operation", "status"])
+STAGE_SECONDS = METRICS.histogram("stage_duration_seconds", "Time taken by each stage of an operation, such as read, write or serialize.", ["operation", "stage"])
+ROWS = METRICS.counter("rows_total", "Rows read or written by operations.", ["operation", "direction"])
+BYTES = METRICS.counter("bytes_total", "Bytes read or written by operations.", ["operation", "direction"])
+PEAK_MEMORY_BYTES = METRICS.histogram("peak_memory_bytes", "How far the resident memory of the process rose above where it started while an operation ran.", ["operation"], MEMORY_BUCKETS)
+
+@contextmanager
+def time_operation(operation: str) -> Iterator[None]:
+    """Records how long an operation took and whether it failed."""
+    start = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        OPERATION_SECONDS.observe(time.perf_counter() - start, operation=operation, status=status)
+
+@contextmanager
+def time_stage(operation: str, stage: str, timings: Optional[Dict[str, float]] = None) -> Iterator[None]:
+    """Records how long one stage of an operation took.
+
+    Args:
+        operation (str): The operation, such as "convert".
+        stage (str): The stage, such as "read".
+        timings (Optional[Dict[str, float]]): Also adds the seconds to this dictionary, for per-request profiles.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, operation=operation, stage=stage)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
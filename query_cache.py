@@ -0,0 +1,157 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple, TypedDict
+import logging
+import threading
+import polars as pl
+
+CacheKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+class QueryCacheStats(TypedDict):
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    entries: int
+    bytes: int
+    max_bytes: int
+
+def normalize_sql(sql: str) -> str:
+    """Collapses whitespace and drops a trailing semicolon so trivially different spellings of a query share a cache entry.
+
+    Text inside quotes is left alone, because changing a string literal would change the query.
+
+    Args:
+        sql (str): The SQL to normalize.
+    Returns:
+        str: The normalized SQL.
+    """
+    normalized = []
+    quote = None
+    pending_space = False
+    for char in sql.strip().rstrip(";").strip():
+        if quote is None and char.isspace():
+            pending_space = True
+            continue
+        if pending_space:
+            normalized.append(" ")
+            pending_space = False
+        if quote is None and char in ("'", '"'):
+            quote = char
+        elif char == quote:
+            quote = None
+        normalized.append(char)
+    return "".join(normalized)
+
+class QueryCache:
+    """In-process LRU cache of query results, bounded by the estimated size of the cached DataFrames.
+
+    Entries are keyed by the normalized SQL and the version of every table the query read. Looking up a table at a
+    new version drops the entries built from its older versions, so results go stale the moment a table changes.
+
+    Args:
+        max_bytes (int): The most memory the cached results may use.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[CacheKey, pl.DataFrame]" = OrderedDict()
+        self._entry_bytes: Dict[CacheKey, int] = {}
+        self._keys_by_table: Dict[str, Set[CacheKey]] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _make_key(sql: str, table_versions: Dict[str, str]) -> CacheKey:
+        return (normalize_sql(sql), tuple(sorted(table_versions.items())))
+
+    def _remove(self, key: CacheKey) -> None:
+        del self._entries[key]
+        self._bytes -= self._entry_bytes.pop(key)
+        for table, _ in key[1]:
+            self._keys_by_table[table].discard(key)
+
+    def _drop_stale(self, table_versions: Dict[str, str]) -> None:
+        for table, version in table_versions.items():
+            for key in list(self._keys_by_table.get(table, ())):
+                if dict(key[1])[table] != version:
+                    self._remove(key)
+                    self._invalidations += 1
+
+    def get(self, sql: str, table_versions: Dict[str, str]) -> Optional[pl.DataFrame]:
+        """Returns the cached result of a query, if there is one for these table versions.
+
+        Args:
+            sql (str): The query.
+            table_versions (Dict[str, str]): The current version of every table the query reads.
+        Returns:
+            Optional[pl.DataFrame]: The cached result, or None on a miss.
+        """
+        key = self._make_key(sql, table_versions)
+        with self._lock:
+            self._drop_stale(table_versions)
+            result = self._entries.get(key)
+            if result is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return result
+
+    def put(self, sql: str, table_versions: Dict[str, str], result: pl.DataFrame) -> None:
+        """Caches a query result, evicting the least recently used results to stay under max_bytes.
+
+        Results bigger than the whole cache aren't stored.
+
+        Args:
+            sql (str): The query.
+            table_versions (Dict[str, str]): The version of every table the query read.
+            result (pl.DataFrame): The query result.
+        """
+        size = result.estimated_size()
+        if size > self.max_bytes:
+            logging.info(f"Query result of {size} bytes is too big to cache.")
+            return
+        key = self._make_key(sql, table_versions)
+        with self._lock:
+            self._drop_stale(table_versions)
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and self._bytes + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+            self._entries[key] = result
+            self._entry_bytes[key] = size
+            self._bytes += size
+            for table, _ in key[1]:
+                self._keys_by_table.setdefault(table, set()).add(key)
+
+    def invalidate(self, table: str) -> int:
+        """Drops every cached result that read the given table.
+
+        Args:
+            table (str): The name of the table that changed.
+        Returns:
+            int: How many results were dropped.
+        """
+        with self._lock:
+            keys = list(self._keys_by_table.get(table, ()))
+            for key in keys:
+                self._remove(key)
+            self._invalidations += len(keys)
+            return len(keys)
+
+    def stats(self) -> QueryCacheStats:
+        """Returns the cache's hit, miss, eviction and invalidation counters and its current size."""
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -1,8 +1,15 @@
 from fastapi.testclient import TestClient
 from api import app
+from metrics import BYTES, PEAK_MEMORY_BYTES, ROWS
 import pytest
 import polars as pl
+import shutil
+import json
+import time
+import uuid
+import pyarrow as pa
 from pathlib import Path
+from datetime import datetime
 
 def test_convert_file(tmp_path):
     data = [
@@ -62,7 +69,9 @@ def test_save_to_table(tmp_path):
     assert response.status_code == 200
     destination = response.json()["destination"]
     assert (Path(destination)).exists()
-    Path(destination).unlink()
+    response = client.post("/query", json={"table_name": "test_table", "sql": "SELECT * FROM self"})
+    assert response.json()["result"] == data
+    shutil.rmtree(destination)
 
 def test_query_table(tmp_path):
     data = [
@@ -100,4 +109,526 @@ def test_query_table_invalid_sql(tmp_path):
     assert response.status_code == 500
     print(response.json())
     assert response.json()["detail"] == "sql parser error: Expected: an SQL statement, found: This at Line: 1, Column: 1"
-    destination.unlink()
\ No newline at end of file
+    destination.unlink()
+
+def test_query_missing_table():
+    client = TestClient(app)
+    response = client.post("/query", json={"table_name": "missing_table", "sql": "SELECT * FROM self"})
+    assert response.status_code == 404
+
+def test_compact_table(tmp_path):
+    client = TestClient(app)
+    for name in ["Alice", "Bob", "Charlie"]:
+        csv_path = tmp_path / "test.csv"
+        csv_path.write_text(f"name,age\n{name},30\n")
+        with open(csv_path, "rb") as f:
+            response = client.post("/savetable", data={"table_name": "test_table_compact", "write_mode": "append"}, files={"file": ("test.csv", f, "text/csv")})
+        destination = response.json()["destination"]
+    response = client.post("/tables/test_table_compact/compact", json={"sort_by": ["name"]})
+    assert response.status_code == 200
+    assert response.json()["parts_after"] == 1
+    response = client.post("/query", json={"table_name": "test_table_compact", "sql": "SELECT name FROM self"})
+    assert [row["name"] for row in response.json()["result"]] == ["Alice", "Bob", "Charlie"]
+    shutil.rmtree(destination)
+
+def test_compact_missing_table():
+    client = TestClient(app)
+    response = client.post("/tables/missing_table/compact")
+    assert response.status_code == 404
+
+def test_query_explain(tmp_path):
+    client = TestClient(app)
+    csv_path = tmp_path / "test.csv"
+    csv_path.write_text("name,age,city\nAlice,30,Leeds\nBob,25,York\n")
+    with open(csv_path, "rb") as f:
+        response = client.post("/savetable", data={"table_name": "test_table_explain", "write_mode": "overwrite"}, files={"file": ("test.csv", f, "text/csv")})
+    destination = response.json()["destination"]
+    response = client.post("/query", json={"table_name": "test_table_explain", "sql": "SELECT name FROM self WHERE age = 30", "explain": True})
+    assert response.status_code == 200
+    plan = response.json()["plan"]
+    assert "Parquet SCAN" in plan
+    assert "PROJECT 2/3 COLUMNS" in plan
+    assert "SELECTION" in plan
+    shutil.rmtree(destination)
+
+def save_numbers_table(tmp_path, table_name, rows):
+    csv_path = tmp_path / "numbers.csv"
+    pl.DataFrame({"n": list(range(rows)), "label": [f"row {i}" for i in range(rows)]}).write_csv(csv_path)
+    client = TestClient(app)
+    with open(csv_path, "rb") as f:
+        response = client.post("/savetable", data={"table_name": table_name, "write_mode": "overwrite"}, files={"file": ("numbers.csv", f, "text/csv")})
+    return response.json()["destination"]
+
+def test_query_ndjson(tmp_path):
+    destination = save_numbers_table(tmp_path, "test_table_ndjson", 25)
+    client = TestClient(app)
+    response = client.post("/query", json={"table_name": "test_table_ndjson", "sql": "SELECT * FROM self"}, headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["n"] for row in rows] == list(range(25))
+    shutil.rmtree(destination)
+
+def test_query_arrow(tmp_path):
+    destination = save_numbers_table(tmp_path, "test_table_arrow", 25)
+    client = TestClient(app)
+    response = client.post("/query", json={"table_name": "test_table_arrow", "sql": "SELECT n FROM self WHERE n >= 20", "format": "arrow"})
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column("n").to_pylist() == [20, 21, 22, 23, 24]
+    shutil.rmtree(destination)
+
+def test_query_arrow_empty_result(tmp_path):
+    destination = save_numbers_table(tmp_path, "test_table_arrow_empty", 5)
+    client = TestClient(app)
+    response = client.post("/query", json={"table_name": "test_table_arrow_empty", "sql": "SELECT n FROM self WHERE n > 100", "format": "arrow"})
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.num_rows == 0
+    assert table.column_names == ["n"]
+    shutil.rmtree(destination)
+
+def test_query_pagination(tmp_path):
+    destination = save_numbers_table(tmp_path, "test_table_pages", 25)
+    client = TestClient(app)
+    seen = []
+    cursor = None
+    while True:
+        response = client.post("/query", json={"table_name": "test_table_pages", "sql": "SELECT n FROM self", "limit": 10, "cursor": cursor})
+        assert response.status_code == 200
+        seen.extend(row["n"] for row in response.json()["result"])
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == list(range(25))
+    response = client.post("/query", json={"table_name": "test_table_pages", "sql": "SELECT n FROM self", "limit": 10, "format": "ndjson"})
+    response = client.post("/query", json={"table_name": "test_table_pages", "sql": "SELECT n FROM self", "limit": 10, "cursor": response.headers["x-next-cursor"], "format": "ndjson"})
+    assert [json.loads(line)["n"] for line in response.text.splitlines()] == list(range(10, 20))
+    assert "x-next-cursor" in response.headers
+    shutil.rmtree(destination)
+
+def test_query_pagination_reads_first_page_versions(tmp_path):
+    destination = save_numbers_table(tmp_path, "test_table_pinned_pages", 10)
+    client = TestClient(app)
+    query = {"table_name": "test_table_pinned_pages", "sql": "SELECT n FROM self ORDER BY n DESC", "limit": 5}
+    first = client.post("/query", json=query).json()
+    csv_path = tmp_path / "more.csv"
+    csv_path.write_text("n,label\n100,row 100\n")
+    with open(csv_path, "rb") as f:
+        client.post("/savetable", data={"table_name": "test_table_pinned_pages", "write_mode": "append"}, files={"file": ("more.csv", f, "text/csv")})
+    second = client.post("/query", json={**query, "cursor": first["next_cursor"]}).json()
+    # The appended row would sort first, so reading the latest version would repeat row 5.
+    assert [row["n"] for row in first["result"] + second["result"]] == list(range(9, -1, -1))
+    assert second["next_cursor"] is None
+    shutil.rmtree(destination)
+
+def test_query_pagination_stale_cursor(tmp_path):
+    destination = save_numbers_table(tmp_path, "test_table_stale_pages", 10)
+    client = TestClient(app)
+    query = {"table_name": "test_table_stale_pages", "sql": "SELECT n FROM self", "limit": 5}
+    cursor = client.post("/query", json=query).json()["next_cursor"]
+    shutil.rmtree(destination)
+    save_numbers_table(tmp_path, "test_table_stale_pages", 10)
+    response = client.post("/query", json={**query, "cursor": cursor})
+    assert response.status_code == 409
+    shutil.rmtree(destination)
+
+def test_query_invalid_format(tmp_path):
+    destination = save_numbers_table(tmp_path, "test_table_bad_format", 5)
+    client = TestClient(app)
+    response = client.post("/query", json={"table_name": "test_table_bad_format", "sql": "SELECT * FROM self", "format": "xml"})
+    assert response.status_code == 400
+    response = client.post("/query", json={"table_name": "test_table_bad_format", "sql": "SELECT * FROM self", "cursor": "abc"})
+    assert response.status_code == 400
+    shutil.rmtree(destination)
+
+def test_list_tables(tmp_path):
+    destination = save_numbers_table(tmp_path, "test_table_listed", 3)
+    client = TestClient(app)
+    response = client.get("/tables")
+    assert response.status_code == 200
+    assert "test_table_listed" in response.json()["tables"]
+    shutil.rmtree(destination)
+
+def test_query_cache(tmp_path):
+    destination = save_numbers_table(tmp_path, "test_table_cache", 5)
+    client = TestClient(app)
+    before = client.get("/query/cache").json()
+    query = {"table_name": "test_table_cache", "sql": "SELECT n FROM self WHERE n < 3"}
+    assert client.post("/query", json=query).json()["result"] == [{"n": 0}, {"n": 1}, {"n": 2}]
+    assert client.post("/query", json=query).json()["result"] == [{"n": 0}, {"n": 1}, {"n": 2}]
+    after = client.get("/query/cache").json()
+    assert after["hits"] == before["hits"] + 1
+    assert after["misses"] == before["misses"] + 1
+    csv_path = tmp_path / "more.csv"
+    csv_path.write_text("n,label\n-1,row -1\n")
+    with open(csv_path, "rb") as f:
+        client.post("/savetable", data={"table_name": "test_table_cache", "write_mode": "append"}, files={"file": ("more.csv", f, "text/csv")})
+    assert client.post("/query", json=query).json()["result"] == [{"n": 0}, {"n": 1}, {"n": 2}, {"n": -1}]
+    shutil.rmtree(destination)
+
+def test_query_cache_keys_self_table(tmp_path):
+    destinations = [save_numbers_table(tmp_path, "test_table_self_a", 3), save_numbers_table(tmp_path, "test_table_self_b", 1)]
+    client = TestClient(app)
+    # Both tables are named in the SQL, so the versions read are the same whichever one "self" is.
+    sql = "SELECT COUNT(*) AS c FROM self WHERE n NOT IN (SELECT n FROM test_table_self_a WHERE n < 0) AND n NOT IN (SELECT n FROM test_table_self_b WHERE n < 0)"
+    assert client.post("/query", json={"table_name": "test_table_self_a", "sql": sql}).json()["result"] == [{"c": 3}]
+    assert client.post("/query", json={"table_name": "test_table_self_b", "sql": sql}).json()["result"] == [{"c": 1}]
+    before = client.get("/query/cache").json()
+    assert client.post("/query", json={"table_name": "test_table_self_a", "sql": sql}).json()["result"] == [{"c": 3}]
+    assert client.get("/query/cache").json()["hits"] == before["hits"] + 1
+    for destination in destinations:
+        shutil.rmtree(destination)
+
+def test_query_join_tables(tmp_path):
+    client = TestClient(app)
+    people_path = tmp_path / "people.csv"
+    people_path.write_text("id,name\n1,Alice\n2,Bob\n")
+    orders_path = tmp_path / "orders.csv"
+    orders_path.write_text("person_id,amount\n1,10\n1,5\n2,7\n")
+    destinations = []
+    for table_name, path in [("test_people", people_path), ("test_orders", orders_path)]:
+        with open(path, "rb") as f:
+            response = client.post("/savetable", data={"table_name": table_name, "write_mode": "overwrite"}, files={"file": (path.name, f, "text/csv")})
+        destinations.append(response.json()["destination"])
+    sql = "SELECT p.name, SUM(o.amount) AS total FROM test_people p JOIN test_orders o ON p.id = o.person_id GROUP BY p.name ORDER BY p.name"
+    response = client.post("/query", json={"sql": sql})
+    assert response.status_code == 200
+    assert response.json()["result"] == [{"name": "Alice", "total": 15}, {"name": "Bob", "total": 7}]
+    response = client.post("/query", json={"table_name": "test_people", "sql": "SELECT name FROM self UNION ALL SELECT name FROM test_people"})
+    assert len(response.json()["result"]) == 4
+    response = client.get("/tables", params={"schema": True})
+    assert response.json()["schemas"]["test_orders"] == {"person_id": "Int64", "amount": "Int64"}
+    for destination in destinations:
+        shutil.rmtree(destination)
+
+def test_convert_file_large_upload_in_chunks(tmp_path, monkeypatch):
+    import api
+    monkeypatch.setattr(api, "UPLOAD_CHUNK_SIZE", 64)
+    csv_path = tmp_path / "test.csv"
+    data = pl.DataFrame({"n": list(range(1000)), "label": [f"row {i}" for i in range(1000)]})
+    data.write_csv(csv_path)
+    client = TestClient(app)
+    with open(csv_path, "rb") as f:
+        response = client.post("/convertfile", data={"output_format": ".parquet", "output_dir": str(tmp_path)}, files={"file": ("test.csv", f, "text/csv")})
+    assert response.status_code == 200
+    assert pl.read_parquet(response.json()["file_path"]).equals(data)
+    assert Path(response.json()["file_path"]).name.startswith("test_")
+
+def test_save_to_table_cleans_up_failed_upload(tmp_path):
+    csv_path = tmp_path / "test.txt"
+    csv_path.write_text("not a table")
+    uploads_before = set(Path("uploads").iterdir()) if Path("uploads").exists() else set()
+    client = TestClient(app)
+    with open(csv_path, "rb") as f:
+        response = client.post("/savetable", data={"table_name": "test_table_bad", "write_mode": "append"}, files={"file": ("test.txt", f, "text/plain")})
+    assert response.status_code == 400
+    assert set(Path("uploads").iterdir()) == uploads_before
+
+def test_conversion_job(tmp_path):
+    csv_path = tmp_path / "test.csv"
+    csv_path.write_text("name,age\nAlice,30\nBob,25\n")
+    client = TestClient(app)
+    with open(csv_path, "rb") as f:
+        response = client.post("/jobs", data={"output_format": ".parquet", "output_dir": str(tmp_path)}, files={"file": ("test.csv", f, "text/csv")})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    for _ in range(500):
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("succeeded", "failed"):
+            break
+        time.sleep(0.01)
+    assert job["status"] == "succeeded"
+    response = client.get(f"/jobs/{job_id}/result")
+    assert response.status_code == 200
+    result_path = tmp_path / "result.parquet"
+    result_path.write_bytes(response.content)
+    assert pl.read_parquet(result_path).to_dicts() == [{"name": "Alice", "age": 30}, {"name": "Bob", "age": 25}]
+
+def test_conversion_job_queue_full(tmp_path, monkeypatch):
+    import api
+    monkeypatch.setattr(api.job_queue, "max_pending", 0)
+    csv_path = tmp_path / "test.csv"
+    csv_path.write_text("name,age\nAlice,30\n")
+    client = TestClient(app)
+    with open(csv_path, "rb") as f:
+        response = client.post("/jobs", data={"output_format": ".parquet", "output_dir": str(tmp_path)}, files={"file": ("test.csv", f, "text/csv")})
+    assert response.status_code == 429
+
+def test_missing_job():
+    client = TestClient(app)
+    assert client.get("/jobs/missing").status_code == 404
+
+def test_log_events(tmp_path, monkeypatch):
+    import api
+    from events import EventBuffer
+    monkeypatch.setattr(api, "event_buffer", EventBuffer(tmp_path))
+    client = TestClient(app)
+    events = [{"event": "clicked", "timestamp": "2026-01-01T00:00:00", "metadata": {"button": i}} for i in range(3)]
+    response = client.post("/events", json=events)
+    assert response.status_code == 200
+    assert response.json() == {"accepted": 3}
+    response = client.post("/event", json=events[0])
+    assert response.status_code == 200
+    assert api.event_buffer.flush() == 4
+
+def test_query_events(tmp_path, monkeypatch):
+    import api
+    from events import EventBuffer
+    from main import TableCatalog
+    buffer = EventBuffer(tmp_path)
+    catalog = TableCatalog()
+    catalog.register("events", buffer.get_scan)
+    monkeypatch.setattr(api, "event_buffer", buffer)
+    monkeypatch.setattr(api, "catalog", catalog)
+    client = TestClient(app)
+    events = [{"event": "clicked", "timestamp": f"2026-01-0{day}T12:00:00", "metadata": {}} for day in (1, 2, 2)]
+    client.post("/events", json=events)
+    buffer.flush()
+    buffer.roll()
+    response = client.post("/query", json={"sql": "SELECT date, COUNT(*) AS clicks FROM events WHERE date >= '2026-01-02' GROUP BY date"})
+    assert response.status_code == 200
+    assert response.json()["result"] == [{"date": "2026-01-02", "clicks": 2}]
+    assert "events" in client.get("/tables").json()["tables"]
+
+def test_save_table_keeps_csv_schema_across_appends(tmp_path):
+    client = TestClient(app)
+    first = tmp_path / "first.csv"
+    first.write_text("id,score\n1,1.5\n")
+    second = tmp_path / "second.csv"
+    second.write_text("id,score\n2,3\n")
+    with open(first, "rb") as f:
+        response = client.post("/savetable", data={"table_name": "test_table_schema", "write_mode": "overwrite"}, files={"file": ("first.csv", f, "text/csv")})
+    destination = response.json()["destination"]
+    with open(second, "rb") as f:
+        response = client.post("/savetable", data={"table_name": "test_table_schema", "write_mode": "append"}, files={"file": ("second.csv", f, "text/csv")})
+    assert response.status_code == 200
+    response = client.post("/query", json={"table_name": "test_table_schema", "sql": "SELECT * FROM self ORDER BY id"})
+    assert response.json()["result"] == [{"id": 1, "score": 1.5}, {"id": 2, "score": 3.0}]
+    shutil.rmtree(destination)
+
+def test_convert_file_parquet_profile(tmp_path):
+    import pyarrow.parquet as pq
+    csv_path = tmp_path / "test.csv"
+    pl.DataFrame({"id": range(100)}).write_csv(csv_path)
+    client = TestClient(app)
+    with open(csv_path, "rb") as f:
+        response = client.post("/convertfile", data={"output_format": ".parquet", "output_dir": str(tmp_path), "parquet_profile": "fast-scan",
+                                                     "parquet_options": json.dumps({"compression": "gzip"})}, files={"file": ("test.csv", f, "text/csv")})
+    assert response.status_code == 200
+    metadata = pq.ParquetFile(response.json()["file_path"]).metadata
+    assert metadata.row_group(0).column(0).compression == "GZIP"
+    with open(csv_path, "rb") as f:
+        response = client.post("/savetable", data={"table_name": "test_table_profile", "write_mode": "overwrite", "parquet_profile": "tiny"}, files={"file": ("test.csv", f, "text/csv")})
+    assert response.status_code == 400
+
+def test_save_partitioned_table(tmp_path):
+    csv_path = tmp_path / "sales.csv"
+    pl.DataFrame({"region": ["north", "south", "north"], "amount": [1, 2, 3]}).write_csv(csv_path)
+    client = TestClient(app)
+    with open(csv_path, "rb") as f:
+        response = client.post("/savetable", data={"table_name": "test_table_regions", "write_mode": "overwrite", "partition_by": "region"}, files={"file": ("sales.csv", f, "text/csv")})
+    assert response.status_code == 200
+    destination = response.json()["destination"]
+    response = client.post("/query", json={"table_name": "test_table_regions", "sql": "SELECT SUM(amount) AS total FROM self WHERE region = 'north'"})
+    assert response.json()["result"] == [{"total": 4}]
+    response = client.get("/tables", params={"schema": True})
+    assert response.json()["partitions"]["test_table_regions"] == ["region"]
+    with open(csv_path, "rb") as f:
+        response = client.post("/savetable", data={"table_name": "test_table_regions", "write_mode": "append", "partition_by": "amount"}, files={"file": ("sales.csv", f, "text/csv")})
+    assert response.status_code == 400
+    shutil.rmtree(destination)
+
+def test_save_table_merge(tmp_path):
+    client = TestClient(app)
+    first = tmp_path / "first.csv"
+    pl.DataFrame({"id": [1, 2], "name": ["Alice", "Bob"]}).write_csv(first)
+    second = tmp_path / "second.csv"
+    pl.DataFrame({"id": [2, 3], "name": ["Robert", "Carol"]}).write_csv(second)
+    with open(first, "rb") as f:
+        response = client.post("/savetable", data={"table_name": "test_table_upsert", "write_mode": "overwrite"}, files={"file": ("first.csv", f, "text/csv")})
+    destination = response.json()["destination"]
+    with open(second, "rb") as f:
+        response = client.post("/savetable", data={"table_name": "test_table_upsert", "write_mode": "merge", "merge_keys": "id"}, files={"file": ("second.csv", f, "text/csv")})
+    assert response.status_code == 200
+    response = client.post("/query", json={"table_name": "test_table_upsert", "sql": "SELECT * FROM self ORDER BY id"})
+    assert response.json()["result"] == [{"id": 1, "name": "Alice"}, {"id": 2, "name": "Robert"}, {"id": 3, "name": "Carol"}]
+    with open(second, "rb") as f:
+        response = client.post("/savetable", data={"table_name": "test_table_upsert", "write_mode": "merge"}, files={"file": ("second.csv", f, "text/csv")})
+    assert response.status_code == 400
+    shutil.rmtree(destination)
+
+def test_convert_file_arrow_ipc(tmp_path):
+    ndjson_path = tmp_path / "test.ndjson"
+    pl.DataFrame({"name": ["Alice", "Bob"], "age": [30, 25]}).write_ndjson(ndjson_path)
+    client = TestClient(app)
+    with open(ndjson_path, "rb") as f:
+        response = client.post("/convertfile", data={"output_format": ".arrow", "output_dir": str(tmp_path)}, files={"file": ("test.ndjson", f, "application/x-ndjson")})
+    assert response.status_code == 200
+    assert pl.read_ipc(response.json()["file_path"])["age"].to_list() == [30, 25]
+
+def test_save_table_compressed_csv(tmp_path):
+    csv_path = tmp_path / "drop.csv.gz"
+    pl.DataFrame({"id": [1, 2], "name": ["Alice", "Bob"]}).write_csv(csv_path, compression="gzip")
+    client = TestClient(app)
+    with open(csv_path, "rb") as f:
+        response = client.post("/savetable", data={"table_name": "test_table_gzip", "write_mode": "overwrite"}, files={"file": ("drop.csv.gz", f, "application/gzip")})
+    assert response.status_code == 200
+    destination = response.json()["destination"]
+    response = client.post("/query", json={"table_name": "test_table_gzip", "sql": "SELECT name FROM self ORDER BY id"})
+    assert response.json()["result"] == [{"name": "Alice"}, {"name": "Bob"}]
+    shutil.rmtree(destination)
+
+def test_convert_file_cached(tmp_path):
+    csv_path = tmp_path / "cached.csv"
+    csv_path.write_text(f"id,note\n1,{uuid.uuid4().hex}\n")
+    client = TestClient(app)
+    before = client.get("/conversions/cache").json()
+    responses = []
+    for _ in range(2):
+        with open(csv_path, "rb") as f:
+            responses.append(client.post("/convertfile", data={"output_format": ".parquet", "output_dir": str(tmp_path)}, files={"file": ("cached.csv", f, "text/csv")}).json())
+    assert [response["cached"] for response in responses] == [False, True]
+    assert responses[0]["file_path"] == responses[1]["file_path"]
+    after = client.get("/conversions/cache").json()
+    assert after["hits"] == before["hits"] + 1
+    assert after["misses"] == before["misses"] + 1
+
+def test_save_table_repeated_overwrite_is_skipped(tmp_path):
+    csv_path = tmp_path / "repeat.csv"
+    pl.DataFrame({"id": [1, 2]}).write_csv(csv_path)
+    client = TestClient(app)
+    responses = []
+    for write_mode in ["overwrite", "overwrite", "append", "overwrite"]:
+        with open(csv_path, "rb") as f:
+            responses.append(client.post("/savetable", data={"table_name": "test_table_repeat", "write_mode": write_mode}, files={"file": ("repeat.csv", f, "text/csv")}).json())
+    assert [response["cached"] for response in responses] == [False, True, False, False]
+    response = client.post("/query", json={"table_name": "test_table_repeat", "sql": "SELECT COUNT(*) AS n FROM self"})
+    assert response.json()["result"] == [{"n": 2}]
+    shutil.rmtree(responses[0]["destination"])
+
+def test_query_profile_and_metrics(tmp_path):
+    csv_path = tmp_path / "profiled.csv"
+    pl.DataFrame({"id": [1, 2, 3]}).write_csv(csv_path)
+    client = TestClient(app)
+    with open(csv_path, "rb") as f:
+        destination = client.post("/savetable", data={"table_name": "test_table_profile", "write_mode": "overwrite"}, files={"file": ("profiled.csv", f, "text/csv")}).json()["destination"]
+    sql = f"SELECT SUM(id) AS total FROM self WHERE id > {uuid.uuid4().int % 1000 - 1000}"
+    response = client.post("/query", json={"table_name": "test_table_profile", "sql": sql, "profile": True})
+    body = response.json()
+    assert body["result"] == [{"total": 6}]
+    assert set(body["profile"]["stages"]) == {"plan", "execute", "serialize"}
+    assert body["profile"]["nodes"]
+    response = client.post("/query", json={"table_name": "test_table_profile", "sql": sql, "profile": True, "format": "ndjson"})
+    assert response.status_code == 400
+    metrics = client.get("/metrics")
+    assert metrics.headers["content-type"].startswith("text/plain")
+    assert 'operation_duration_seconds_count{operation="query",status="ok"}' in metrics.text
+    assert 'stage_duration_seconds_bucket{operation="table_write",stage="commit",le="+Inf"}' in metrics.text
+    assert 'cache_stats{cache="conversion",stat="hits"}' in metrics.text
+    shutil.rmtree(destination)
+
+def test_query_metrics(tmp_path):
+    csv_path = tmp_path / "measured.csv"
+    pl.DataFrame({"id": [1, 2, 3]}).write_csv(csv_path)
+    client = TestClient(app)
+    with open(csv_path, "rb") as f:
+        destination = client.post("/savetable", data={"table_name": "test_table_query_metrics", "write_mode": "overwrite"}, files={"file": ("measured.csv", f, "text/csv")}).json()["destination"]
+    rows_before = ROWS.get(operation="query", direction="out")
+    bytes_before = BYTES.get(operation="query", direction="out")
+    measured_before = PEAK_MEMORY_BYTES.get_count(operation="query")
+    sql = f"SELECT id FROM self WHERE id > {uuid.uuid4().int % 1000 - 1000}"
+    streamed = client.post("/query", json={"table_name": "test_table_query_metrics", "sql": sql, "format": "ndjson"})
+    assert ROWS.get(operation="query", direction="out") == rows_before + 3
+    assert BYTES.get(operation="query", direction="out") == bytes_before + len(streamed.content)
+    assert PEAK_MEMORY_BYTES.get_count(operation="query") == measured_before + 1
+    client.post("/query", json={"table_name": "test_table_query_metrics", "sql": sql})
+    assert ROWS.get(operation="query", direction="out") == rows_before + 6
+    assert BYTES.get(operation="query", direction="out") == bytes_before + len(streamed.content) + pl.DataFrame({"id": [1, 2, 3]}).estimated_size()
+    assert PEAK_MEMORY_BYTES.get_count(operation="query") == measured_before + 2
+    shutil.rmtree(destination)
+
+def test_convert_file_profile(tmp_path):
+    csv_path = tmp_path / "profiled.csv"
+    csv_path.write_text(f"id,note\n1,{uuid.uuid4().hex}\n")
+    client = TestClient(app)
+    with open(csv_path, "rb") as f:
+        response = client.post("/convertfile", data={"output_format": ".parquet", "output_dir": str(tmp_path), "profile": "true"}, files={"file": ("profiled.csv", f, "text/csv")})
+    assert set(response.json()["profile"]["stages"]) == {"upload", "read", "write"}
+
+def test_get_table_stats(tmp_path):
+    csv_path = tmp_path / "stats.csv"
+    pl.DataFrame({"id": [1, 2, 3], "name": ["a", None, "c"]}).write_csv(csv_path)
+    client = TestClient(app)
+    with open(csv_path, "rb") as f:
+        destination = client.post("/savetable", data={"table_name": "test_table_stats_api", "write_mode": "overwrite"}, files={"file": ("stats.csv", f, "text/csv")}).json()["destination"]
+    stats = client.get("/tables/test_table_stats_api").json()
+    assert (stats["rows"], stats["files"], stats["row_groups"]) == (3, 1, 1)
+    assert stats["columns"]["id"] == {"min": 1, "max": 3, "null_count": 0}
+    assert stats["columns"]["name"]["null_count"] == 1
+    assert client.get("/tables", params={"stats": True}).json()["stats"]["test_table_stats_api"] == stats
+    assert client.get("/tables/missing_table").status_code == 404
+    shutil.rmtree(destination)
+
+def test_query_time_travel_and_rollback(tmp_path):
+    client = TestClient(app)
+    destination = None
+    for ids in [[1, 2], [3]]:
+        csv_path = tmp_path / "versions.csv"
+        pl.DataFrame({"id": ids}).write_csv(csv_path)
+        with open(csv_path, "rb") as f:
+            destination = client.post("/savetable", data={"table_name": "test_table_versions", "write_mode": "overwrite"}, files={"file": ("versions.csv", f, "text/csv")}).json()["destination"]
+    history = client.get("/tables/test_table_versions/history").json()["versions"]
+    first = history[-1]
+    sql = "SELECT id FROM self ORDER BY id"
+    response = client.post("/query", json={"table_name": "test_table_versions", "sql": sql, "version": first["version"]})
+    assert response.json()["result"] == [{"id": 1}, {"id": 2}]
+    # A point between the two overwrites.
+    timestamp = datetime.fromtimestamp((first["committed_at"] + history[-2]["committed_at"]) / 2).isoformat()
+    response = client.post("/query", json={"sql": "SELECT COUNT(*) AS n FROM test_table_versions", "timestamp": timestamp})
+    assert response.json()["result"] == [{"n": 2}]
+    assert client.post("/query", json={"table_name": "test_table_versions", "sql": sql}).json()["result"] == [{"id": 3}]
+    assert client.post("/query", json={"table_name": "test_table_versions", "sql": sql, "version": 10_000}).status_code == 404
+
+    response = client.post("/tables/test_table_versions/rollback", json={"version": first["version"]})
+    assert response.json()["restored_version"] == first["version"]
+    assert client.post("/query", json={"table_name": "test_table_versions", "sql": sql}).json()["result"] == [{"id": 1}, {"id": 2}]
+    assert client.post("/tables/test_table_versions/vacuum", json={"retention_hours": 1}).json()["files_removed"] == 0
+    shutil.rmtree(destination)
+
+def test_save_table_merge_missing_keys(tmp_path):
+    csv_path = tmp_path / "merge_keys.csv"
+    pl.DataFrame({"id": [1]}).write_csv(csv_path)
+    client = TestClient(app)
+    with open(csv_path, "rb") as f:
+        response = client.post("/savetable", data={"table_name": "test_table_merge_keys", "write_mode": "merge", "merge_keys": "nope"}, files={"file": ("merge_keys.csv", f, "text/csv")})
+    assert response.status_code == 400
+    shutil.rmtree(Path("tables") / "test_table_merge_keys", ignore_errors=True)
+
+@pytest.mark.parametrize("table_name", [".", ".."])
+def test_save_table_invalid_name(tmp_path, table_name):
+    csv_path = tmp_path / "bad_name.csv"
+    csv_path.write_text("id\n1\n")
+    client = TestClient(app)
+    with open(csv_path, "rb") as f:
+        response = client.post("/savetable", data={"table_name": table_name, "write_mode": "append"}, files={"file": ("bad_name.csv", f, "text/csv")})
+    assert response.status_code == 400
+    assert not (Path("tables") / table_name / "_manifest").exists()
+
+def test_convert_file_after_restart(tmp_path):
+    csv_path = tmp_path / "restart.csv"
+    csv_path.write_text(f"id,note\n1,{uuid.uuid4().hex}\n")
+    for _ in range(2):
+        with TestClient(app) as client:
+            with open(csv_path, "rb") as f:
+                response = client.post("/convertfile", data={"output_format": ".parquet", "output_dir": str(tmp_path)}, files={"file": ("restart.csv", f, "text/csv")})
+            assert response.status_code == 200
+
+def test_conversion_job_after_restart(tmp_path):
+    csv_path = tmp_path / "test.csv"
+    csv_path.write_text("name,age\nAlice,30\nBob,25\n")
+    for _ in range(2):
+        with TestClient(app) as client:
+            with open(csv_path, "rb") as f:
+                response = client.post("/jobs", data={"output_format": ".parquet", "output_dir": str(tmp_path)}, files={"file": ("test.csv", f, "text/csv")})
+            assert response.status_code == 202
@@ -0,0 +1,55 @@
+from conversion_cache import ConversionCache, make_cache_key, place_cached_output
+
+def test_make_cache_key():
+    key = make_cache_key("abc", ".csv", ".parquet", {"parquet_profile": "fast-scan"})
+    assert key == make_cache_key("abc", ".csv", ".parquet", {"parquet_profile": "fast-scan"})
+    assert key != make_cache_key("abc", ".csv", ".parquet", {"parquet_profile": "small-files"})
+    assert key != make_cache_key("abc", ".ndjson", ".parquet", {"parquet_profile": "fast-scan"})
+
+def test_conversion_cache_hit_and_miss(tmp_path):
+    cache = ConversionCache(tmp_path / "cache", max_bytes=1024)
+    output_path = tmp_path / "out.parquet"
+    output_path.write_bytes(b"x" * 10)
+    assert cache.get("k") is None
+    cached_path = cache.put("k", output_path)
+    output_path.unlink()
+    assert cache.get("k") == cached_path
+    assert cached_path.read_bytes() == b"x" * 10
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"], stats["bytes"]) == (1, 1, 0.5, 10)
+
+def test_conversion_cache_evicts_least_recently_used(tmp_path):
+    cache = ConversionCache(tmp_path / "cache", max_bytes=25)
+    for key in ["a", "b"]:
+        output_path = tmp_path / f"{key}.csv"
+        output_path.write_bytes(b"x" * 10)
+        cache.put(key, output_path)
+    cache.get("a")
+    output_path = tmp_path / "c.csv"
+    output_path.write_bytes(b"x" * 10)
+    cache.put("c", output_path)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+    # Entries on disk survive a restart.
+    assert ConversionCache(tmp_path / "cache", max_bytes=25).get("c") is not None
+
+def test_place_cached_output(tmp_path):
+    cache = ConversionCache(tmp_path / "cache", max_bytes=1024)
+    output_path = tmp_path / "data" / "out.csv"
+    output_path.parent.mkdir()
+    output_path.write_text("a\n1\n")
+    cached_path = cache.put("k", output_path)
+    assert place_cached_output(cached_path, tmp_path / "data") == output_path
+    placed_path = place_cached_output(cached_path, tmp_path / "elsewhere")
+    assert placed_path == tmp_path / "elsewhere" / "out.csv"
+    assert placed_path.read_text() == "a\n1\n"
+
+def test_repeated_table_write(tmp_path):
+    cache = ConversionCache(tmp_path / "cache", max_bytes=1024)
+    assert not cache.is_repeated_table_write("t", "k", "1")
+    cache.record_table_write("t", "k", "1")
+    assert cache.is_repeated_table_write("t", "k", "1")
+    assert not cache.is_repeated_table_write("t", "k", "2")
+    assert not cache.is_repeated_table_write("t", "other", "1")
+    assert cache.stats()["repeated_table_writes"] == 1
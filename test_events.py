@@ -0,0 +1,99 @@
+import asyncio
+import json
+import polars as pl
+
+from events import EventBuffer
+
+def make_event(i):
+    return {"event": "clicked", "timestamp": f"2026-01-01T00:00:{i:02d}", "metadata": {"button": i}}
+
+def test_event_buffer_flushes_in_one_batch(tmp_path):
+    buffer = EventBuffer(tmp_path)
+    buffer.add_many([make_event(i) for i in range(3)])
+    assert not buffer.log_path.exists()
+    assert buffer.flush() == 3
+    assert buffer.flush() == 0
+    lines = buffer.log_path.read_text().splitlines()
+    assert [json.loads(line) for line in lines] == [make_event(i) for i in range(3)]
+
+def test_event_buffer_drops_oldest_when_full(tmp_path):
+    buffer = EventBuffer(tmp_path, capacity=2)
+    for i in range(5):
+        buffer.add(make_event(i))
+    assert buffer.dropped == 3
+    buffer.flush()
+    assert [json.loads(line)["metadata"]["button"] for line in buffer.log_path.read_text().splitlines()] == [3, 4]
+
+def test_event_buffer_rolls_into_date_partitions(tmp_path):
+    buffer = EventBuffer(tmp_path)
+    buffer.add_many([
+        {"event": "clicked", "timestamp": "2026-01-01T10:00:00Z", "metadata": {"button": 1}},
+        {"event": "clicked", "timestamp": "2026-01-02T10:00:00Z", "metadata": {"button": 2}},
+        {"event": "viewed", "timestamp": "2026-01-02T11:00:00Z", "metadata": {}},
+    ])
+    buffer.flush()
+    version_before, _ = buffer.get_scan()
+    parquet_paths = buffer.roll()
+    assert not buffer.log_path.exists()
+    assert sorted(path.parent.name for path in parquet_paths) == ["date=2026-01-01", "date=2026-01-02"]
+    version, scan = buffer.get_scan()
+    assert version != version_before
+    events = scan.sort("timestamp").collect()
+    assert events["event"].to_list() == ["clicked", "clicked", "viewed"]
+    assert json.loads(events["metadata"][0]) == {"button": 1}
+    assert buffer.roll() == []
+
+def test_event_table_prunes_partitions(tmp_path):
+    buffer = EventBuffer(tmp_path)
+    buffer.add_many([make_event(i) | {"timestamp": f"2026-01-{i + 1:02d}T00:00:00"} for i in range(5)])
+    buffer.flush()
+    buffer.roll()
+    _, scan = buffer.get_scan()
+    query = scan.sql("SELECT event FROM self WHERE date = '2026-01-03'")
+    plan = query.explain()
+    assert "date=2026-01-03" in plan
+    assert "date=2026-01-01" not in plan
+    assert query.collect().height == 1
+
+def test_event_table_empty(tmp_path):
+    _, scan = EventBuffer(tmp_path).get_scan()
+    assert scan.collect().columns == ["event", "timestamp", "metadata", "date"]
+
+def test_event_buffer_run_flushes_by_size(tmp_path):
+    async def scenario():
+        buffer = EventBuffer(tmp_path, flush_size=2, flush_interval=60)
+        task = asyncio.create_task(buffer.run())
+        buffer.add_many([make_event(0), make_event(1)])
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if buffer.log_path.exists():
+                break
+        buffer.add(make_event(2))
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return buffer
+    buffer = asyncio.run(scenario())
+    assert len(buffer.log_path.read_text().splitlines()) == 3
+
+def test_event_buffer_runs_again_on_a_new_event_loop(tmp_path):
+    buffer = EventBuffer(tmp_path, flush_size=1, flush_interval=60)
+
+    async def scenario(event):
+        task = asyncio.create_task(buffer.run())
+        await asyncio.sleep(0)
+        buffer.add(event)
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if buffer.log_path.exists() and len(buffer.log_path.read_text().splitlines()) == event["metadata"]["button"] + 1:
+                break
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    for i in range(2):
+        asyncio.run(scenario(make_event(i)))
+    assert len(buffer.log_path.read_text().splitlines()) == 2
@@ -0,0 +1,114 @@
+import json
+from datetime import datetime
+import time
+import pytest
+import polars as pl
+
+from jobs import JobQueue, QueueFullError
+
+def wait_for(queue, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] not in JobQueue.ACTIVE_STATUSES:
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(f"Job {job_id} didn't finish.")
+
+def test_job_queue_converts_file(tmp_path):
+    data = pl.DataFrame({"name": ["Alice", "Bob"], "age": [30, 25]})
+    csv_path = tmp_path / "test.csv"
+    data.write_csv(csv_path)
+    queue = JobQueue(tmp_path / "jobs")
+    job = queue.submit(csv_path, ".parquet", output_dir=str(tmp_path / "out"))
+    job = wait_for(queue, job["job_id"])
+    assert job["status"] == "succeeded"
+    assert pl.read_parquet(job["output_path"]).equals(data)
+    with open(tmp_path / "jobs" / f"{job['job_id']}.json") as f:
+        assert json.load(f)["status"] == "succeeded"
+    queue.shutdown()
+
+def test_job_queue_records_failure(tmp_path):
+    queue = JobQueue(tmp_path / "jobs")
+    job = queue.submit(tmp_path / "missing.csv", ".parquet", output_dir=str(tmp_path / "out"))
+    job = wait_for(queue, job["job_id"])
+    assert job["status"] == "failed"
+    assert "File not found" in job["error_message"]
+    queue.shutdown()
+
+def test_job_queue_rejects_work_beyond_capacity(tmp_path):
+    queue = JobQueue(tmp_path / "jobs", max_workers=1, max_pending=0)
+    with pytest.raises(QueueFullError):
+        queue.submit(tmp_path / "test.csv", ".parquet")
+    queue.shutdown()
+
+def test_job_queue_runs_again_after_start(tmp_path):
+    data = pl.DataFrame({"name": ["Alice", "Bob"], "age": [30, 25]})
+    csv_path = tmp_path / "test.csv"
+    data.write_csv(csv_path)
+    queue = JobQueue(tmp_path / "jobs")
+    queue.shutdown()
+    queue.start()
+    job = queue.submit(csv_path, ".parquet", output_dir=str(tmp_path / "out"))
+    assert wait_for(queue, job["job_id"])["status"] == "succeeded"
+    queue.shutdown()
+
+def write_job(jobs_dir, job_id, input_path, status="running", finished_at=None):
+    job = {
+        "job_id": job_id, "status": status, "input_path": str(input_path), "output_extension": ".parquet",
+        "output_dir": str(jobs_dir.parent / "out"), "streaming": False, "remove_when_done": None,
+        "created_at": "2026-01-01T00:00:00", "started_at": "2026-01-01T00:00:01", "finished_at": finished_at,
+        "output_path": None, "error_message": None, "peak_memory_bytes": None,
+    }
+    (jobs_dir / f"{job_id}.json").write_text(json.dumps(job))
+
+def test_job_queue_skips_jobs_claimed_by_another_process(tmp_path):
+    csv_path = tmp_path / "test.csv"
+    pl.DataFrame({"name": ["Alice"], "age": [30]}).write_csv(csv_path)
+    jobs_dir = tmp_path / "jobs"
+    jobs_dir.mkdir()
+    write_job(jobs_dir, "interrupted", csv_path)
+    # Another queue on the same directory stands in for another worker process that is running the job.
+    other = JobQueue(jobs_dir)
+    assert other._claim("interrupted")
+    queue = JobQueue(jobs_dir)
+    queue.start()
+    assert queue.get("interrupted") is None
+    other._release("interrupted")
+    queue.start()
+    assert wait_for(queue, "interrupted")["status"] == "succeeded"
+    other.shutdown()
+    queue.shutdown()
+
+def test_job_queue_removes_expired_jobs(tmp_path):
+    jobs_dir = tmp_path / "jobs"
+    jobs_dir.mkdir()
+    write_job(jobs_dir, "old", tmp_path / "old.csv", status="succeeded", finished_at="2026-01-01T00:00:02")
+    write_job(jobs_dir, "recent", tmp_path / "recent.csv", status="succeeded", finished_at=datetime.now().isoformat())
+    queue = JobQueue(jobs_dir, retention_seconds=60 * 60)
+    queue.start()
+    assert queue.get("old") is None
+    assert not (jobs_dir / "old.json").exists()
+    assert queue.get("recent")["status"] == "succeeded"
+    queue.shutdown()
+
+def test_job_queue_requeues_unfinished_jobs_after_restart(tmp_path):
+    data = pl.DataFrame({"name": ["Alice"], "age": [30]})
+    csv_path = tmp_path / "test.csv"
+    data.write_csv(csv_path)
+    jobs_dir = tmp_path / "jobs"
+    jobs_dir.mkdir()
+    for job_id, input_path in [("interrupted", csv_path), ("lost", tmp_path / "gone.csv")]:
+        job = {
+            "job_id": job_id, "status": "running", "input_path": str(input_path), "output_extension": ".parquet",
+            "output_dir": str(tmp_path / "out"), "streaming": False, "remove_when_done": None,
+            "created_at": "2026-01-01T00:00:00", "started_at": "2026-01-01T00:00:01", "finished_at": None,
+            "output_path": None, "error_message": None, "peak_memory_bytes": None,
+        }
+        (jobs_dir / f"{job_id}.json").write_text(json.dumps(job))
+    queue = JobQueue(jobs_dir)
+    assert queue.get("interrupted") is None
+    queue.start()
+    assert wait_for(queue, "interrupted")["status"] == "succeeded"
+    assert queue.get("lost")["status"] == "failed"
+    queue.shutdown()
@@ -1,9 +1,17 @@
 import pytest
 import polars as pl
+import shutil
 
-from main import ParquetWrite, CsvWrite, ParquetRead, CsvRead, FileConverter, batch_convert, TableWrite
+from main import PeakMemory, ParquetWrite, CsvWrite, ParquetRead, CsvRead, FileConverter, batch_convert, TableWrite, read_table, read_manifest, compact_table, get_table_version, TableCatalog, SchemaCache, PARQUET_PROFILES, scan_table, get_file_extension, get_table_stats, CommitConflictError, _commit_manifest, get_table_history, get_table_version_at, rollback_table, vacuum_table
 
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import main
+import json
+from datetime import date
+from metrics import BYTES, PEAK_MEMORY_BYTES, ROWS
+
+MEASURES_MEMORY = main._get_rss_bytes() is not None
 
 def test_parquet_write(tmp_path):
     data = [
@@ -45,6 +53,40 @@ def test_csv_write_empty_data(tmp_path):
     writer = CsvWrite(input_filename="output", output_dir=tmp_path)
     assert writer.write(data) is None
 
+def test_parquet_write_dataframe(tmp_path):
+    data = pl.DataFrame([
+        {"name": "Alice", "age": 30},
+        {"name": "Bob", "age": 25}
+    ])
+    writer = ParquetWrite(input_filename="output", output_dir=tmp_path)
+    filename = writer.write(data)
+    assert pl.read_parquet(filename).equals(data)
+
+def test_parquet_write_empty_dataframe(tmp_path):
+    writer = ParquetWrite(input_filename="output", output_dir=tmp_path)
+    assert writer.write(pl.DataFrame([])) is None
+
+def test_csv_write_lazyframe(tmp_path):
+    data = pl.DataFrame([
+        {"name": "Alice", "age": 30},
+        {"name": "Bob", "age": 25}
+    ])
+    writer = CsvWrite(input_filename="output", output_dir=tmp_path)
+    filename = writer.write(data.lazy())
+    assert pl.read_csv(filename).equals(data)
+
+def test_parquet_write_arrow_table(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    table = pa.table({"name": ["Alice", "Bob"], "age": [30, 25]})
+    writer = ParquetWrite(input_filename="output", output_dir=tmp_path)
+    filename = writer.write(table)
+    assert pl.read_parquet(filename).equals(pl.from_arrow(table))
+
+def test_write_keeps_arrow_chunks():
+    pa = pytest.importorskip("pyarrow")
+    table = pa.concat_tables([pa.table({"age": [30]}), pa.table({"age": [25]})])
+    assert ParquetWrite._to_frame(table).n_chunks() == 2
+
 def test_parquet_read(tmp_path):
     data = [
         {"name": "Alice", "age": 30},
@@ -99,6 +141,44 @@ def test_file_converter_parquet_to_csv(tmp_path):
     csv_filename = converter.convert()
     assert pl.read_csv(csv_filename).equals(pl.DataFrame(data))
 
+def test_file_converter_streaming_csv_to_parquet(tmp_path):
+    data = [
+        {"name": "Alice", "age": 30},
+        {"name": "Bob", "age": 25}
+    ]
+    csv_filename = tmp_path / "test.csv"
+    pl.DataFrame(data).write_csv(csv_filename)
+    converter = FileConverter(input_path=csv_filename, output_extension=".parquet", output_dir=tmp_path)
+    parquet_filename = converter.convert(streaming=True)
+    assert pl.read_parquet(parquet_filename).equals(pl.DataFrame(data))
+    assert (converter.peak_memory_bytes is not None) == MEASURES_MEMORY
+
+@pytest.mark.skipif(not MEASURES_MEMORY, reason="Resident memory can only be measured through /proc.")
+def test_peak_memory_is_relative_to_entry():
+    with PeakMemory() as memory:
+        data = b"x" * (64 * 1024 * 1024)
+    assert 32 * 1024 * 1024 < memory.peak_bytes < 128 * 1024 * 1024
+    del data
+
+@pytest.mark.parametrize("extension", [".parquet", ".csv", ".csv.gz", ".csv.zst", ".jsonl", ".arrow", ".avro"])
+def test_file_converter_streaming_counts_rows(tmp_path, extension):
+    ndjson_filename = tmp_path / "test.ndjson"
+    pl.DataFrame({"name": ["Alice", "Bob", "Carol"], "age": [30, 25, 41]}).write_ndjson(ndjson_filename)
+    rows_before = ROWS.get(operation="convert", direction="out")
+    FileConverter(input_path=ndjson_filename, output_extension=extension, output_dir=tmp_path / "out").convert(streaming=True)
+    assert ROWS.get(operation="convert", direction="out") == rows_before + 3
+
+def test_file_converter_streaming_parquet_to_csv(tmp_path):
+    data = [
+        {"name": "Alice", "age": 30},
+        {"name": "Bob", "age": 25}
+    ]
+    parquet_filename = tmp_path / "test.parquet"
+    pl.DataFrame(data).write_parquet(parquet_filename)
+    converter = FileConverter(input_path=parquet_filename, output_extension=".csv", output_dir=tmp_path)
+    csv_filename = converter.convert(streaming=True)
+    assert pl.read_csv(csv_filename).equals(pl.DataFrame(data))
+
 def test_file_converter_same_format(tmp_path):
     data = [
         {"name": "Alice", "age": 30},
@@ -156,6 +236,18 @@ def test_batch_file_converter(tmp_path):
     assert results[1]["success"] is True
     assert pl.read_csv(results[1]["output_path"]).equals(pl.DataFrame(data2))
     
+def test_batch_file_converter_streaming(tmp_path):
+    data = [
+        {"name": "Alice", "age": 30},
+        {"name": "Bob", "age": 25}
+    ]
+    csv_filename = tmp_path / "test.csv"
+    pl.DataFrame(data).write_csv(csv_filename)
+    results = batch_convert([{"input_path": csv_filename, "output_extension": ".parquet", "output_dir": tmp_path / "test"}], streaming=True)
+    assert results[0]["success"] is True
+    assert (results[0]["peak_memory_bytes"] is not None) == MEASURES_MEMORY
+    assert pl.read_parquet(results[0]["output_path"]).equals(pl.DataFrame(data))
+
 def test_batch_file_converter_file_does_not_exist(tmp_path):
     data1 = [
         {"name": "Alice", "age": 30},
@@ -177,12 +269,36 @@ def test_batch_file_converter_file_does_not_exist(tmp_path):
     ]
     results = batch_convert(batch_files)
     assert len(results) == 3
+    assert results[1]["error_message"] is not None
     assert results[0]["success"] is True
     assert pl.read_parquet(results[0]["output_path"]).equals(pl.DataFrame(data1))
     assert results[1]["success"] is False
     assert results[2]["success"] is True
     assert pl.read_parquet(results[2]["output_path"]).equals(pl.DataFrame(data2))
 
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_batch_file_converter_parallel(tmp_path, executor):
+    batch_files = []
+    expected = []
+    for i, rows in enumerate([2, 50, 10, 1000]):
+        data = pl.DataFrame({"name": [f"name_{j}" for j in range(rows)], "age": list(range(rows))})
+        csv_filename = tmp_path / f"test{i}.csv"
+        data.write_csv(csv_filename)
+        batch_files.append({"input_path": csv_filename, "output_extension": ".parquet", "output_dir": tmp_path / "test"})
+        expected.append(data)
+    batch_files.insert(1, {"input_path": tmp_path / "nonexistent.csv", "output_extension": ".parquet", "output_dir": tmp_path / "test"})
+    results = batch_convert(batch_files, max_workers=3, executor=executor)
+    assert [result["input_path"] for result in results] == [file["input_path"] for file in batch_files]
+    assert results[1]["success"] is False
+    successes = [result for result in results if result["success"]]
+    assert len(successes) == 4
+    for result, data in zip(successes, expected):
+        assert pl.read_parquet(result["output_path"]).equals(data)
+
+def test_batch_file_converter_invalid_executor(tmp_path):
+    with pytest.raises(ValueError):
+        batch_convert([], max_workers=2, executor="invalid")
+
 def test_table_write():
     data = pl.DataFrame([
         {"name": "Alice", "age": 30},
@@ -190,8 +306,8 @@ def test_table_write():
     ])
     writer = TableWrite(table="test_table", write_mode="overwrite")
     output_path = writer.write(data)
-    assert pl.read_parquet(output_path).equals(data)
-    output_path.unlink()
+    assert read_table("test_table").equals(data)
+    shutil.rmtree(output_path)
 
 def test_table_write_none_data(tmp_path):
     writer = TableWrite(table="test_table", write_mode="overwrite")
@@ -216,8 +332,8 @@ def test_table_write_append(tmp_path):
     output_path1 = writer.write(data1)
     output_path2 = writer.write(data2)
     combined_data = pl.concat([data1, data2], how="diagonal")
-    assert pl.read_parquet(output_path2).equals(combined_data)
-    output_path1.unlink()
+    assert read_table("test_table").equals(combined_data)
+    shutil.rmtree(output_path1)
 
 def test_table_write_invalid_write_mode(tmp_path):
     data = pl.DataFrame([
@@ -225,4 +341,400 @@ def test_table_write_invalid_write_mode(tmp_path):
         {"name": "Bob", "age": 25}
     ])
     with pytest.raises(ValueError):
-        writer = TableWrite(table="test_table", write_mode="invalid_mode")
\ No newline at end of file
+        writer = TableWrite(table="test_table", write_mode="invalid_mode")
+
+def test_table_write_append_adds_parts():
+    data1 = pl.DataFrame([
+        {"name": "Alice", "age": 30},
+        {"name": "Bob", "age": 25}
+    ])
+    data2 = pl.DataFrame([
+        {"name": "Charlie", "age": 35}
+    ])
+    writer = TableWrite(table="test_table_parts", write_mode="append")
+    output_path = writer.write(data1)
+    first_part = output_path / read_manifest("test_table_parts")["parts"][0]["path"]
+    first_part_mtime = first_part.stat().st_mtime_ns
+    writer.write(data2)
+    manifest = read_manifest("test_table_parts")
+    assert [part["rows"] for part in manifest["parts"]] == [2, 1]
+    assert manifest["parts"][0]["schema"] == {"name": "String", "age": "Int64"}
+    assert first_part.stat().st_mtime_ns == first_part_mtime
+    assert read_table("test_table_parts").equals(pl.concat([data1, data2]))
+    TableWrite(table="test_table_parts", write_mode="overwrite").write(data2)
+    manifest = read_manifest("test_table_parts")
+    assert len(manifest["parts"]) == 1
+    assert first_part.name in [part["path"] for part in manifest["obsolete"]]
+    assert read_table("test_table_parts").equals(data2)
+    shutil.rmtree(output_path)
+
+def test_table_write_append_new_columns():
+    data1 = pl.DataFrame([{"name": "Alice", "age": 30}])
+    data2 = pl.DataFrame([{"name": "Bob", "city": "Leeds"}])
+    writer = TableWrite(table="test_table_evolve", write_mode="append")
+    output_path = writer.write(data1)
+    writer.write(data2)
+    assert read_table("test_table_evolve").equals(pl.concat([data1, data2], how="diagonal"))
+    shutil.rmtree(output_path)
+
+def test_table_write_append_legacy_table():
+    data1 = pl.DataFrame([{"name": "Alice", "age": 30}])
+    data2 = pl.DataFrame([{"name": "Bob", "age": 25}])
+    Path("tables").mkdir(exist_ok=True)
+    legacy_path = Path("tables") / "test_table_legacy.parquet"
+    data1.write_parquet(legacy_path)
+    assert read_table("test_table_legacy").equals(data1)
+    output_path = TableWrite(table="test_table_legacy", write_mode="append").write(data2)
+    assert not legacy_path.exists()
+    assert read_table("test_table_legacy").equals(pl.concat([data1, data2]))
+    shutil.rmtree(output_path)
+
+def test_compact_table():
+    writer = TableWrite(table="test_table_compact", write_mode="append")
+    batches = [pl.DataFrame({"id": [i, i + 10], "name": [f"a{i}", f"b{i}"]}) for i in range(5, 0, -1)]
+    for batch in batches:
+        output_path = writer.write(batch)
+    old_parts = [output_path / part["path"] for part in read_manifest("test_table_compact")["parts"]]
+    result = compact_table("test_table_compact", sort_by=["id"])
+    assert result == {"table": "test_table_compact", "parts_before": 5, "parts_after": 1, "compacted_parts": 5}
+    manifest = read_manifest("test_table_compact")
+    assert manifest["parts"][0]["rows"] == 10
+    assert read_table("test_table_compact").equals(pl.concat(batches).sort("id"))
+    assert all(part.exists() for part in old_parts)
+    assert len(manifest["obsolete"]) == 5
+    shutil.rmtree(output_path)
+
+def test_compact_table_skips_large_parts():
+    writer = TableWrite(table="test_table_compact_large", write_mode="append")
+    batches = [pl.DataFrame({"id": [i]}) for i in range(3)]
+    for batch in batches:
+        output_path = writer.write(batch)
+    result = compact_table("test_table_compact_large", target_file_size=1)
+    assert result["compacted_parts"] == 0
+    assert len(read_manifest("test_table_compact_large")["parts"]) == 3
+    shutil.rmtree(output_path)
+
+def test_compact_missing_table():
+    with pytest.raises(FileNotFoundError):
+        compact_table("missing_table")
+
+def test_get_table_version_changes_on_write():
+    writer = TableWrite(table="test_table_version", write_mode="append")
+    output_path = writer.write(pl.DataFrame({"id": [1]}))
+    version = get_table_version("test_table_version")
+    assert get_table_version("test_table_version") == version
+    writer.write(pl.DataFrame({"id": [2]}))
+    assert get_table_version("test_table_version") != version
+    shutil.rmtree(output_path)
+    with pytest.raises(FileNotFoundError):
+        get_table_version("test_table_version")
+
+def test_table_catalog_only_registers_referenced_tables():
+    first = TableWrite(table="test_catalog_a", write_mode="overwrite").write(pl.DataFrame({"id": [1, 2]}))
+    second = TableWrite(table="test_catalog_b", write_mode="overwrite").write(pl.DataFrame({"id": [2, 3]}))
+    catalog = TableCatalog()
+    assert catalog.get_referenced_tables("SELECT * FROM test_catalog_a JOIN missing ON true") == ["test_catalog_a"]
+    query, versions = catalog.query("SELECT id FROM test_catalog_a UNION SELECT id FROM test_catalog_b")
+    assert set(versions) == {"test_catalog_a", "test_catalog_b"}
+    assert sorted(query.collect()["id"].to_list()) == [1, 2, 3]
+    version, scan = catalog.get_scan("test_catalog_a")
+    assert catalog.get_scan("test_catalog_a")[1] is scan
+    TableWrite(table="test_catalog_a", write_mode="append").write(pl.DataFrame({"id": [4]}))
+    assert catalog.get_scan("test_catalog_a")[0] != version
+    shutil.rmtree(first)
+    shutil.rmtree(second)
+
+def test_csv_read_caches_inferred_schema(tmp_path):
+    cache = SchemaCache(tmp_path / "schemas")
+    first = tmp_path / "first.csv"
+    first.write_text("id,code\n1,10\n2,20\n")
+    assert CsvRead(schema_key="feed", schema_cache=cache).read(first).schema == {"id": pl.Int64, "code": pl.Int64}
+    # A later file whose first rows would infer differently still gets the cached types.
+    second = tmp_path / "second.csv"
+    second.write_text("id,code\n3,\n4,40\n")
+    df = CsvRead(schema_key="feed", schema_cache=cache, infer_schema_length=1).read(second)
+    assert df.schema == {"id": pl.Int64, "code": pl.Int64}
+    assert SchemaCache(tmp_path / "schemas").get("feed") == {"id": pl.Int64, "code": pl.Int64}
+
+def test_csv_read_schema_overrides_and_mismatch(tmp_path):
+    cache = SchemaCache(tmp_path / "schemas")
+    first = tmp_path / "first.csv"
+    first.write_text("id,code\n1,007\n")
+    df = CsvRead(schema_key="codes", schema_cache=cache, schema_overrides={"code": pl.String}).read(first)
+    assert df["code"].to_list() == ["007"]
+    assert cache.get("codes") == {"id": pl.Int64, "code": pl.String}
+    second = tmp_path / "second.csv"
+    second.write_text("id,code\nabc,008\n")
+    with pytest.raises(ValueError, match="cached schema"):
+        CsvRead(schema_key="codes", schema_cache=cache).read(second)
+    cache.clear("codes")
+    assert CsvRead(schema_key="codes", schema_cache=cache).read(second).schema == {"id": pl.String, "code": pl.Int64}
+
+def test_csv_scan_explicit_schema(tmp_path):
+    csv_path = tmp_path / "test.csv"
+    csv_path.write_text("id,value\n1,2\n")
+    lf = CsvRead(schema={"id": pl.String, "value": pl.Float64}).scan(csv_path)
+    assert lf.collect().schema == {"id": pl.String, "value": pl.Float64}
+
+@pytest.mark.parametrize("profile", list(PARQUET_PROFILES))
+def test_parquet_write_profiles(tmp_path, profile):
+    data = pl.DataFrame({"id": range(1000), "name": ["a", "b"] * 500})
+    writer = ParquetWrite(input_filename="output", output_dir=tmp_path, profile=profile)
+    assert pl.read_parquet(writer.write(data)).equals(data)
+    assert pl.read_parquet(writer.write(data.lazy())).equals(data)
+
+def test_parquet_write_custom_options(tmp_path):
+    import pyarrow.parquet as pq
+    writer = ParquetWrite(input_filename="output", output_dir=tmp_path, profile={"compression": "gzip", "row_group_size": 100})
+    metadata = pq.ParquetFile(writer.write(pl.DataFrame({"id": range(1000)}))).metadata
+    assert metadata.num_row_groups == 10
+    assert metadata.row_group(0).column(0).compression == "GZIP"
+
+def test_parquet_write_unknown_profile(tmp_path):
+    with pytest.raises(ValueError):
+        ParquetWrite(input_filename="output", output_dir=tmp_path, profile="tiny")
+    with pytest.raises(ValueError):
+        TableWrite(table="test_table_profile", write_mode="append", parquet_profile={"dictionary": True})
+
+def test_table_write_partitioned():
+    data = pl.DataFrame({"tenant": ["a", "b", "a", None], "id": [1, 2, 3, 4]})
+    output_path = TableWrite(table="test_table_partitioned", write_mode="overwrite", partition_by=["tenant"]).write(data)
+    assert (output_path / "tenant=a").is_dir()
+    assert (output_path / "tenant=__HIVE_DEFAULT_PARTITION__").is_dir()
+    assert read_manifest("test_table_partitioned")["partition_schema"] == {"tenant": "String"}
+    assert pl.read_parquet(next((output_path / "tenant=b").glob("*.parquet"))).columns == ["id"]
+    query = scan_table("test_table_partitioned").filter(pl.col("tenant") == "a")
+    assert "tenant=b" not in query.explain()
+    assert query.collect()["id"].to_list() == [1, 3]
+    # Appends pick up the table's partitioning.
+    TableWrite(table="test_table_partitioned", write_mode="append").write(pl.DataFrame({"tenant": ["b"], "id": [5]}))
+    assert sorted(read_table("test_table_partitioned").filter(pl.col("tenant") == "b")["id"].to_list()) == [2, 5]
+    with pytest.raises(ValueError):
+        TableWrite(table="test_table_partitioned", write_mode="append", partition_by=["id"]).write(data)
+    shutil.rmtree(output_path)
+
+def test_table_write_overwrite_partitions():
+    data = pl.DataFrame({"day": [date(2026, 1, 1), date(2026, 1, 2)], "value": [1, 2]})
+    output_path = TableWrite(table="test_table_overwrite_partitions", write_mode="overwrite", partition_by=["day"]).write(data)
+    TableWrite(table="test_table_overwrite_partitions", write_mode="overwrite_partitions").write(pl.DataFrame({"day": [date(2026, 1, 2)], "value": [20]}))
+    result = read_table("test_table_overwrite_partitions").sort("day")
+    assert result.schema == {"value": pl.Int64, "day": pl.Date}
+    assert result["value"].to_list() == [1, 20]
+    with pytest.raises(ValueError):
+        TableWrite(table="test_table_unpartitioned", write_mode="overwrite_partitions").write(pl.DataFrame({"value": [1]}))
+    shutil.rmtree(output_path)
+
+def test_compact_partitioned_table():
+    writer = TableWrite(table="test_table_compact_partitioned", write_mode="append", partition_by=["tenant"])
+    for i in range(3):
+        output_path = writer.write(pl.DataFrame({"tenant": ["a", "b"], "id": [i, i + 10]}))
+    result = compact_table("test_table_compact_partitioned")
+    assert result == {"table": "test_table_compact_partitioned", "parts_before": 6, "parts_after": 2, "compacted_parts": 6}
+    manifest = read_manifest("test_table_compact_partitioned")
+    assert sorted(part["partition"]["tenant"] for part in manifest["parts"]) == ["a", "b"]
+    table = read_table("test_table_compact_partitioned")
+    assert table.filter(pl.col("tenant") == "a")["id"].to_list() == [0, 1, 2]
+    assert pl.read_parquet_schema(output_path / manifest["parts"][0]["path"]) == {"id": pl.Int64}
+    shutil.rmtree(output_path)
+
+def test_table_write_merge():
+    writer = TableWrite(table="test_table_merge", write_mode="append")
+    output_path = writer.write(pl.DataFrame({"id": [1, 2, 3], "value": ["a", "b", "c"]}))
+    writer.write(pl.DataFrame({"id": [10, 11], "value": ["j", "k"]}))
+    untouched = read_manifest("test_table_merge")["parts"][1]["path"]
+    merger = TableWrite(table="test_table_merge", write_mode="merge", merge_keys=["id"])
+    merger.write(pl.DataFrame({"id": [2, 4, 4], "value": ["B", "d", "D"]}))
+    assert read_table("test_table_merge").sort("id").rows() == [(1, "a"), (2, "B"), (3, "c"), (4, "D"), (10, "j"), (11, "k")]
+    manifest = read_manifest("test_table_merge")
+    # The second part's keys are outside the batch's range, so it's kept as it is.
+    assert untouched in [part["path"] for part in manifest["parts"]]
+    assert all(part["key_ranges"]["id"] for part in manifest["parts"])
+    assert [part["key_ranges"]["id"] for part in manifest["parts"] if part["path"] == untouched] == [[10, 11]]
+    with pytest.raises(ValueError):
+        TableWrite(table="test_table_merge", write_mode="merge")
+    shutil.rmtree(output_path)
+
+@pytest.mark.parametrize("table", ["", ".", "..", "a/b", ".hidden"])
+def test_table_functions_reject_invalid_names(table):
+    with pytest.raises(ValueError):
+        TableWrite(table=table, write_mode="append")
+    with pytest.raises(ValueError):
+        compact_table(table)
+    with pytest.raises(ValueError):
+        vacuum_table(table)
+    with pytest.raises(ValueError):
+        rollback_table(table, 0)
+
+def test_table_write_merge_metrics():
+    output_path = TableWrite(table="test_table_merge_metrics", write_mode="overwrite").write(pl.DataFrame({"id": [1, 2, 3], "value": ["a", "b", "c"]}))
+    written_before = BYTES.get(operation="table_write", direction="out")
+    measured_before = PEAK_MEMORY_BYTES.get_count(operation="table_write")
+    TableWrite(table="test_table_merge_metrics", write_mode="merge", merge_keys=["id"]).write(pl.DataFrame({"id": [2], "value": ["B"]}))
+    parts = read_manifest("test_table_merge_metrics")["parts"]
+    # The merged batch and the rewrite of the part it touched are both new.
+    assert BYTES.get(operation="table_write", direction="out") - written_before == sum(part["bytes"] for part in parts)
+    assert PEAK_MEMORY_BYTES.get_count(operation="table_write") == measured_before + 1
+    shutil.rmtree(output_path)
+
+def test_table_write_merge_partitioned():
+    data = pl.DataFrame({"tenant": ["a", "a", "b"], "id": [1, 2, 1], "value": [1.0, 2.0, 3.0]})
+    output_path = TableWrite(table="test_table_merge_partitioned", write_mode="overwrite", partition_by=["tenant"]).write(data)
+    b_part = [part["path"] for part in read_manifest("test_table_merge_partitioned")["parts"] if part["partition"] == {"tenant": "b"}]
+    TableWrite(table="test_table_merge_partitioned", write_mode="merge", merge_keys=["tenant", "id"]).write(
+        pl.DataFrame({"tenant": ["a"], "id": [2], "value": [20.0]}))
+    result = read_table("test_table_merge_partitioned").sort("tenant", "id").select("tenant", "id", "value")
+    assert result.rows() == [("a", 1, 1.0), ("a", 2, 20.0), ("b", 1, 3.0)]
+    assert set(b_part) <= {part["path"] for part in read_manifest("test_table_merge_partitioned")["parts"]}
+    shutil.rmtree(output_path)
+
+@pytest.mark.parametrize("extension", [".ndjson", ".jsonl", ".arrow", ".feather", ".avro"])
+@pytest.mark.parametrize("streaming", [False, True])
+def test_convert_other_formats(tmp_path, extension, streaming):
+    data = pl.DataFrame({"id": [1, 2], "name": ["Alice", None], "scores": [[1, 2], [3]]})
+    parquet_path = tmp_path / "input.parquet"
+    data.write_parquet(parquet_path)
+    output_path = FileConverter(input_path=parquet_path, output_extension=extension, output_dir=tmp_path).convert(streaming=streaming)
+    assert output_path.suffix == extension
+    reader_class = FileConverter.FORMATS[extension][0]
+    assert reader_class().read(output_path).equals(data)
+    assert reader_class().scan(output_path).collect().equals(data)
+    back_path = FileConverter(input_path=output_path, output_extension=".parquet", output_dir=tmp_path / "back").convert(streaming=streaming)
+    assert pl.read_parquet(back_path).equals(data)
+
+def test_get_file_extension():
+    assert get_file_extension(Path("drop.csv.gz")) == ".csv.gz"
+    assert get_file_extension(Path("drop.2026.csv.zst")) == ".csv.zst"
+    assert get_file_extension(Path("drop.2026.parquet")) == ".parquet"
+    assert get_file_extension(Path("archive.gz")) == ".gz"
+
+@pytest.mark.parametrize("extension", [".csv.gz", ".csv.zst"])
+@pytest.mark.parametrize("streaming", [False, True])
+def test_convert_compressed_csv(tmp_path, extension, streaming):
+    data = pl.DataFrame({"id": [1, 2, 3], "name": ["Alice", "Bob", "Carol"]})
+    parquet_path = tmp_path / "drop.parquet"
+    data.write_parquet(parquet_path)
+    compressed_path = FileConverter(input_path=parquet_path, output_extension=extension, output_dir=tmp_path).convert(streaming=streaming)
+    assert compressed_path.name.startswith("drop_") and compressed_path.name.endswith(extension)
+    assert compressed_path.read_bytes()[:4] != b"id,n"
+    converter = FileConverter(input_path=compressed_path, output_extension=".parquet", output_dir=tmp_path / "back")
+    assert converter.input_filename == compressed_path.name[:-len(extension)]
+    assert pl.read_parquet(converter.convert(streaming=streaming)).equals(data)
+
+def test_get_table_stats():
+    writer = TableWrite(table="test_table_stats", write_mode="overwrite", partition_by=["group"])
+    output_path = writer.write(pl.DataFrame({"group": [1, 2, None], "value": [3, None, 5], "day": [date(2026, 1, 2)] * 3}))
+    TableWrite(table="test_table_stats", write_mode="append", parquet_profile="fast-write").write(pl.DataFrame({"group": [1], "value": [9], "extra": [1.5]}))
+    stats = get_table_stats("test_table_stats")
+    assert (stats["rows"], stats["files"], stats["row_groups"], stats["partitions"]) == (4, 4, 4, ["group"])
+    assert stats["schema"] == {"value": "Int64", "day": "Date", "extra": "Float64", "group": "Int64"}
+    assert stats["columns"]["day"] == {"min": "2026-01-02", "max": "2026-01-02", "null_count": 1}
+    assert stats["columns"]["group"] == {"min": 1, "max": 2, "null_count": 1}
+    # The appended part was written without statistics, so the table's range of values can't be known.
+    assert stats["columns"]["value"]["min"] is None
+    catalog = TableCatalog()
+    assert catalog.get_stats("test_table_stats") is catalog.get_stats("test_table_stats")
+    shutil.rmtree(output_path)
+
+def test_concurrent_appends_are_all_committed():
+    batches = [pl.DataFrame({"id": [i], "writer": [f"w{i}"]}) for i in range(16)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(TableWrite(table="test_table_concurrent", write_mode="append").write, batches))
+    assert read_table("test_table_concurrent").sort("id")["id"].to_list() == list(range(16))
+    manifest = read_manifest("test_table_concurrent")
+    assert manifest["version"] == 16
+    manifest_dir = Path("tables") / "test_table_concurrent" / "_manifest"
+    assert len(list(manifest_dir.glob("*.json"))) == 16
+    shutil.rmtree(Path("tables") / "test_table_concurrent")
+
+def test_manifest_commit_conflict():
+    output_path = TableWrite(table="test_table_conflict", write_mode="append").write(pl.DataFrame({"id": [1]}))
+    stale = read_manifest("test_table_conflict")
+    TableWrite(table="test_table_conflict", write_mode="append").write(pl.DataFrame({"id": [2]}))
+    with pytest.raises(CommitConflictError):
+        _commit_manifest("test_table_conflict", stale, stale["parts"], [])
+    assert read_table("test_table_conflict")["id"].to_list() == [1, 2]
+    shutil.rmtree(output_path)
+
+def test_table_with_old_manifest_moves_to_manifest_log():
+    output_path = TableWrite(table="test_table_old_manifest", write_mode="append").write(pl.DataFrame({"id": [1]}))
+    manifest = read_manifest("test_table_old_manifest")
+    shutil.rmtree(output_path / "_manifest")
+    (output_path / "_manifest.json").write_text(json.dumps(manifest))
+    assert read_table("test_table_old_manifest")["id"].to_list() == [1]
+    TableWrite(table="test_table_old_manifest", write_mode="append").write(pl.DataFrame({"id": [2]}))
+    assert not (output_path / "_manifest.json").exists()
+    assert read_manifest("test_table_old_manifest")["version"] == manifest["version"] + 1
+    assert read_table("test_table_old_manifest")["id"].to_list() == [1, 2]
+    shutil.rmtree(output_path)
+
+def test_time_travel_and_rollback():
+    writer = TableWrite(table="test_table_time_travel", write_mode="append")
+    output_path = writer.write(pl.DataFrame({"id": [1]}))
+    first_version = read_manifest("test_table_time_travel")["version"]
+    committed_at = read_manifest("test_table_time_travel")["committed_at"]
+    writer.write(pl.DataFrame({"id": [2]}))
+    TableWrite(table="test_table_time_travel", write_mode="overwrite").write(pl.DataFrame({"id": [3]}))
+    assert scan_table("test_table_time_travel", first_version).collect()["id"].to_list() == [1]
+    assert get_table_version_at("test_table_time_travel", committed_at) == first_version
+    with pytest.raises(FileNotFoundError):
+        get_table_version_at("test_table_time_travel", committed_at - 1)
+    assert [version["rows"] for version in get_table_history("test_table_time_travel")] == [1, 2, 1]
+
+    manifest = rollback_table("test_table_time_travel", first_version + 1)
+    assert manifest["version"] == first_version + 3
+    assert read_table("test_table_time_travel")["id"].to_list() == [1, 2]
+    # The restored parts are live again, so no later commit deletes them.
+    assert not {part["path"] for part in manifest["parts"]} & {part["path"] for part in manifest["obsolete"]}
+    shutil.rmtree(output_path)
+
+def test_vacuum_table(monkeypatch):
+    writer = TableWrite(table="test_table_vacuum", write_mode="overwrite")
+    output_path = writer.write(pl.DataFrame({"id": [1]}))
+    writer.write(pl.DataFrame({"id": [2]}))
+    orphan = output_path / "part-orphan.parquet"
+    pl.DataFrame({"id": [3]}).write_parquet(orphan)
+    # Recently replaced and written files are kept for running queries and writes.
+    assert vacuum_table("test_table_vacuum", retention_seconds=0)["files_removed"] == 0
+    monkeypatch.setattr(main, "OBSOLETE_PART_GRACE_SECONDS", 0)
+    result = vacuum_table("test_table_vacuum", retention_seconds=0)
+    assert (result["versions_removed"], result["files_removed"]) == (0, 2)
+    assert not orphan.exists()
+    assert [version["version"] for version in get_table_history("test_table_vacuum")] == [2]
+    assert read_table("test_table_vacuum")["id"].to_list() == [2]
+    with pytest.raises(FileNotFoundError):
+        rollback_table("test_table_vacuum", 1)
+    shutil.rmtree(output_path)
+
+def test_concurrent_appends_to_legacy_table():
+    legacy_path = Path("tables") / "test_table_legacy_concurrent.parquet"
+    pl.DataFrame({"id": list(range(5))}).write_parquet(legacy_path)
+    batches = [pl.DataFrame({"id": [100 + i]}) for i in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(TableWrite(table="test_table_legacy_concurrent", write_mode="append").write, batches))
+    assert not legacy_path.exists()
+    assert read_table("test_table_legacy_concurrent").sort("id")["id"].to_list() == list(range(5)) + [100 + i for i in range(8)]
+    output_path = Path("tables") / "test_table_legacy_concurrent"
+    assert len(list(output_path.glob("*.parquet"))) == 9
+    shutil.rmtree(output_path)
+
+def test_table_write_failure_is_raised_and_cleaned_up(monkeypatch):
+    def give_up(table, change):
+        raise RuntimeError("Gave up committing.")
+    monkeypatch.setattr(main, "_update_manifest", give_up)
+    with pytest.raises(RuntimeError):
+        TableWrite(table="test_table_write_failure", write_mode="append").write(pl.DataFrame({"id": [1]}))
+    output_path = Path("tables") / "test_table_write_failure"
+    assert not list(output_path.glob("*.parquet"))
+    shutil.rmtree(output_path)
+
+def test_table_write_merge_errors_are_raised_and_cleaned_up():
+    output_path = TableWrite(table="test_table_merge_errors", write_mode="append").write(pl.DataFrame({"id": [1, 2], "value": ["a", "b"]}))
+    with pytest.raises(ValueError):
+        TableWrite(table="test_table_merge_errors", write_mode="merge", merge_keys=["nope"]).write(pl.DataFrame({"id": [1], "value": ["A"]}))
+    # Keys that can't be compared with the table's keys fail while matching, after the batch was written.
+    with pytest.raises(Exception):
+        TableWrite(table="test_table_merge_errors", write_mode="merge", merge_keys=["id"]).write(pl.DataFrame({"id": ["x"], "value": ["A"]}))
+    manifest = read_manifest("test_table_merge_errors")
+    assert {path.name for path in output_path.glob("*.parquet")} == {part["path"] for part in manifest["parts"]}
+    assert read_table("test_table_merge_errors").rows() == [(1, "a"), (2, "b")]
+    shutil.rmtree(output_path)
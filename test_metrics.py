@@ -0,0 +1,54 @@
+from metrics import Metric, MetricsRegistry, time_stage
+import pytest
+
+def test_counter_and_gauge_render():
+    registry = MetricsRegistry()
+    rows = registry.counter("rows_total", "Rows.", ["operation"])
+    rows.inc(3, operation="convert")
+    rows.inc(2, operation="convert")
+    size = registry.gauge("cache_bytes", "Bytes.")
+    size.set(1.5)
+    assert rows.get(operation="convert") == 5
+    assert registry.render().splitlines() == [
+        "# HELP rows_total Rows.",
+        "# TYPE rows_total counter",
+        'rows_total{operation="convert"} 5',
+        "# HELP cache_bytes Bytes.",
+        "# TYPE cache_bytes gauge",
+        "cache_bytes 1.5",
+    ]
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency.", ["operation"], buckets=[0.1, 1.0])
+    for value in [0.05, 0.5, 0.5, 5.0]:
+        latency.observe(value, operation="query")
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'latency_seconds_bucket{operation="query",le="0.1"} 1',
+        'latency_seconds_bucket{operation="query",le="1"} 3',
+        'latency_seconds_bucket{operation="query",le="+Inf"} 4',
+        'latency_seconds_sum{operation="query"} 6.05',
+        'latency_seconds_count{operation="query"} 4',
+    ]
+
+def test_metric_labels_are_checked():
+    registry = MetricsRegistry()
+    rows = registry.counter("rows_total", "Rows.", ["operation"])
+    with pytest.raises(ValueError):
+        rows.inc(operation="convert", direction="in")
+    with pytest.raises(ValueError):
+        registry.gauge("rows_total", "Rows.", ["operation"])
+    assert registry.counter("rows_total", "Rows.", ["operation"]) is rows
+
+def test_time_stage_adds_to_timings():
+    timings = {}
+    with time_stage("convert", "read", timings):
+        pass
+    with time_stage("convert", "read", timings):
+        pass
+    assert list(timings) == ["read"] and timings["read"] >= 0
+
+def test_metric_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        Metric("base", "Base.")
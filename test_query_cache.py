@@ -0,0 +1,51 @@
+import polars as pl
+
+from query_cache import QueryCache, normalize_sql
+
+def test_normalize_sql():
+    assert normalize_sql("  SELECT *\n  FROM   self ;") == "SELECT * FROM self"
+    assert normalize_sql("SELECT * FROM self WHERE name = 'a  b'") == "SELECT * FROM self WHERE name = 'a  b'"
+
+def test_query_cache_hit_and_miss():
+    cache = QueryCache(max_bytes=1024 * 1024)
+    result = pl.DataFrame({"a": [1, 2]})
+    assert cache.get("SELECT a FROM self", {"t": "1"}) is None
+    cache.put("SELECT a FROM self", {"t": "1"}, result)
+    assert cache.get("SELECT  a\nFROM self", {"t": "1"}).equals(result)
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+def test_query_cache_new_table_version_invalidates():
+    cache = QueryCache(max_bytes=1024 * 1024)
+    cache.put("SELECT a FROM self", {"t": "1"}, pl.DataFrame({"a": [1]}))
+    cache.put("SELECT b FROM self", {"t": "1"}, pl.DataFrame({"b": [1]}))
+    assert cache.get("SELECT a FROM self", {"t": "2"}) is None
+    stats = cache.stats()
+    assert stats["entries"] == 0
+    assert stats["invalidations"] == 2
+
+def test_query_cache_invalidate_table():
+    cache = QueryCache(max_bytes=1024 * 1024)
+    cache.put("SELECT a FROM self", {"t": "1"}, pl.DataFrame({"a": [1]}))
+    cache.put("SELECT a FROM self", {"u": "1"}, pl.DataFrame({"a": [1]}))
+    assert cache.invalidate("t") == 1
+    assert cache.get("SELECT a FROM self", {"u": "1"}) is not None
+
+def test_query_cache_evicts_least_recently_used():
+    result = pl.DataFrame({"a": list(range(100))})
+    cache = QueryCache(max_bytes=result.estimated_size() * 2)
+    cache.put("q1", {"t": "1"}, result)
+    cache.put("q2", {"t": "1"}, result)
+    cache.get("q1", {"t": "1"})
+    cache.put("q3", {"t": "1"}, result)
+    assert cache.get("q2", {"t": "1"}) is None
+    assert cache.get("q1", {"t": "1"}) is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+def test_query_cache_skips_results_bigger_than_cache():
+    cache = QueryCache(max_bytes=1)
+    cache.put("q", {"t": "1"}, pl.DataFrame({"a": [1, 2, 3]}))
+    assert cache.stats()["entries"] == 0